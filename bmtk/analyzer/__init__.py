@@ -27,6 +27,7 @@
 #
 
 import os
+import glob
 import h5py
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -43,12 +44,54 @@ def _get_config(config):
     else:
         raise Exception('Could not convert {} (type "{}") to json.'.format(config, type(config)))
 
+
+def load_cell_var(cell_vars_dir, gid, var_name):
+    """Loads the trace of a variable recorded from a cell by the bionet CellVarsMod.
+
+    Each rank saves its cells into <cell_vars_dir>/cell_vars_<rank>.h5, with a (steps x segments) dataset for each
+    variable and a mapping group giving the gid of every column. The first segment recorded from the cell is returned,
+    which by default is the middle of the soma.
+
+    :return: the trace, and the tstart and tstop of the recording.
+    """
+    for file_name in sorted(glob.glob(os.path.join(cell_vars_dir, 'cell_vars_*.h5'))):
+        with h5py.File(file_name, 'r') as data_h5:
+            columns = np.nonzero(data_h5['mapping/gids'][()] == gid)[0]
+            if len(columns) > 0:
+                return data_h5[var_name][:, columns[0]], data_h5.attrs['tstart'], data_h5.attrs['tstop']
+
+    raise Exception('Could not find {} of cell gid {} in {}.'.format(var_name, gid, cell_vars_dir))
+
+
+def _read_traces(cell_vars_h5, var_name, gid=None):
+    """Reads the traces of a variable from a cell_vars file, the columns of the given gid or all of them."""
+    with h5py.File(cell_vars_h5, 'r') as data_h5:
+        traces = data_h5[var_name][()]
+        if gid is not None and 'mapping' in data_h5:
+            traces = traces[:, data_h5['mapping/gids'][()] == gid]
+        return traces, data_h5.attrs['tstart'], data_h5.attrs['tstop']
+
+
+def _plot_trace(trace, tstart, tstop, title, ylabel, show_plot, save_as):
+    x_axis = np.linspace(tstart, tstop, len(trace), endpoint=True)
+    plt.plot(x_axis, trace)
+    plt.xlabel('time (ms)')
+    plt.ylabel(ylabel)
+    plt.title(title)
+
+    if save_as is not None:
+        plt.savefig(save_as)
+
+    if show_plot:
+        plt.show()
+
+
 def plot_potential(cell_vars_h5=None, config_file=None, gids=None, show_plot=True, save=False):
     if (cell_vars_h5 or config_file) is None:
         raise Exception('Please specify a cell_vars hdf5 file or a simulation config.')
 
     if cell_vars_h5 is not None:
-        plot_potential_hdf5(cell_vars_h5, show_plot, save_as='sim_potential.jpg' if save else None)
+        plot_potential_hdf5(cell_vars_h5, show_plot=show_plot, save_as='sim_potential.jpg' if save else None)
 
     else:
         # load the json file or object
@@ -63,28 +106,14 @@ def plot_potential(cell_vars_h5=None, config_file=None, gids=None, show_plot=Tru
         for gid in gid_list:
             save_as = '{}_v.jpg'.format(gid) if save else None
             title = 'cell gid {}'.format(gid)
-            var_h5 = os.path.join(config['output']['cell_vars_dir'], '{}.h5'.format(gid))
-            plot_potential_hdf5(var_h5, title, show_plot, save_as)
-
+            trace, tstart, tstop = load_cell_var(config['output']['cell_vars_dir'], gid, 'v')
+            _plot_trace(trace, tstart, tstop, title, 'membrane (mV)', show_plot, save_as)
 
-def plot_potential_hdf5(cell_vars_h5, title='membrane potential', show_plot=True, save_as=None):
-    data_h5 = h5py.File(cell_vars_h5, 'r')
-    membrane_trace = data_h5['v']
 
-    tstart = data_h5.attrs['tstart']
-    tstop = data_h5.attrs['tstop']
-    x_axis = np.linspace(tstart, tstop, len(membrane_trace), endpoint=True)
-
-    plt.plot(x_axis, membrane_trace)
-    plt.xlabel('time (ms)')
-    plt.ylabel('membrane (mV)')
-    plt.title(title)
-
-    if save_as is not None:
-        plt.savefig(save_as)
-
-    if show_plot:
-        plt.show()
+def plot_potential_hdf5(cell_vars_h5, title='membrane potential', show_plot=True, save_as=None, gid=None):
+    """Plots the membrane potential of every recorded segment in a cell_vars file, or only those of the given gid."""
+    traces, tstart, tstop = _read_traces(cell_vars_h5, 'v', gid)
+    _plot_trace(traces, tstart, tstop, title, 'membrane (mV)', show_plot, save_as)
 
 
 def plot_calcium(cell_vars_h5=None, config_file=None, gids=None, show_plot=True, save=False):
@@ -92,7 +121,7 @@ def plot_calcium(cell_vars_h5=None, config_file=None, gids=None, show_plot=True,
         raise Exception('Please specify a cell_vars hdf5 file or a simulation config.')
 
     if cell_vars_h5 is not None:
-        plot_calcium_hdf5(cell_vars_h5, show_plot, save_as='sim_ca.jpg' if save else None)
+        plot_calcium_hdf5(cell_vars_h5, show_plot=show_plot, save_as='sim_ca.jpg' if save else None)
 
     else:
         # load the json file or object
@@ -107,28 +136,14 @@ def plot_calcium(cell_vars_h5=None, config_file=None, gids=None, show_plot=True,
         for gid in gid_list:
             save_as = '{}_v.jpg'.format(gid) if save else None
             title = 'cell gid {}'.format(gid)
-            var_h5 = os.path.join(config['output']['cell_vars_dir'], '{}.h5'.format(gid))
-            plot_calcium_hdf5(var_h5, title, show_plot, save_as)
-
+            trace, tstart, tstop = load_cell_var(config['output']['cell_vars_dir'], gid, 'cai')
+            _plot_trace(trace, tstart, tstop, title, 'calcium [Ca2+]', show_plot, save_as)
 
-def plot_calcium_hdf5(cell_vars_h5, title='Ca2+ influx', show_plot=True, save_as=None):
-    data_h5 = h5py.File(cell_vars_h5, 'r')
-    cai_trace = data_h5['cai']
 
-    tstart = data_h5.attrs['tstart']
-    tstop = data_h5.attrs['tstop']
-    x_axis = np.linspace(tstart, tstop, len(cai_trace), endpoint=True)
-
-    plt.plot(x_axis, cai_trace)
-    plt.xlabel('time (ms)')
-    plt.ylabel('calcium [Ca2+]')
-    plt.title(title)
-
-    if save_as is not None:
-        plt.savefig(save_as)
-
-    if show_plot:
-        plt.show()
+def plot_calcium_hdf5(cell_vars_h5, title='Ca2+ influx', show_plot=True, save_as=None, gid=None):
+    """Plots the calcium concentration of every recorded segment in a cell_vars file, or only those of the given gid."""
+    traces, tstart, tstop = _read_traces(cell_vars_h5, 'cai', gid)
+    _plot_trace(traces, tstart, tstop, title, 'calcium [Ca2+]', show_plot, save_as)
 
 
 def spikes_table(config_file):
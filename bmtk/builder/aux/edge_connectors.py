@@ -1,6 +1,8 @@
 import numpy as np
 import random
 
+from bmtk.builder import connector
+
 
 def distance_connector(source, target, d_weight_min, d_weight_max, d_max, nsyn_min, nsyn_max):
     # Avoid self-connections.
@@ -31,4 +33,49 @@ def distance_connector(source, target, d_weight_min, d_weight_max, d_max, nsyn_m
 
 
 def connect_random(source, target, nsyn_min=0, nsyn_max=10, distribution=None):
-    return np.random.randint(nsyn_min, nsyn_max)
\ No newline at end of file
+    return np.random.randint(nsyn_min, nsyn_max)
+
+
+def neighbor_pairs(sources, targets, d_max, positions='positions'):
+    """Finds all source/target pairs that are within d_max of each other.
+
+    The KD-tree of the source positions is kept in the cache of the sources columns, so it is only built once for all
+    the tiles of a connection map that share the same block of sources.
+
+    :return: arrays of source indices, target indices and distances of every pair within d_max.
+    """
+    from scipy.spatial import cKDTree
+
+    index = sources.index
+    tree_key = ('kdtree', positions, index.start, index.stop, index.step)
+    if tree_key not in sources.cache:
+        sources.cache[tree_key] = cKDTree(np.array(list(sources[positions]), dtype=np.float64))
+    src_tree = sources.cache[tree_key]
+    trg_pos = np.array(list(targets[positions]), dtype=np.float64)
+    pairs = src_tree.sparse_distance_matrix(cKDTree(trg_pos), d_max, output_type='ndarray')
+    return pairs['i'], pairs['j'], pairs['v']
+
+
+@connector.vectorized(sparse=True)
+def distance_connector_kdtree(sources, targets, d_weight_min, d_weight_max, d_max, nsyn_min, nsyn_max):
+    """Vectorized version of distance_connector, only source/target pairs within d_max of each other are considered
+    using a KD-tree of the source positions. Takes the same parameters as distance_connector.
+
+    Requires scipy. Only the connected pairs are returned (as a sparse rule), so both the work and memory scale with
+    the number of neighboring pairs rather than with sources x targets.
+    """
+    src_indx, trg_indx, r = neighbor_pairs(sources, targets, d_max)
+
+    # Avoid self-connections.
+    not_self = sources['node_id'][src_indx] != targets['node_id'][trg_indx]
+    src_indx, trg_indx, r = src_indx[not_self], trg_indx[not_self], r[not_self]
+
+    # weights by euclidean distance between cells, treated as a probability of connection
+    t = r / d_max
+    dw = d_weight_max * (1.0 - t) + d_weight_min * t
+    connected = np.random.random(len(dw)) < dw
+    src_indx, trg_indx = src_indx[connected], trg_indx[connected]
+
+    # Add the number of synapses for every connection.
+    nsyns = np.random.randint(nsyn_min, nsyn_max + 1, size=len(src_indx))
+    return src_indx, trg_indx, nsyns
@@ -156,3 +156,18 @@ class ConnectionMap(object):
         conr = connector.create(self.connector, **(self.connector_params or {}))
         itr = iterator.create(self.iterator, conr, **({}))
         return itr(self.source_nodes, self.target_nodes, conr)
+
+    @property
+    def is_vectorized(self):
+        """True if the connection rule operates on blocks of nodes (see connector.vectorized)."""
+        return isinstance(self.connector, connector.functor_cache.VectorizedFunctor)
+
+    def connection_blocks(self, block_size=None):
+        """For vectorized connection rules returns a generator of (source slice, target slice, nsyns) tiles, where the
+        slices are indices into the ordered source_nodes and target_nodes (see iterator.vectorized_blocks).
+        """
+        if not self.is_vectorized:
+            raise Exception('Connection rule is not vectorized, use connection_itr() instead.')
+
+        conr = connector.create(self.connector, **(self.connector_params or {}))
+        return iterator.vectorized_blocks(self.source_nodes, self.target_nodes, conr, block_size)
@@ -36,5 +36,30 @@ def register(name, func):
     CONNECTOR_CACHE.register(name, func)
 
 
+def vectorized(func=None, block_size=None, sparse=False):
+    """Marks a connection rule as vectorized, to be called with arrays of source/target node properties.
+
+    Can be used either as a decorator or by wrapping an existing function:
+
+        @connector.vectorized
+        def dist_rule(sources, targets, d_max):
+            d = np.linalg.norm(sources['positions'][:, np.newaxis, :] - targets['positions'][np.newaxis, :, :], axis=2)
+            return np.where(d < d_max, 1, 0)
+
+        net.add_edges(..., connection_rule=connector.vectorized(dist_rule, block_size=2**18), ...)
+
+    Rules that only connect a small fraction of the pairs can be marked sparse, in which case they return a tuple of
+    (source indices, target indices, nsyns) arrays with the connected pairs, so a dense block is never allocated.
+
+    :param func: function(sources, targets, **params) that returns a (len(sources), len(targets)) array of nsyns.
+    :param block_size: maximum number of source/target pairs evaluated in a single call (default 2**20, or all pairs at
+        once for sparse rules).
+    :param sparse: set to True if the rule returns (source indices, target indices, nsyns) instead of an array.
+    """
+    if func is None:
+        return lambda f: functor_cache.VectorizedFunctor(f, block_size, sparse)
+    return functor_cache.VectorizedFunctor(func, block_size, sparse)
+
+
 CONNECTOR_CACHE = functor_cache.FunctorCache()
 register('passthrough', lambda *_: {})
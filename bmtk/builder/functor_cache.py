@@ -28,6 +28,42 @@
 import functools
 
 
+class VectorizedFunctor(object):
+    """Wraps a rule that is evaluated on whole blocks of source/target nodes rather than on one pair at a time.
+
+    The wrapped function is called as func(sources, targets, **params) where sources and targets are dictionary-like
+    objects that map a node property name (node_id, positions, node_type_id, ...) to a numpy array with one value per
+    node in the block. It should return an array of shape (len(sources), len(targets)), or for sparse rules a tuple of
+    (source indices, target indices, nsyns) arrays with only the connected pairs of the block.
+    """
+    def __init__(self, func, block_size=None, sparse=False, **params):
+        self._func = func
+        self._block_size = block_size
+        self._sparse = sparse
+        self._params = params
+
+    @property
+    def func(self):
+        return self._func
+
+    @property
+    def block_size(self):
+        return self._block_size
+
+    @property
+    def sparse(self):
+        return self._sparse
+
+    def bind(self, **params):
+        """Returns a copy of the functor with additional parameters passed to the rule."""
+        bound_params = dict(self._params)
+        bound_params.update(params)
+        return VectorizedFunctor(self._func, self._block_size, self._sparse, **bound_params)
+
+    def __call__(self, sources, targets):
+        return self._func(sources, targets, **self._params)
+
+
 class FunctorCache(object):
     def __init__(self):
         self.cache = {}
@@ -48,6 +84,10 @@ class FunctorCache(object):
             # for the iterator we want to pass backs lists as they are
             return connector
 
+        elif isinstance(connector, VectorizedFunctor):
+            # keep the type so the iterator knows to evaluate the rule in blocks
+            return connector.bind(**params)
+
         elif callable(connector):
             return functools.partial(connector, **params)
 
@@ -28,6 +28,12 @@
 import itertools
 import functools
 import types
+import numpy as np
+
+from functor_cache import VectorizedFunctor
+
+
+DEFAULT_BLOCK_SIZE = 2**20  # max number of source/target pairs evaluated in one call of a vectorized rule
 
 
 class IteratorCache(object):
@@ -116,6 +122,100 @@ def lambda_iterator(source_nodes, target_nodes, lambda_val):
         yield (source.node_id, target.node_id, lambda_val())
 
 
+class NodeColumns(object):
+    """Column oriented view of a list of nodes, node properties are converted into numpy arrays on first access."""
+    def __init__(self, nodes, columns=None, index=slice(None), cache=None):
+        self._nodes = nodes
+        self._columns = columns if columns is not None else {}
+        self._index = index
+        self._cache = cache if cache is not None else {}
+
+    def __len__(self):
+        return len(self._nodes[self._index])
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def cache(self):
+        """Dictionary shared by every view of the same nodes, used by connection rules to keep data built from the
+        columns (eg. a KD-tree of positions) from one tile to the next."""
+        return self._cache
+
+    def __contains__(self, key):
+        return key in self._columns or any(key in n for n in self._nodes)
+
+    def __getitem__(self, key):
+        if key not in self._columns:
+            if key not in self:
+                raise KeyError(key)
+            self._columns[key] = np.array([n.get(key, None) for n in self._nodes])
+        return self._columns[key][self._index]
+
+    def block(self, index):
+        """Returns a view of a subset of the nodes, columns are shared with the parent."""
+        return NodeColumns(self._nodes, self._columns, index, self._cache)
+
+
+def vectorized_blocks(source_nodes, target_nodes, connector, block_size=None):
+    """Splits the source x target matrix into tiles and calls the vectorized connector once for each tile.
+
+    :return: generator of (source slice, target slice, nsyns) for every tile, where the slices index into the
+        source_nodes and target_nodes lists. For sparse connectors nsyns is a tuple of (source indices, target indices,
+        nsyns) arrays, with the indices relative to the tile, otherwise it is a (sources x targets) array.
+    """
+    sources = NodeColumns(list(source_nodes))
+    targets = NodeColumns(list(target_nodes))
+    n_sources = len(sources)
+    n_targets = len(targets)
+    if n_sources == 0 or n_targets == 0:
+        return
+
+    block_size = block_size or connector.block_size
+    if block_size is None:
+        # sparse rules only return the connected pairs, so by default every pair is evaluated in a single call
+        block_size = n_sources*n_targets if connector.sparse else DEFAULT_BLOCK_SIZE
+
+    src_step = min(n_sources, block_size)
+    trg_step = max(1, block_size // src_step)
+    for trg_begin in range(0, n_targets, trg_step):
+        trg_block = slice(trg_begin, min(trg_begin + trg_step, n_targets))
+        for src_begin in range(0, n_sources, src_step):
+            src_block = slice(src_begin, min(src_begin + src_step, n_sources))
+            src_cols = sources.block(src_block)
+            trg_cols = targets.block(trg_block)
+            if connector.sparse:
+                nsyns = tuple(np.asarray(a) for a in connector(src_cols, trg_cols))
+                if len(nsyns) != 3 or not (len(nsyns[0]) == len(nsyns[1]) == len(nsyns[2])):
+                    raise Exception('Sparse connection rule must return arrays of (source indices, target indices, '
+                                    'nsyns) of the same length.')
+            else:
+                nsyns = np.asarray(connector(src_cols, trg_cols))
+                if nsyns.shape != (len(src_cols), len(trg_cols)):
+                    raise Exception('Vectorized connection rule returned array of shape {}, expected {}.'.format(
+                        nsyns.shape, (len(src_cols), len(trg_cols))))
+            yield src_block, trg_block, nsyns
+
+
+def vectorized_iterator(source_nodes, target_nodes, connector):
+    """Evaluates a vectorized connector in blocks, but returns the results one source/target pair at a time."""
+    source_ids = [s.node_id for s in source_nodes]
+    target_ids = [t.node_id for t in target_nodes]
+    for src_block, trg_block, nsyns in vectorized_blocks(source_nodes, target_nodes, connector):
+        if connector.sparse:
+            # only the connected pairs
+            block_src_ids = source_ids[src_block]
+            block_trg_ids = target_ids[trg_block]
+            for i, j, n in zip(*nsyns):
+                yield (block_src_ids[i], block_trg_ids[j], n)
+            continue
+
+        for i, src_id in enumerate(source_ids[src_block]):
+            for j, trg_id in enumerate(target_ids[trg_block]):
+                yield (src_id, trg_id, nsyns[i, j])
+
+
 ITERATOR_CACHE = IteratorCache()
 register('one_to_one', functools.partial, one_to_one_iterator)
 register('all_to_one', functools.partial, all_to_one_iterator)
@@ -127,3 +227,7 @@ register('all_to_one', list, all_to_one_list_iterator)
 
 
 register('one_to_one', types.FunctionType, lambda_iterator)
+
+register('one_to_one', VectorizedFunctor, vectorized_iterator)
+register('one_to_all', VectorizedFunctor, vectorized_iterator)
+register('all_to_one', VectorizedFunctor, vectorized_iterator)
@@ -33,6 +33,7 @@ import csv
 from node_pool import NodePool
 from connection_map import ConnectionMap
 from node_set import NodeSet
+from node_table import NodeTable
 from id_generator import IDGenerator
 
 
@@ -49,6 +50,7 @@ class Network (object):
         self._edges_built = False
         
         self._node_sets = []
+        self._node_table = None
         self.__external_node_sets = []
         self.__node_id_counter = 0
 
@@ -175,6 +177,13 @@ class Network (object):
     def nodes_iter(self, nids=None):
         raise NotImplementedError
 
+    @property
+    def node_table(self):
+        """Column-oriented NodeTable of all the nodes in the network, used for resolving NodePool queries."""
+        if self._node_table is None:
+            self._node_table = NodeTable(self.nodes_iter())
+        return self._node_table
+
     def edges(self, target_nodes=None, source_nodes=None, target_network=None, source_network=None, **properties):
         """Returns a list of dictionary-like Edge objects, given filter parameters.
 
@@ -206,7 +215,7 @@ class Network (object):
             if isinstance(nodes, NodePool):
                 if network is not None and nodes.network_name != network:
                     print('Warning. nodes and network don not match')
-                return [n.node_id for n in nodes], nodes.network_name
+                return nodes.node_ids.tolist(), nodes.network_name
             else:
                 raise Exception('Couldnt convert nodes')
 
@@ -225,7 +234,7 @@ class Network (object):
         # trg_gids can't be none for edges_itr. if target-nodes is not explicity states get all target_gids that
         # synapse onto or from current network.
         if target_nodes is None:
-            trg_gid_set = set(n.node_id for cm in self._connection_maps for n in cm.target_nodes)
+            trg_gid_set = set(gid for cm in self._connection_maps for gid in cm.target_nodes.node_ids.tolist())
             target_nodes = sorted(trg_gid_set)
 
         # convert target/source nodes into a list of their gids
@@ -242,6 +251,7 @@ class Network (object):
 
         if src_gids is not None:
             # if src_gids are set filter out edges some more
+            src_gids = set(src_gids)
             edges = [e for e in edges if e.source_gid in src_gids]
 
         return edges
@@ -282,6 +292,7 @@ class Network (object):
         for ns in self._node_sets:
             nodes = ns.build(nid_generator=self._node_id)
             self._add_nodes(nodes)
+        self._node_table = None
         self._nodes_built = True
 
     def __build_edges(self):
@@ -356,7 +367,15 @@ class Network (object):
         raise NotImplementedError
 
     def save_edges(self, edges_file_name=None, edge_types_file_name=None, output_dir='.', src_network=None,
-                   trg_network=None, force_build=True, force_overwrite=False):
+                   trg_network=None, force_build=True, force_overwrite=False, chunk_size=None, compression=None,
+                   compression_opts=None):
+        """Saves the edges and edge-types of the network, one file for every pair of source/target networks.
+
+        :param chunk_size: number of edges in each chunk of the hdf5 datasets. By default datasets are not chunked,
+            unless compression is used.
+        :param compression: hdf5 compression filter for the edges datasets, 'gzip', 'lzf' or None.
+        :param compression_opts: compression settings, for gzip the compression level 0-9.
+        """
         # Make sure edges exists and are built
         if len(self._connection_maps) == 0:
             print("Warning: no edges have been made for this network, skipping saving.")
@@ -392,7 +411,8 @@ class Network (object):
                 self._save_edge_types(os.path.join(output_dir, p[3]), p[0], p[1])
 
             if p[2] is not None:
-                self._save_edges(os.path.join(output_dir, p[2]), p[0], p[1])
+                self._save_edges(os.path.join(output_dir, p[2]), p[0], p[1], chunk_size=chunk_size,
+                                 compression=compression, compression_opts=compression_opts)
 
     def _save_edge_types(self, edge_types_file_name, src_network, trg_network):
 
@@ -412,7 +432,8 @@ class Network (object):
             for edge_type in matching_et:
                 csvw.writerow([edge_type.get(cname, 'NULL') for cname in cols])
 
-    def _save_edges(self, edges_file_name, src_network, trg_network):
+    def _save_edges(self, edges_file_name, src_network, trg_network, chunk_size=None, compression=None,
+                    compression_opts=None):
         raise NotImplementedError
 
     def _initialize(self):
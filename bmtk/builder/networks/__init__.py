@@ -26,6 +26,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 from dm_network import DenseNetwork
+from sparse_network import SparseNetwork
 NetworkBuilder = dm_network.DenseNetwork
 
 from mpi_network import MPINetwork, MPINetwork as MPIBuilder
\ No newline at end of file
@@ -36,6 +36,38 @@ from bmtk.builder.node import Node
 from bmtk.builder.edge import Edge
 
 
+DEFAULT_CHUNK_SIZE = 2**16  # number of edges per hdf5 chunk when chunking or compression is used
+
+
+def write_dataset(h5_grp, path, data, dtype=None, chunk_size=None, compression=None, compression_opts=None):
+    """Writes a 1D array to an hdf5 dataset in one call, optionally chunked and compressed.
+
+    :param h5_grp: h5py File or Group the dataset is created in.
+    :param path: name of the dataset.
+    :param data: numpy array or list of values, object arrays are converted using dtype (or inferred if None).
+    :param chunk_size: number of values in each hdf5 chunk. If None no chunking is used, unless compression is set.
+    :param compression: 'gzip', 'lzf' or None.
+    :param compression_opts: compression level, for gzip between 0 and 9.
+    """
+    data = np.asarray(data)
+    if data.dtype == object:
+        data = np.array(data.tolist(), dtype=dtype)
+
+    kwargs = dataset_options(data.shape, chunk_size, compression, compression_opts)
+    return h5_grp.create_dataset(path, data=data, dtype=dtype, **kwargs)
+
+
+def dataset_options(shape, chunk_size=None, compression=None, compression_opts=None):
+    """Returns the h5py create_dataset() chunking and compression arguments for a dataset of a given shape."""
+    kwargs = {}
+    if shape[0] > 0 and (chunk_size is not None or compression is not None):
+        kwargs['chunks'] = (min(chunk_size or DEFAULT_CHUNK_SIZE, shape[0]),) + tuple(shape[1:])
+        if compression is not None:
+            kwargs['compression'] = compression
+            kwargs['compression_opts'] = compression_opts
+    return kwargs
+
+
 class DenseNetwork(Network):
     def __init__(self, name, **network_props):
         super(DenseNetwork, self).__init__(name, **network_props or {})
@@ -145,14 +177,21 @@ class DenseNetwork(Network):
         nodes = []
         for n in nodes_network:
             self._node_id_gen.remove_id(n.gid)
-            self._nodes.append(Node(n.gid, n.node_props, n.node_type_props))
+            # node_props is a read-only view of the row in the nodes file, the Node needs its own copy
+            self._nodes.append(Node(n.gid, dict(n.node_props), n.node_type_props))
+        self._node_table = None
 
     def _add_edges(self, connection_map, i):
         syn_table = self.EdgeTable(connection_map)
-        connections = connection_map.connection_itr()
-        for con in connections:
-            if con[2] is not None:
-                syn_table[con[0], con[1]] = con[2]
+        if connection_map.is_vectorized:
+            # rule is evaluated on whole blocks of the source x target matrix at once
+            for src_block, trg_block, nsyns in connection_map.connection_blocks():
+                syn_table.set_block(src_block, trg_block, nsyns)
+        else:
+            connections = connection_map.connection_itr()
+            for con in connections:
+                if con[2] is not None:
+                    syn_table[con[0], con[1]] = con[2]
 
         target_net = connection_map.target_nodes
         self._target_networks[target_net.network_name] = target_net.network
@@ -170,6 +209,11 @@ class DenseNetwork(Network):
                       'source_query': connection_map.source_nodes.filter_str,
                       'target_query': connection_map.target_nodes.filter_str}
 
+        if connection_map.params:
+            # Only visit the (source, target) pairs that have synapses, in the same source-major order as the table.
+            source_nodes = list(connection_map.source_nodes)
+            target_nodes = list(connection_map.target_nodes)
+            connected_pairs = list(zip(*np.nonzero(syn_table.nsyn_table)))
 
         for param in connection_map.params:
             rule = param.rule
@@ -177,14 +221,15 @@ class DenseNetwork(Network):
             edge_table['params_dtypes'].update(param.dtypes)
             if isinstance(param_names, list) or isinstance(param_names, tuple):
                 tmp_tables = [self.PropertyTable(nsyns) for _ in range(len(param_names))]
-                for source in connection_map.source_nodes:
+                for src_indx, trg_indx in connected_pairs:
+                    source = source_nodes[src_indx]
+                    target = target_nodes[trg_indx]
                     src_node_id = source.node_id
-                    for target in connection_map.target_nodes:
-                        trg_node_id = target.node_id  # TODO: pull this out and put in it's own list
-                        for _ in range(syn_table[src_node_id, trg_node_id]):
-                            pvals = rule(source, target)
-                            for i in range(len(param_names)):
-                                tmp_tables[i][src_node_id, trg_node_id] = pvals[i]
+                    trg_node_id = target.node_id
+                    for _ in range(syn_table.nsyn_table[src_indx, trg_indx]):
+                        pvals = rule(source, target)
+                        for i in range(len(param_names)):
+                            tmp_tables[i][src_node_id, trg_node_id] = pvals[i]
 
                 for i, name in enumerate(param_names):
                     # TODO: I think a copy constructor might get called, move this out.
@@ -192,128 +237,131 @@ class DenseNetwork(Network):
 
             else:
                 pt = self.PropertyTable(np.sum(nsyns))
-                for source in connection_map.source_nodes:
+                for src_indx, trg_indx in connected_pairs:
+                    source = source_nodes[src_indx]
+                    target = target_nodes[trg_indx]
                     src_node_id = source.node_id
-                    for target in connection_map.target_nodes:
-                        trg_node_id = target.node_id  # TODO: pull this out and put in it's own list
-                        #print('{}, {}: {}'.format(src_node_id, trg_node_id, edge_table[src_node_id, trg_node_id]))
-                        for _ in range(syn_table[src_node_id, trg_node_id]):
-                            pt[src_node_id, trg_node_id] = rule(source, target)
+                    trg_node_id = target.node_id
+                    for _ in range(syn_table.nsyn_table[src_indx, trg_indx]):
+                        pt[src_node_id, trg_node_id] = rule(source, target)
                 edge_table['params'][param_names] = pt
 
         self.__edges_tables.append(edge_table)
 
-    def _save_edges(self, edges_file_name, src_network, trg_network):
-        groups = {}
-        group_dtypes = {}  # TODO: this should be stored in PropertyTable
-        grp_id_itr = 0
-        groups_lookup = {}
-        total_syns = 0
-
-        matching_edge_tables = [et for et in self.__edges_tables
+    def _synapse_params(self, edge_table):
+        """Returns the edge properties of a table with one value per synapse, with synapses ordered by target then
+        source (the order of EdgeTable.pair_ids()).
+        """
+        syn_table = edge_table['syn_table']
+        nsyn_table = syn_table.nsyn_table
+
+        # Property values were created in source-major order, find where each value goes when ordered by target.
+        src_indices, trg_indices = np.nonzero(nsyn_table)
+        target_major_rank = np.argsort(np.lexsort((src_indices, trg_indices)))
+        syn_ranks = np.repeat(target_major_rank, nsyn_table[src_indices, trg_indices])
+        order = np.argsort(syn_ranks, kind='mergesort')
+        return {name: prop_table.values[order] for name, prop_table in edge_table['params'].items()}
+
+    def _save_edges(self, edges_file_name, src_network, trg_network, chunk_size=None, compression=None,
+                    compression_opts=None):
+        matching_edge_tables = [et for et in self.edges_table()
                                 if et['source_network'] == src_network and et['target_network'] == trg_network]
 
+        # Edge-tables with the same set of properties are saved into the same edge-group
+        groups_lookup = {}
+        group_dtypes = {}
+        table_groups = []
         for ets in matching_edge_tables:
-            params_hash =  str(ets['params'].keys())
-            group_id = groups_lookup.get(params_hash, None)
-            if group_id is None:
-                group_id = grp_id_itr
+            params_hash = str(ets['params'].keys())
+            if params_hash not in groups_lookup:
+                group_id = len(groups_lookup)
                 groups_lookup[params_hash] = group_id
-                grp_id_itr += 1
-
-            ets['group_id'] = group_id
-            groups[group_id] = {}
-            group_dtypes[group_id] = ets['params_dtypes']
-            for param_name in ets['params'].keys():
-                groups[group_id][param_name] = []
-
-            total_syns += int(ets['nsyns'])
-
-        group_index_itrs = [0 for _ in range(grp_id_itr)]
-        trg_gids = np.zeros(total_syns)  # set dtype to uint64
-        src_gids = np.zeros(total_syns)
-        edge_groups = np.zeros(total_syns)  # dtype uint16 or uint8
-        edge_group_index = np.zeros(total_syns)  # uint32
-        edge_type_ids = np.zeros(total_syns)  # uint32
+                group_dtypes[group_id] = dict(ets['params_dtypes']) if ets['params'] else {'nsyns': 'uint16'}
+            table_groups.append(groups_lookup[params_hash])
 
         # TODO: Another potential issue if node-ids don't start with 0
-        index_ptrs = np.zeros(len(self._target_networks[trg_network].nodes()) + 1)
-        #index_ptrs = np.zeros(len(self._nodes)+1)  # TODO: issue when target nodes come from another network
-        index_ptr_itr = 0
-
-        gid_indx = 0
-        for trg_node in self._target_networks[trg_network].nodes():
-            index_ptrs[index_ptr_itr] = gid_indx
-            index_ptr_itr += 1
-
-            for ets in matching_edge_tables:
-                edge_group_id = ets['group_id']
-                group_table = groups[edge_group_id]
-
-                syn_table = ets['syn_table']
-                if syn_table.has_target(trg_node.node_id):
-                    if ets['params']:
-                        for src_id, nsyns in syn_table.trg_itr(trg_node.node_id):
-                            # Add on to the edges index
-                            indx_end = gid_indx+nsyns
-                            while gid_indx < indx_end:
-                                trg_gids[gid_indx] = trg_node.node_id
-                                src_gids[gid_indx] = src_id
-                                edge_type_ids[gid_indx] = ets['edge_type_id']
-                                edge_groups[gid_indx] = edge_group_id
-                                edge_group_index[gid_indx] = group_index_itrs[edge_group_id]
-                                group_index_itrs[edge_group_id] += 1
-                                gid_indx += 1
-
-                            for param_name, param_table in ets['params'].items():
-                                param_vals = group_table[param_name]
-                                for val in param_table.itr_vals(src_id, trg_node.node_id):
-                                    param_vals.append(val)
-
-                    else:
-                        # If no properties just print nsyns table.
-                        if 'nsyns' not in group_table:
-                            group_table['nsyns'] = []
-                        group_dtypes[edge_group_id]['nsyns'] = 'uint16'
-                        for src_id, nsyns in syn_table.trg_itr(trg_node.node_id):
-                            trg_gids[gid_indx] = trg_node.node_id
-                            src_gids[gid_indx] = src_id
-                            edge_type_ids[gid_indx] = ets['edge_type_id']
-                            edge_groups[gid_indx] = edge_group_id
-                            edge_group_index[gid_indx] = group_index_itrs[edge_group_id]
-                            # group_dtypes
-                            group_index_itrs[edge_group_id] += 1
-                            gid_indx += 1
-
-                            group_table['nsyns'].append(nsyns)
-
-        trg_gids = trg_gids[:gid_indx]
-        src_gids = src_gids[:gid_indx]
-        edge_groups = edge_groups[:gid_indx]
-        edge_group_index = edge_group_index[:gid_indx]
-        edge_type_ids = edge_type_ids[:gid_indx]
-
-        index_ptrs[index_ptr_itr] = gid_indx
-
+        # edges are ordered by the position of the target in the target network
+        target_gids = self._target_networks[trg_network].nodes().node_ids.astype(np.uint64)
+        gids_order = np.argsort(target_gids, kind='mergesort')
+
+        trg_gids = []
+        src_gids = []
+        edge_type_ids = []
+        edge_groups = []
+        table_indices = []
+        group_values = {group_id: {} for group_id in group_dtypes.keys()}
+        group_row_index = []
+        group_counts = {group_id: 0 for group_id in group_dtypes.keys()}
+        for table_indx, (ets, group_id) in enumerate(zip(matching_edge_tables, table_groups)):
+            src_ids, trg_ids, nsyns = ets['syn_table'].pair_ids()
+            if ets['params']:
+                # one row for every synapse
+                src_ids = np.repeat(src_ids, nsyns)
+                trg_ids = np.repeat(trg_ids, nsyns)
+                row_values = self._synapse_params(ets)
+            else:
+                # If no properties just save the nsyns table.
+                row_values = {'nsyns': nsyns}
+
+            n_rows = len(trg_ids)
+            trg_gids.append(trg_ids)
+            src_gids.append(src_ids)
+            edge_type_ids.append(np.full(n_rows, ets['edge_type_id'], dtype=np.uint32))
+            edge_groups.append(np.full(n_rows, group_id, dtype=np.uint16))
+            table_indices.append(np.full(n_rows, table_indx, dtype=np.uint32))
+            group_row_index.append(np.arange(group_counts[group_id], group_counts[group_id] + n_rows))
+            group_counts[group_id] += n_rows
+            for name, vals in row_values.items():
+                group_values[group_id].setdefault(name, []).append(vals)
+
+        def concat(arrays, dtype):
+            return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+        trg_gids = concat(trg_gids, np.uint64)
+        src_gids = concat(src_gids, np.uint64)
+        edge_type_ids = concat(edge_type_ids, np.uint32)
+        edge_groups = concat(edge_groups, np.uint16)
+        table_indices = concat(table_indices, np.uint32)
+        group_row_index = concat(group_row_index, np.uint64)
+
+        # Sort all rows by target position, then by edge-table. Sorting is stable so the sources of each target remain
+        # in the order they appear in the table.
+        trg_positions = gids_order[np.searchsorted(target_gids, trg_gids, sorter=gids_order)]
+        order = np.lexsort((table_indices, trg_positions))
+        trg_gids = trg_gids[order]
+        src_gids = src_gids[order]
+        edge_type_ids = edge_type_ids[order]
+        edge_groups = edge_groups[order]
+        group_row_index = group_row_index[order]
+
+        edge_group_index = np.zeros(len(order), dtype=np.uint32)
+        group_datasets = {}
+        for group_id, props in group_values.items():
+            group_mask = edge_groups == group_id
+            edge_group_index[group_mask] = np.arange(np.count_nonzero(group_mask))
+            group_rows = group_row_index[group_mask]
+            group_datasets[group_id] = {name: np.concatenate(vals)[group_rows] for name, vals in props.items()}
+
+        index_ptrs = np.zeros(len(target_gids) + 1, dtype=np.uint32)
+        index_ptrs[1:] = np.cumsum(np.bincount(trg_positions, minlength=len(target_gids)))
+
+        h5_opts = {'chunk_size': chunk_size, 'compression': compression, 'compression_opts': compression_opts}
         with h5py.File(edges_file_name, 'w') as hf:
-            hf.create_dataset('edges/target_gid', data=trg_gids, dtype='uint64')
+            write_dataset(hf, 'edges/target_gid', trg_gids, dtype='uint64', **h5_opts)
             hf['edges/target_gid'].attrs['network'] = trg_network
-            hf.create_dataset('edges/source_gid', data=src_gids, dtype='uint64')
+            write_dataset(hf, 'edges/source_gid', src_gids, dtype='uint64', **h5_opts)
             hf['edges/source_gid'].attrs['network'] = src_network
 
-            hf.create_dataset('edges/edge_group', data=edge_groups, dtype='uint16')
-            hf.create_dataset('edges/edge_group_index', data=edge_group_index, dtype='uint32')
-            hf.create_dataset('edges/edge_type_id', data=edge_type_ids, dtype='uint32')
-            hf.create_dataset('edges/index_pointer', data=index_ptrs, dtype='uint32')
+            write_dataset(hf, 'edges/edge_group', edge_groups, dtype='uint16', **h5_opts)
+            write_dataset(hf, 'edges/edge_group_index', edge_group_index, dtype='uint32', **h5_opts)
+            write_dataset(hf, 'edges/edge_type_id', edge_type_ids, dtype='uint32', **h5_opts)
+            write_dataset(hf, 'edges/index_pointer', index_ptrs, dtype='uint32', **h5_opts)
 
-            for group_id, params_dict in groups.items():
+            for group_id, params_dict in group_datasets.items():
                 for params_key, params_vals in params_dict.items():
                     group_path = 'edges/{}/{}'.format(group_id, params_key)
-                    dtype = group_dtypes[group_id][params_key]
-                    if dtype is not None:
-                        hf.create_dataset(group_path, data=list(params_vals), dtype=dtype)
-                    else:
-                        hf.create_dataset(group_path, data=list(params_vals))
+                    dtype = group_dtypes[group_id].get(params_key, None)
+                    write_dataset(hf, group_path, params_vals, dtype=dtype, **h5_opts)
 
     def _clear(self):
         self._nedges = 0
@@ -377,6 +425,17 @@ class DenseNetwork(Network):
             indexed_pair = (self.__src2idx[key[0]], self.__trg2idx[key[1]])
             self._nsyn_table[indexed_pair] = value
 
+        def set_block(self, src_block, trg_block, nsyns):
+            """Sets the number of synapses for a block of the table, where src_block and trg_block index the source
+            and target nodes in the same order as the connection map. nsyns is either a (sources x targets) array or
+            a tuple of (source indices, target indices, nsyns) arrays, with the indices relative to the block.
+            """
+            if isinstance(nsyns, tuple):
+                src_i, trg_i, nsyns = nsyns
+                self._nsyn_table[src_i + (src_block.start or 0), trg_i + (trg_block.start or 0)] = nsyns
+            else:
+                self._nsyn_table[src_block, trg_block] = nsyns
+
         def has_target(self, node_id):
             return node_id in self.__trg2idx
 
@@ -392,6 +451,13 @@ class DenseNetwork(Network):
         def source_ids(self):
             return self.__idx2src
 
+        def pair_ids(self):
+            """Returns the source node_ids, target node_ids and nsyns of every connected pair, ordered by target."""
+            trg_indices, src_indices = np.nonzero(self._nsyn_table.T)
+            return (np.array(self.__idx2src, dtype=np.uint64)[src_indices],
+                    np.array(self.__idx2trg, dtype=np.uint64)[trg_indices],
+                    self._nsyn_table[src_indices, trg_indices])
+
         def trg_itr(self, trg_id):
             trg_i = self.__trg2idx[trg_id]
             for src_j, src_id in enumerate(self.__idx2src):
@@ -407,6 +473,10 @@ class DenseNetwork(Network):
             self._index = np.zeros((nvalues, 2), dtype=np.uint32)
             self._itr_index = 0
 
+        @property
+        def values(self):
+            return self._prop_array[:self._itr_index]
+
         def itr_vals(self, src_id, trg_id):
             indicies = np.where((self._index[:, 0] == src_id) & (self._index[:, 1] == trg_id))
             for val in self._prop_array[indicies]:
@@ -23,9 +23,13 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-from dm_network import DenseNetwork
+import os
+from dm_network import DenseNetwork, dataset_options
+from bmtk.builder.edge import Edge
 from mpi4py import MPI
 from heapq import heappush, heappop
+import warnings
+import numpy as np
 import h5py
 
 comm = MPI.COMM_WORLD
@@ -34,6 +38,8 @@ nprocs = comm.Get_size()
 
 
 class MPINetwork(DenseNetwork):
+    edges_iter_block_size = 2**12  # number of target gids exchanged at a time by edges_iter()
+
     def __init__(self, name, **network_props):
         super(MPINetwork, self).__init__(name, **network_props or {})
         self._edge_assignment = None
@@ -41,6 +47,8 @@ class MPINetwork(DenseNetwork):
     def _add_edges(self, connection_map, i):
         if self._assign_to_rank(i):
             super(MPINetwork, self)._add_edges(connection_map, i)
+            # keep track of which connection-map the table was built from, needed for ordering the edges when saving.
+            self.edges_table()[-1]['cm_index'] = i
 
     def save_nodes(self, nodes_file_name, node_types_file_name):
         if rank == 0:
@@ -59,91 +67,314 @@ class MPINetwork(DenseNetwork):
         comm.Barrier()
     """
 
-    def edges_iter(self, trg_gids, src_network=None, trg_network=None):
-        for trg_gid in trg_gids:
-            edges = list(super(MPINetwork, self).edges_iter([trg_gid], src_network, trg_network))
-            collected_edges = comm.gather(edges, root=0)
+    def edges_iter(self, trg_gids, src_network=None, trg_network=None, block_size=None):
+        """Iterates over the edges of the given targets, must be called by every rank.
+
+        Edges are collected onto rank 0 a block of targets at a time, with every rank packing its local edges into numpy
+        buffers which are gathered in a single collective call. Rank 0 yields the edges in the same order as the
+        targets, with the edges of each target ordered by rank. Other ranks yield None for every target.
+
+        A Gatherv is used rather than an Alltoallv since only rank 0 yields edges, an all-to-all exchange would only send
+        empty buffers to the other ranks.
+        """
+        block_size = block_size or self.edges_iter_block_size
+        trg_gids = list(trg_gids)
+
+        # Every rank needs to agree on how many values each packed edge has
+        connections = self.get_connections()
+        n_values = max([len(_cm_property_names(cm)) for cm in connections] or [1])
+        prop_names_lookup = [_cm_property_names(cm) for cm in connections]
+        local_rows = self._local_edge_rows(src_network, trg_network, n_values)
+
+        for block_begin in range(0, len(trg_gids), block_size):
+            block_gids = trg_gids[block_begin:block_begin+block_size]
+            meta, values = self._pack_edges(local_rows, block_gids, n_values)
+
+            counts = comm.gather(len(meta), root=0)
             if rank == 0:
-                for edge_list in collected_edges:
-                    for edge in edge_list:
-                        # print 'b'
-                        yield edge
+                counts = np.array(counts, dtype=np.int64)
+                all_meta = np.zeros((np.sum(counts), 4), dtype=np.int64)
+                all_values = np.zeros((np.sum(counts), n_values), dtype=np.float64)
+                comm.Gatherv(meta, (all_meta, counts*4), root=0)
+                comm.Gatherv(values, (all_values, counts*n_values), root=0)
+
+                # Order by target, the received edges are already ordered by rank
+                order = np.argsort(all_meta[:, 0], kind='mergesort')
+                all_meta = all_meta[order]
+                all_values = all_values[order]
+                for (_, src_gid, trg_gid, cm_index), vals in zip(all_meta.tolist(), all_values.tolist()):
+                    prop_names = prop_names_lookup[cm_index]
+                    if prop_names == ['nsyns']:
+                        syn_props = {'nsyns': int(vals[0])}
+                    else:
+                        syn_props = {name: vals[j] for j, name in enumerate(prop_names)}
+                    yield Edge(src_gid=src_gid, trg_gid=trg_gid,
+                               edge_type_props=connections[cm_index].edge_type_properties, syn_props=syn_props)
             else:
-                yield None
+                comm.Gatherv(meta, None, root=0)
+                comm.Gatherv(values, None, root=0)
+                for _ in block_gids:
+                    yield None
 
-            comm.Barrier()
+    def _local_edge_rows(self, src_network, trg_network, n_values):
+        """Returns the edges of each local edge-table, as a tuple of (connection-map index, target gids, source gids,
+        property values) arrays ordered by target gid.
+        """
+        local_rows = []
+        for ets in self.edges_table():
+            if trg_network is not None and ets['target_network'] != trg_network:
+                continue
+            if src_network is not None and ets['source_network'] != src_network:
+                continue
 
-    def _save_edges(self, edges_file_name, src_network, trg_network):
-        target_gids = [n.node_id for n in self._target_networks[trg_network].nodes()]
-        # TODO: make sure target_gids are sorted
-
-        trg_gids_ds = []
-        src_gids_ds = []
-        edge_type_id_ds = []
-        edge_group_ds = []
-        edge_group_index_ds = []
-
-        eg_collection = {}
-        eg_ids = 0
-        eg_lookup = {}
-        eg_table = {}
-        eg_indices = {}
-        for cm in self.get_connections():
-            col_key = cm.properties_keys()
-            if col_key in eg_collection:
-                group_id = eg_collection[col_key]
+            cm_index = ets['cm_index']
+            src_ids, trg_ids, nsyns = ets['syn_table'].pair_ids()
+            values = np.zeros((len(trg_ids) if not ets['params'] else int(np.sum(nsyns)), n_values),
+                              dtype=np.float64)
+            if ets['params']:
+                src_ids = np.repeat(src_ids, nsyns)
+                trg_ids = np.repeat(trg_ids, nsyns)
+                syn_params = self._synapse_params(ets)
+                for j, name in enumerate(_cm_property_names(self.get_connections()[cm_index])):
+                    values[:, j] = syn_params[name]
             else:
-                group_id = eg_ids
-                eg_collection[col_key] = group_id
-                eg_ids += 1
-            eg_lookup[cm.edge_type_id] = group_id
-            eg_indices[group_id] = 0
-            eg_table[group_id] = {k: [] for k in cm.property_names}
-
-        for e in self.edges_iter(target_gids, src_network=src_network, trg_network=trg_network):
-            if rank == 0:
-                trg_gids_ds.append(e.target_gid)
-                src_gids_ds.append(e.source_gid)
-                edge_type_id_ds.append(e.edge_type_id)
+                values[:, 0] = nsyns
+
+            # a stable sort so the sources of each target keep the same order
+            order = np.argsort(trg_ids, kind='mergesort')
+            local_rows.append((cm_index, trg_ids[order].astype(np.int64), src_ids[order].astype(np.int64),
+                               values[order]))
+
+        return local_rows
+
+    def _pack_edges(self, local_rows, block_gids, n_values):
+        """Packs all local edges with a target in block_gids into a (n_edges, 4) array of [block position, source gid,
+        target gid, connection-map index] and a (n_edges, n_values) array of edge property values, ordered by position
+        of the target in the block then by edge-table.
+        """
+        block_gids = np.array(block_gids, dtype=np.int64)
+        metas = []
+        values = []
+        for cm_index, trg_ids, src_ids, table_values in local_rows:
+            row_begins = np.searchsorted(trg_ids, block_gids, side='left')
+            row_counts = np.searchsorted(trg_ids, block_gids, side='right') - row_begins
+            n_rows = int(np.sum(row_counts))
+            if n_rows == 0:
+                continue
 
-                group_id = eg_lookup[e.edge_type_id]
-                edge_group_ds.append(group_id)
-                group_id_index = eg_indices[group_id]
-                edge_group_index_ds.append(group_id_index)
-                eg_indices[group_id] += 1
+            block_offsets = np.cumsum(row_counts) - row_counts
+            rows = np.repeat(row_begins, row_counts) + np.arange(n_rows) - np.repeat(block_offsets, row_counts)
+            meta = np.empty((n_rows, 4), dtype=np.int64)
+            meta[:, 0] = np.repeat(np.arange(len(block_gids)), row_counts)
+            meta[:, 1] = src_ids[rows]
+            meta[:, 2] = trg_ids[rows]
+            meta[:, 3] = cm_index
+            metas.append(meta)
+            values.append(table_values[rows])
 
-                for k, v in e.synaptic_properties.items():
-                    eg_table[group_id][k].append(v)
+        if not metas:
+            return np.zeros((0, 4), dtype=np.int64), np.zeros((0, n_values), dtype=np.float64)
 
+        meta = np.concatenate(metas)
+        order = np.argsort(meta[:, 0], kind='mergesort')
+        return np.ascontiguousarray(meta[order]), np.ascontiguousarray(np.concatenate(values)[order])
+
+    def _save_edge_types(self, edge_types_file_name, src_network, trg_network):
         if rank == 0:
-            # Create index from target_gids dataset
-            index_pointer_ds = []
-            cur_gid = 0
-            index = 0
-            while index < len(trg_gids_ds):
-                if trg_gids_ds[index] == cur_gid:
-                    index += 1
-                else:
-                    cur_gid += 1
-                    index_pointer_ds.append(index)
-            index_pointer_ds.append(len(trg_gids_ds)+1)
-
-
-            with h5py.File(edges_file_name, 'w') as hf:
-                hf.create_dataset('edges/target_gid', data=trg_gids_ds, dtype='uint64')
+            super(MPINetwork, self)._save_edge_types(edge_types_file_name, src_network, trg_network)
+        comm.Barrier()
+
+    def _save_edges(self, edges_file_name, src_network, trg_network, chunk_size=None, compression=None,
+                    compression_opts=None):
+        """Saves the edges with every rank writing its own part of the edges file.
+
+        The edges are first redistributed so that each rank holds all the edges for a contiguous range of targets
+        (balanced by number of edges), after which the offset of each rank into the datasets is found with a prefix sum.
+        When h5py is built with MPI support all ranks write directly into the edges file using the mpio driver,
+        otherwise each rank writes its part to a temporary shard file which rank 0 then concatenates.
+        """
+        matching_cms = [(i, cm) for i, cm in enumerate(self.get_connections())
+                        if cm.source_network_name == src_network and cm.target_network_name == trg_network]
+        if not matching_cms:
+            return
+        matching_indices = set(i for i, _ in matching_cms)
+
+        # Edge-group of every connection-map, must be found using information available on all ranks.
+        groups_lookup = {}
+        group_columns = []
+        group_dtypes = []
+        cm_group_lookup = np.zeros(len(self.get_connections()), dtype=np.uint16)
+        cm_edge_type_lookup = np.zeros(len(self.get_connections()), dtype=np.uint32)
+        for cm_index, cm in matching_cms:
+            prop_names = _cm_property_names(cm)
+            group_key = str(sorted(prop_names))
+            if group_key not in groups_lookup:
+                groups_lookup[group_key] = len(group_columns)
+                group_columns.append(prop_names)
+                group_dtypes.append({'nsyns': 'uint16'} if not cm.params else {})
+            group_id = groups_lookup[group_key]
+            for param in cm.params:
+                group_dtypes[group_id].update({k: v for k, v in param.dtypes.items() if v is not None})
+            cm_group_lookup[cm_index] = group_id
+            cm_edge_type_lookup[cm_index] = cm.edge_type_id
+        n_groups = len(group_columns)
+
+        target_gids = matching_cms[0][1].target_nodes.network.nodes().node_ids.astype(np.uint64)
+        n_targets = len(target_gids)
+        gids_order = np.argsort(target_gids, kind='mergesort')
+
+        # Get the rows of every local edge table, ordered by the position of their target
+        local_tables = []
+        local_counts = np.zeros(n_targets, dtype=np.int64)
+        for ets in self.edges_table():
+            if ets.get('cm_index', None) not in matching_indices:
+                continue
+            src_ids, trg_ids, nsyns = ets['syn_table'].pair_ids()
+            if ets['params']:
+                src_ids = np.repeat(src_ids, nsyns)
+                trg_ids = np.repeat(trg_ids, nsyns)
+                values = self._synapse_params(ets)
+            else:
+                values = {'nsyns': nsyns}
+            trg_pos = gids_order[np.searchsorted(target_gids, trg_ids, sorter=gids_order)]
+            order = np.argsort(trg_pos, kind='mergesort')
+            local_tables.append((ets['cm_index'], trg_pos[order], src_ids[order],
+                                 {k: np.asarray(v)[order] for k, v in values.items()}))
+            local_counts += np.bincount(trg_pos, minlength=n_targets)
+
+        # Split targets into contiguous ranges with roughly the same number of edges on every rank
+        target_counts = np.zeros(n_targets, dtype=np.int64)
+        comm.Allreduce(local_counts, target_counts, op=MPI.SUM)
+        cumulative_counts = np.cumsum(target_counts)
+        total_edges = int(cumulative_counts[-1]) if n_targets > 0 else 0
+        splits = np.searchsorted(cumulative_counts, np.arange(1, nprocs)*(total_edges/float(nprocs)), side='right')
+        bounds = np.concatenate(([0], np.minimum(splits, n_targets), [n_targets])).astype(np.int64)
+
+        # Send each rank the slices of the tables that belong in its range of targets
+        outgoing = [[] for _ in range(nprocs)]
+        for cm_index, trg_pos, src_ids, values in local_tables:
+            table_bounds = np.searchsorted(trg_pos, bounds)
+            for dest in range(nprocs):
+                beg, end = table_bounds[dest], table_bounds[dest+1]
+                if end > beg:
+                    outgoing[dest].append((cm_index, trg_pos[beg:end], src_ids[beg:end],
+                                           {k: v[beg:end] for k, v in values.items()}))
+        incoming = [chunk for chunks in comm.alltoall(outgoing) for chunk in chunks]
+        del outgoing, local_tables
+
+        # Sort received edges by target and connection-map, since each table only comes from one rank and is already
+        # sorted by target the sources keep their original order.
+        def concat(arrays, dtype):
+            return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+        trg_pos = concat([c[1] for c in incoming], np.int64)
+        src_gids = concat([c[2] for c in incoming], np.uint64)
+        cm_indices = concat([np.full(len(c[1]), c[0], dtype=np.uint32) for c in incoming], np.uint32)
+        edge_groups = cm_group_lookup[cm_indices]
+
+        # position of every row within its edge-group, before sorting
+        group_positions = np.zeros(len(cm_indices), dtype=np.int64)
+        for group_id in range(n_groups):
+            group_mask = edge_groups == group_id
+            group_positions[group_mask] = np.arange(np.count_nonzero(group_mask))
+
+        order = np.lexsort((cm_indices, trg_pos))
+        trg_pos = trg_pos[order]
+        src_gids = src_gids[order]
+        cm_indices = cm_indices[order]
+        edge_groups = edge_groups[order]
+        group_positions = group_positions[order]
+        trg_gids = target_gids[trg_pos]
+        edge_type_ids = cm_edge_type_lookup[cm_indices]
+
+        group_values = []
+        for group_id in range(n_groups):
+            chunk_values = [c[3] for c in incoming if cm_group_lookup[c[0]] == group_id]
+            group_rows = group_positions[edge_groups == group_id]
+            group_values.append({name: concat([v[name] for v in chunk_values], object)[group_rows]
+                                 for name in group_columns[group_id]})
+        del incoming
+
+        # Find the offsets of this rank's part of the datasets
+        n_local = len(trg_pos)
+        local_group_counts = np.array([np.count_nonzero(edge_groups == g) for g in range(n_groups)], dtype=np.int64)
+        row_offset = comm.exscan(n_local) or 0
+        group_offsets = comm.exscan(local_group_counts)
+        group_offsets = np.zeros(n_groups, dtype=np.int64) if group_offsets is None else group_offsets
+        group_totals = np.zeros(n_groups, dtype=np.int64)
+        comm.Allreduce(local_group_counts, group_totals, op=MPI.SUM)
+
+        edge_group_index = np.zeros(n_local, dtype=np.uint32)
+        for group_id in range(n_groups):
+            group_mask = edge_groups == group_id
+            edge_group_index[group_mask] = group_offsets[group_id] + np.arange(local_group_counts[group_id])
+
+        local_ptrs = row_offset + np.concatenate(([0], np.cumsum(np.bincount(trg_pos - bounds[rank],
+                                                                              minlength=bounds[rank+1]-bounds[rank]))))
+
+        # all ranks need to agree on the dtypes of the property datasets
+        for group_id in range(n_groups):
+            for name, vals in group_values[group_id].items():
+                dtype = group_dtypes[group_id].get(name, None)
+                if dtype is None and len(vals) > 0:
+                    dtype = np.array(vals.tolist()).dtype
+                group_values[group_id][name] = np.array(vals.tolist(), dtype=dtype) if len(vals) > 0 else None
+                local_dtype = None if len(vals) == 0 else group_values[group_id][name].dtype.str
+                dtypes = [np.dtype(dt) for dt in comm.allgather(local_dtype) if dt is not None]
+                group_dtypes[group_id][name] = np.result_type(*dtypes) if dtypes else np.float64
+
+        datasets = [('target_gid', trg_gids, 'uint64', total_edges, row_offset),
+                    ('source_gid', src_gids, 'uint64', total_edges, row_offset),
+                    ('edge_group', edge_groups, 'uint16', total_edges, row_offset),
+                    ('edge_group_index', edge_group_index, 'uint32', total_edges, row_offset),
+                    ('edge_type_id', edge_type_ids, 'uint32', total_edges, row_offset),
+                    ('index_pointer', local_ptrs if rank == nprocs - 1 else local_ptrs[:-1], 'uint32', n_targets+1,
+                     bounds[rank])]
+        for group_id in range(n_groups):
+            for name in group_columns[group_id]:
+                datasets.append(('{}/{}'.format(group_id, name), group_values[group_id][name],
+                                 group_dtypes[group_id][name], group_totals[group_id], group_offsets[group_id]))
+
+        if h5py.get_config().mpi:
+            # Parallel HDF5 does not support compression filters for independent writes
+            if compression is not None and rank == 0:
+                warnings.warn('Compression "{}" is not supported when writing edges with the mpio driver, {} will be '
+                              'saved uncompressed.'.format(compression, edges_file_name))
+            with h5py.File(edges_file_name, 'w', driver='mpio', comm=comm) as hf:
+                for name, data, dtype, total_size, offset in datasets:
+                    ds = hf.create_dataset('edges/' + name, shape=(total_size,), dtype=dtype,
+                                           **dataset_options((total_size,), chunk_size))
+                    if data is not None and len(data) > 0:
+                        ds[offset:offset+len(data)] = data
                 hf['edges/target_gid'].attrs['network'] = trg_network
-                hf.create_dataset('edges/source_gid', data=src_gids_ds, dtype='uint64')
                 hf['edges/source_gid'].attrs['network'] = src_network
 
-                hf.create_dataset('edges/edge_group', data=edge_group_ds, dtype='uint16')
-                hf.create_dataset('edges/edge_group_index', data=edge_group_index_ds, dtype='uint32')
-                hf.create_dataset('edges/edge_type_id', data=edge_type_id_ds, dtype='uint32')
-                hf.create_dataset('edges/index_pointer', data=index_pointer_ds, dtype='uint32')
+        else:
+            shard_file_name = '{}.{}'.format(edges_file_name, rank)
+            with h5py.File(shard_file_name, 'w') as shard:
+                for name, data, dtype, total_size, offset in datasets:
+                    ds = shard.create_dataset(name, data=data if data is not None else np.zeros(0, dtype=dtype),
+                                              dtype=dtype)
+                    ds.attrs['offset'] = offset
+            comm.Barrier()
 
-                for gid, group in eg_table.items():
-                    for col_key, col_ds in group.items():
-                        ds_loc = 'edges/{}/{}'.format(gid, col_key)
-                        hf.create_dataset(ds_loc, data=col_ds)
+            if rank == 0:
+                with h5py.File(edges_file_name, 'w') as hf:
+                    for name, data, dtype, total_size, offset in datasets:
+                        hf.create_dataset('edges/' + name, shape=(total_size,), dtype=dtype,
+                                          **dataset_options((total_size,), chunk_size, compression, compression_opts))
+                    hf['edges/target_gid'].attrs['network'] = trg_network
+                    hf['edges/source_gid'].attrs['network'] = src_network
+
+                    for r in range(nprocs):
+                        rank_shard_name = '{}.{}'.format(edges_file_name, r)
+                        with h5py.File(rank_shard_name, 'r') as shard:
+                            for name, data, dtype, total_size, offset in datasets:
+                                shard_ds = shard[name]
+                                if len(shard_ds) > 0:
+                                    shard_offset = shard_ds.attrs['offset']
+                                    hf['edges/' + name][shard_offset:shard_offset+len(shard_ds)] = shard_ds[()]
+                        os.remove(rank_shard_name)
 
         comm.Barrier()
 
@@ -172,3 +403,10 @@ class MPINetwork(DenseNetwork):
             self._edge_assignment.append(r[1])
             heappush(rank_heap, (r[0] + cm.max_connections(), r[1]))
 
+
+def _cm_property_names(connection_map):
+    """List of the edge-group columns of a connection-map"""
+    names = []
+    for param in connection_map.params:
+        names += param.names if isinstance(param.names, (list, tuple)) else [param.names]
+    return names or ['nsyns']
@@ -24,8 +24,248 @@
 # SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-#
-from bmtk.builder.network import Network
+import numpy as np
+
+from dm_network import DenseNetwork
+from bmtk.builder.edge import Edge
+
+
+class SparseNetwork(DenseNetwork):
+    """Network builder that stores the edges of every connection map in a compressed sparse (by target) format.
+
+    Unlike the DenseNetwork, which allocates a sources x targets matrix for every connection map, memory use scales with
+    the number of connections. Nodes are handled the same as in the DenseNetwork.
+    """
+    def __init__(self, name, **network_props):
+        super(SparseNetwork, self).__init__(name, **network_props or {})
+        self._edge_tables = []
+
+    def edges_table(self):
+        return self._edge_tables
+
+    def _add_edges(self, connection_map, i):
+        syn_table = self.EdgeTable(connection_map)
+        if connection_map.is_vectorized:
+            for src_block, trg_block, nsyns in connection_map.connection_blocks():
+                syn_table.set_block(src_block, trg_block, nsyns)
+        else:
+            for con in connection_map.connection_itr():
+                if con[2] is not None:
+                    syn_table[con[0], con[1]] = con[2]
+        syn_table.finalize()
+
+        target_net = connection_map.target_nodes
+        self._target_networks[target_net.network_name] = target_net.network
+
+        nsyns = syn_table.nsyns_total
+        self._nedges += int(nsyns)
+        edge_table = {'syn_table': syn_table,
+                      'nsyns': nsyns,
+                      'edge_types': connection_map.edge_type_properties,
+                      'edge_type_id': connection_map.edge_type_properties['edge_type_id'],
+                      'source_network': connection_map.source_nodes.network_name,
+                      'target_network': connection_map.target_nodes.network_name,
+                      'params': {},
+                      'params_dtypes': {},
+                      'source_query': connection_map.source_nodes.filter_str,
+                      'target_query': connection_map.target_nodes.filter_str}
+
+        if connection_map.params:
+            # Property values are stored one per synapse in the same (target-major) order as the table. But the rules
+            # are called in source-major order so that random rules give the same results as the DenseNetwork.
+            source_nodes = list(connection_map.source_nodes)
+            target_nodes = list(connection_map.target_nodes)
+            src_indices, trg_indices, pair_nsyns = syn_table.pairs()
+            syn_offsets = syn_table.synapse_offsets()
+            src_major_order = np.lexsort((trg_indices, src_indices))
+
+        for param in connection_map.params:
+            rule = param.rule
+            param_names = param.names
+            edge_table['params_dtypes'].update(param.dtypes)
+            multi_params = isinstance(param_names, (list, tuple))
+            names = param_names if multi_params else [param_names]
+            prop_arrays = [np.empty(nsyns, dtype=object) for _ in names]
+            for pair_indx in src_major_order:
+                source = source_nodes[src_indices[pair_indx]]
+                target = target_nodes[trg_indices[pair_indx]]
+                syn_indx = int(syn_offsets[pair_indx])
+                for _ in range(pair_nsyns[pair_indx]):
+                    pvals = rule(source, target)
+                    if multi_params:
+                        for prop_array, val in zip(prop_arrays, pvals):
+                            prop_array[syn_indx] = val
+                    else:
+                        prop_arrays[0][syn_indx] = pvals
+                    syn_indx += 1
+
+            for name, prop_array in zip(names, prop_arrays):
+                edge_table['params'][name] = prop_array
+
+        self._edge_tables.append(edge_table)
+
+    def edges_iter(self, trg_gids, src_network=None, trg_network=None):
+        matching_edge_tables = self._edge_tables
+        if trg_network is not None:
+            matching_edge_tables = [et for et in matching_edge_tables if et['target_network'] == trg_network]
+
+        if src_network is not None:
+            matching_edge_tables = [et for et in matching_edge_tables if et['source_network'] == src_network]
+
+        for trg_gid in trg_gids:
+            for ets in matching_edge_tables:
+                syn_table = ets['syn_table']
+                if not syn_table.has_target(trg_gid):
+                    continue
+
+                params = ets['params']
+                for src_id, nsyns, syn_indx in syn_table.trg_itr(trg_gid, synapse_offsets=True):
+                    if params:
+                        for syn_i in range(syn_indx, syn_indx + nsyns):
+                            syn_prop = {name: prop_array[syn_i] for name, prop_array in params.items()}
+                            yield Edge(src_gid=src_id, trg_gid=trg_gid, edge_type_props=ets['edge_types'],
+                                       syn_props=syn_prop)
+                    else:
+                        yield Edge(src_gid=src_id, trg_gid=trg_gid, edge_type_props=ets['edge_types'],
+                                   syn_props={'nsyns': nsyns})
+
+    def _synapse_params(self, edge_table):
+        # properties are already stored in target-major order
+        return edge_table['params']
+
+    def _clear(self):
+        super(SparseNetwork, self)._clear()
+        self._edge_tables = []
+
+    class EdgeTable(object):
+        """Number of synapses between the sources and targets of a connection map, stored in CSR format with the targets
+        as the rows.
+
+        Connections are added incrementally in (source, target, nsyns) triplets or blocks, then finalize() must be
+        called before the table can be queried. Each source/target pair should only be set once.
+        """
+        buffer_size = 2**16
+
+        def __init__(self, connection_map):
+            src_ids = [n.node_id for n in connection_map.source_nodes]
+            self.__idx2src = np.array(src_ids, dtype=np.uint64)
+            self.__src2idx = {node_id: i for i, node_id in enumerate(src_ids)}
+
+            trg_ids = [n.node_id for n in connection_map.target_nodes]
+            self.__idx2trg = np.array(trg_ids, dtype=np.uint64)
+            self.__trg2idx = {node_id: i for i, node_id in enumerate(trg_ids)}
+
+            self._coo_chunks = []  # list of (source indices, target indices, nsyns) arrays
+            self._coo_buffer = ([], [], [])
+
+            self._trg_ptr = None
+            self._src_indices = None
+            self._nsyns = None
+            self._syn_offsets = None
+
+        def __setitem__(self, key, value):
+            assert(len(key) == 2)
+            if not value:
+                return
+
+            self._coo_buffer[0].append(self.__src2idx[key[0]])
+            self._coo_buffer[1].append(self.__trg2idx[key[1]])
+            self._coo_buffer[2].append(value)
+            if len(self._coo_buffer[0]) >= self.buffer_size:
+                self.__flush_buffer()
+
+        def __getitem__(self, item):
+            src_i = self.__src2idx[item[0]]
+            trg_i = self.__trg2idx[item[1]]
+            beg, end = self._trg_ptr[trg_i], self._trg_ptr[trg_i + 1]
+            pos = beg + np.searchsorted(self._src_indices[beg:end], src_i)
+            if pos < end and self._src_indices[pos] == src_i:
+                return self._nsyns[pos]
+            return 0
+
+        def set_block(self, src_block, trg_block, nsyns):
+            """Adds a block of the connection matrix, where src_block and trg_block index the source and target nodes
+            in the same order as the connection map. nsyns is either a (sources x targets) array or a tuple of (source
+            indices, target indices, nsyns) arrays, with the indices relative to the block.
+            """
+            if isinstance(nsyns, tuple):
+                src_i, trg_i, nsyns = (np.asarray(a) for a in nsyns)
+                connected = nsyns != 0
+                src_i, trg_i, nsyns = src_i[connected], trg_i[connected], nsyns[connected]
+            else:
+                nsyns = np.asarray(nsyns)
+                src_i, trg_i = np.nonzero(nsyns)
+                nsyns = nsyns[src_i, trg_i]
+
+            src_offset = src_block.start or 0
+            trg_offset = trg_block.start or 0
+            self._coo_chunks.append((src_i + src_offset, trg_i + trg_offset, nsyns))
+
+        def __flush_buffer(self):
+            if self._coo_buffer[0]:
+                self._coo_chunks.append(tuple(np.array(b) for b in self._coo_buffer))
+                self._coo_buffer = ([], [], [])
+
+        def finalize(self):
+            """Converts the added connections into CSR format."""
+            self.__flush_buffer()
+            if self._coo_chunks:
+                src_indices = np.concatenate([c[0] for c in self._coo_chunks]).astype(np.uint32)
+                trg_indices = np.concatenate([c[1] for c in self._coo_chunks]).astype(np.uint32)
+                nsyns = np.concatenate([c[2] for c in self._coo_chunks]).astype(np.uint32)
+            else:
+                src_indices = trg_indices = nsyns = np.zeros(0, dtype=np.uint32)
+            self._coo_chunks = []
+
+            order = np.lexsort((src_indices, trg_indices))
+            self._src_indices = src_indices[order]
+            self._nsyns = nsyns[order]
+            self._trg_ptr = np.zeros(len(self.__idx2trg) + 1, dtype=np.int64)
+            self._trg_ptr[1:] = np.cumsum(np.bincount(trg_indices, minlength=len(self.__idx2trg)))
+            self._syn_offsets = np.zeros(len(self._nsyns), dtype=np.int64)
+            self._syn_offsets[1:] = np.cumsum(self._nsyns)[:-1]
+
+        def has_target(self, node_id):
+            return node_id in self.__trg2idx
+
+        @property
+        def nsyns_total(self):
+            return int(np.sum(self._nsyns))
+
+        @property
+        def nconnections(self):
+            return len(self._nsyns)
+
+        @property
+        def target_ids(self):
+            return self.__idx2trg
+
+        @property
+        def source_ids(self):
+            return self.__idx2src
+
+        def pairs(self):
+            """Returns the source indices, target indices and nsyns of every connected pair, ordered by target."""
+            trg_indices = np.repeat(np.arange(len(self.__idx2trg)), np.diff(self._trg_ptr))
+            return self._src_indices, trg_indices, self._nsyns
+
+        def pair_ids(self):
+            """Same as pairs() but returns source and target node_ids instead of table indices."""
+            src_indices, trg_indices, nsyns = self.pairs()
+            return self.__idx2src[src_indices], self.__idx2trg[trg_indices], nsyns
+
+        def synapse_offsets(self):
+            """For every connected pair returns the index of its first synapse, when synapses are ordered by target."""
+            return self._syn_offsets
 
-class SparseNetwork(Network):
-    pass
\ No newline at end of file
+        def trg_itr(self, trg_id, synapse_offsets=False):
+            trg_i = self.__trg2idx[trg_id]
+            beg, end = int(self._trg_ptr[trg_i]), int(self._trg_ptr[trg_i + 1])
+            src_ids = self.__idx2src[self._src_indices[beg:end]].tolist()
+            nsyns = self._nsyns[beg:end].tolist()
+            if synapse_offsets:
+                for src_id, n, syn_indx in zip(src_ids, nsyns, self._syn_offsets[beg:end].tolist()):
+                    yield src_id, n, syn_indx
+            else:
+                for src_id, n in zip(src_ids, nsyns):
+                    yield src_id, n
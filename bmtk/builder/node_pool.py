@@ -26,6 +26,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 from ast import literal_eval
+import numpy as np
 
 
 class NodePool(object):
@@ -35,9 +36,13 @@ class NodePool(object):
     saved by the network, this just stores the query information and provides iterator methods for accessing different
     nodes.
 
-    TODO:
-    * Implement a collection-set algebra including | and not operators. ie.
+    The query is resolved against the network's node table the first time the pool is used, and the matching rows are
+    cached until the network's nodes are rebuilt. Pools from the same network can be combined using set operations:
         nodes = net.nodes(type=1) | net.nodes(type=2)
+        nodes = net.nodes(ei='e') & net.nodes(location='VisL4')
+        nodes = net.nodes(ei='e') - net.nodes(model_type='biophysical')
+
+    TODO:
     * Implement operators on properties
         nodes = net.nodes(val) > 100
         nodes = 100 in net.nodes(val)
@@ -47,12 +52,18 @@ class NodePool(object):
         self.__network = network
         self.__properties = properties
         self.__filter_str = None
+        self.__combine = None  # (set function, left pool, right pool) for pools created from set operations
+
+        self.__node_table = None
+        self.__rows = None
 
     def __len__(self):
-        return sum(1 for _ in self)
+        return len(self.__resolve()[1])
 
     def __iter__(self):
-        return (n for n in self.__network.nodes_iter() if self.__query_object_properties(n, self.__properties))
+        node_table, rows = self.__resolve()
+        nodes = node_table.nodes
+        return (nodes[r] for r in rows)
 
     @property
     def network(self):
@@ -62,6 +73,12 @@ class NodePool(object):
     def network_name(self):
         return self.__network.name
 
+    @property
+    def node_ids(self):
+        """numpy array of the node_ids in the pool, in the same order as the pool is iterated."""
+        node_table, rows = self.__resolve()
+        return node_table.node_ids[rows]
+
     @property
     def filter_str(self):
         if self.__filter_str is None:
@@ -79,32 +96,85 @@ class NodePool(object):
 
     @classmethod
     def from_filter(cls, network, filter_str):
+        """Rebuilds a node pool from its filter_str, including pools combined with |, & and -, which are written as
+        (left)|(right), (left)&(right) and (left)&~(right).
+        """
         assert(isinstance(filter_str, basestring))
         if len(filter_str) == 0 or filter_str == '*':
-            return cls(network, position=None)
+            return cls(network)
+
+        if filter_str.startswith('('):
+            left_end = _closing_paren(filter_str, 0)
+            for op_str, op_fnc in [('|', cls.__or__), ('&~', cls.__sub__), ('&', cls.__and__)]:
+                right_start = left_end + 1 + len(op_str)
+                if filter_str[left_end + 1:right_start] == op_str and filter_str[right_start:right_start + 1] == '(' \
+                        and _closing_paren(filter_str, right_start) == len(filter_str) - 1:
+                    left = cls.from_filter(network, filter_str[1:left_end])
+                    right = cls.from_filter(network, filter_str[right_start + 1:-1])
+                    return op_fnc(left, right)
+            raise Exception('Unable to parse node filter {}.'.format(filter_str))
 
         properties = {}
         for condtional in filter_str.split('&'):
             var, val = condtional.split('==')
             properties[var] = literal_eval(val)
-        return cls(network, position=None, **properties)
-
-    def __query_object_properties(self, obj, props):
-        if props is None:
-            return True
-
-        for k, v in props.iteritems():
-            ov = obj.get(k, None)
-            if ov is None:
-                return False
-
-            if hasattr(v, '__call__'):
-                if not v(ov):
-                    return False
-            elif isinstance(v, list):
-                if ov not in v:
-                    return False
-            elif ov != v:
-                return False
-
-        return True
+        return cls(network, **properties)
+
+    def __or__(self, other):
+        return self.__combine_pools(other, np.union1d, '|')
+
+    def __and__(self, other):
+        return self.__combine_pools(other, np.intersect1d, '&')
+
+    def __sub__(self, other):
+        return self.__combine_pools(other, np.setdiff1d, '&~')
+
+    def __combine_pools(self, other, set_fnc, op_str):
+        if not isinstance(other, NodePool):
+            return NotImplemented
+
+        if other.network is not self.network:
+            raise Exception('Unable to combine nodes from networks {} and {}.'.format(self.network_name,
+                                                                                     other.network_name))
+
+        pool = NodePool(self.__network)
+        pool.__combine = (set_fnc, self, other)
+        pool.__filter_str = '({}){}({})'.format(self.filter_str, op_str, other.filter_str)
+        return pool
+
+    def _rows(self, node_table):
+        """Sorted rows of the network's node table that are part of the pool."""
+        if self.__node_table is not node_table:
+            if self.__combine is not None:
+                set_fnc, left, right = self.__combine
+                self.__rows = set_fnc(left._rows(node_table), right._rows(node_table))
+            else:
+                self.__rows = node_table.query(**self.__properties)
+            self.__node_table = node_table
+
+        return self.__rows
+
+    def __resolve(self):
+        node_table = self.__network.node_table
+        return node_table, self._rows(node_table)
+
+
+def _closing_paren(filter_str, open_index):
+    """Returns the index of the parenthesis that closes the one at open_index, ignoring any inside quoted values."""
+    depth = 0
+    quote = None
+    for i in xrange(open_index, len(filter_str)):
+        c = filter_str[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+
+    raise Exception('Unable to parse node filter {}, unbalanced parentheses.'.format(filter_str))
@@ -0,0 +1,137 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import numbers
+import numpy as np
+
+
+class NodeTable(object):
+    """Column oriented table of all the nodes in a network, used for quickly resolving node queries.
+
+    Each node property is converted into a column on first use. Equality and membership queries on a column are
+    resolved with either a sorted index (numeric columns) or a hash index (everything else), so a query only needs to
+    scan the nodes once per column rather than once per query. Query results are the (sorted) rows of the matching
+    nodes.
+    """
+    def __init__(self, nodes):
+        self._nodes = list(nodes)
+        self._node_ids = np.array([n.node_id for n in self._nodes], dtype=np.int64)
+        self._columns = {}  # property name --> list of values, None if node doesn't have property
+        self._hash_indices = {}  # property name --> {value: rows}, or None if values aren't hashable
+        self._sorted_indices = {}  # property name --> (sorted values, rows), or None if column isn't numeric
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @property
+    def node_ids(self):
+        return self._node_ids
+
+    def column(self, key):
+        if key not in self._columns:
+            self._columns[key] = [n.get(key, None) for n in self._nodes]
+        return self._columns[key]
+
+    def hash_index(self, key):
+        """Returns a dictionary mapping each (non-None) value of a property to the rows containing it."""
+        if key not in self._hash_indices:
+            index = {}
+            try:
+                for row, val in enumerate(self.column(key)):
+                    if val is not None:
+                        index.setdefault(val, []).append(row)
+                self._hash_indices[key] = {val: np.array(rows, dtype=np.int64) for val, rows in index.items()}
+            except TypeError:
+                # unhashable values like lists or arrays
+                self._hash_indices[key] = None
+
+        return self._hash_indices[key]
+
+    def sorted_index(self, key):
+        """For numeric properties returns a tuple (sorted values, rows), otherwise None"""
+        if key not in self._sorted_indices:
+            self._sorted_indices[key] = None
+            column = self.column(key)
+            rows = np.array([row for row, val in enumerate(column) if val is not None], dtype=np.int64)
+            if len(rows) > 0 and all(_is_number(column[r]) for r in rows):
+                values = np.array([column[r] for r in rows])
+                order = np.argsort(values, kind='mergesort')
+                self._sorted_indices[key] = (values[order], rows[order])
+
+        return self._sorted_indices[key]
+
+    def query(self, **properties):
+        """Returns the sorted rows of all nodes that match every property. A property value may be a literal, a list of
+        accepted values or a function that returns True for accepted values.
+        """
+        rows = np.arange(len(self._nodes), dtype=np.int64)
+        for key, val in properties.items():
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, self._query_column(key, val), assume_unique=True)
+        return rows
+
+    def _query_column(self, key, val):
+        sorted_index = self.sorted_index(key)
+        if sorted_index is not None and not hasattr(val, '__call__'):
+            sorted_vals, sorted_rows = sorted_index
+            accepted = [v for v in (val if isinstance(val, list) else [val]) if _is_number(v)]
+            matches = [sorted_rows[np.searchsorted(sorted_vals, v, side='left'):
+                                   np.searchsorted(sorted_vals, v, side='right')] for v in accepted]
+            return np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+
+        hash_index = self.hash_index(key)
+        if hash_index is not None:
+            if hasattr(val, '__call__'):
+                # only need to call the function once for every unique value
+                matches = [rows for v, rows in hash_index.items() if val(v)]
+            elif isinstance(val, list):
+                matches = [hash_index[v] for v in val if v in hash_index]
+            else:
+                matches = [hash_index[val]] if val in hash_index else []
+            return np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+
+        # unhashable values, check every node
+        column = self.column(key)
+        return np.array([row for row, ov in enumerate(column) if ov is not None and self._match(ov, val)],
+                        dtype=np.int64)
+
+    @staticmethod
+    def _match(ov, val):
+        if hasattr(val, '__call__'):
+            return bool(val(ov))
+        elif isinstance(val, list):
+            return ov in val
+        else:
+            return bool(np.all(ov == val))
+
+
+def _is_number(val):
+    return isinstance(val, numbers.Real) and not isinstance(val, (bool, np.bool_))
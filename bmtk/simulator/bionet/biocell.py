@@ -60,11 +60,7 @@ class BioCell(Cell):
         self._syn_seg_ix = []
         self._syn_sec_x = []
         self._edge_type_id = []
-
-        if calc_ecp:
-            self.im_ptr = h.PtrVector(self._nseg)  # pointer vector
-            self.im_ptr.ptr_update_callback(self.set_im_ptr)   # used for gathering an array of  i_membrane values from the pointer vector
-            self.imVec = h.Vector(self._nseg)
+        # the i_membrane_ of the segments (calc_ecp) are gathered by the EcpMod for all the cells of a rank at once
 
     def set_spike_detector(self, spike_threshold):
         nc = h.NetCon(self.hobj.soma[0](0.5)._ref_v, None, sec=self.hobj.soma[0])  # attach spike detector to cell
@@ -146,13 +142,68 @@ class BioCell(Cell):
 
         return 1
 
-    def _set_connections(self, edge_prop, src_node, syn_weight, stim=None):
-        tar_seg_ix, tar_seg_prob = self._morph.get_target_segments(edge_prop)
-        src_gid = src_node.node_id
-        nsyns = edge_prop.nsyns
+    def set_all_syn_connections(self, edges):
+        """Sets the synapses of all the incoming edges of the cell at once.
 
+        The target segments of every synapse are drawn up front (see _choose_segments), the synapses and NetCons are
+        then created edge by edge in the same order as calling set_syn_connection() for each edge.
+
+        :param edges: list of (edge_prop, src_node, stim) for each incoming edge, stim is None for recurrent edges.
+        :return: total number of synapses created.
+        """
+        segs_ix = self._choose_segments([edge_prop for edge_prop, _, _ in edges if not edge_prop.preselected_targets])
+
+        nsyns_total = 0
+        seg_offset = 0
+        for edge_prop, src_node, stim in edges:
+            syn_weight = edge_prop.weight(src_node, self._node)
+            if edge_prop.preselected_targets:
+                nsyns_total += self._set_connection_preselected(edge_prop, src_node, syn_weight, stim)
+            else:
+                nsyns = edge_prop.nsyns
+                self._add_synapses(edge_prop, src_node, syn_weight, segs_ix[seg_offset:seg_offset+nsyns], stim)
+                seg_offset += nsyns
+                nsyns_total += nsyns
+
+        return nsyns_total
+
+    def _choose_segments(self, edge_props):
+        """Chooses the target segments for the synapses of a list of edges, with probability proportional to the
+        length of each segment within the targeted sections/distance range of the edge-type.
+
+        Uses a single draw of uniform numbers for all the synapses, and one search per edge-type. These are the same
+        numbers and operations prng.choice(tar_seg_ix, nsyns, p=tar_seg_prob) uses when called edge by edge, so the
+        chosen segments stay the same for a given gid.
+        """
+        nsyns = np.array([edge_prop.nsyns for edge_prop in edge_props], dtype=np.int64)
+        uniform_samples = self.prng.random_sample(nsyns.sum())
+        segs_ix = np.zeros(len(uniform_samples), dtype=np.int64)
+        if len(uniform_samples) == 0:
+            return segs_ix
+
+        _, first_edges, edge_types = np.unique([edge_prop.edge_type_id for edge_prop in edge_props], return_index=True,
+                                               return_inverse=True)
+        syn_types = np.repeat(edge_types, nsyns)  # edge-type index of every synapse
+        for type_index, edge_index in enumerate(first_edges):
+            tar_seg_ix, tar_seg_prob = self._morph.get_target_segments(edge_props[edge_index])
+            if len(tar_seg_ix) == 0:
+                raise Exception('No target segments found on cell {} for edge-type {}.'.format(
+                    self.gid, edge_props[edge_index].edge_type_id))
+
+            cdf = tar_seg_prob.cumsum()
+            cdf /= cdf[-1]
+            type_syns = syn_types == type_index
+            segs_ix[type_syns] = tar_seg_ix[cdf.searchsorted(uniform_samples[type_syns], side='right')]
+        return segs_ix
+
+    def _set_connections(self, edge_prop, src_node, syn_weight, stim=None):
         # choose nsyn elements from seg_ix with probability proportional to segment area
-        segs_ix = self.prng.choice(tar_seg_ix, nsyns, p=tar_seg_prob)
+        segs_ix = self._choose_segments([edge_prop])
+        return self._add_synapses(edge_prop, src_node, syn_weight, segs_ix, stim)
+
+    def _add_synapses(self, edge_prop, src_node, syn_weight, segs_ix, stim=None):
+        src_gid = src_node.node_id
+        nsyns = len(segs_ix)
         secs = self._secs[segs_ix]  # sections where synapases connect
         xs = self._morph.seg_prop['x'][segs_ix]  # distance along the section where synapse connects, i.e., seg_x
 
@@ -233,19 +284,6 @@ class BioCell(Cell):
         self._syn_seg_ix = []
         self._syn_sec_x = []
 
-    def set_im_ptr(self): 
-        """Set PtrVector to point to the i_membrane_"""
-        jseg = 0
-        for sec in self.hobj.all:  
-            for seg in sec:    
-                self.im_ptr.pset(jseg,seg._ref_i_membrane_)  # notice the underscore at the end
-                jseg += 1
-
-    def get_im(self):
-        """Gather membrane currents from PtrVector into imVec (does not need a loop!)"""
-        self.im_ptr.gather(self.imVec)
-        return self.imVec.as_numpy()  # (nA)
-
     def print_synapses(self):
         rstr = ''
         for i in xrange(len(self._syn_src_gid)):
@@ -27,14 +27,18 @@
 #
 import os
 import h5py
-import csv
+import numpy as np
 import pandas as pd
 
 from bmtk.simulator.bionet.lifcell import LIFCell
 from bmtk.simulator.bionet.biocell import BioCell
 from bmtk.simulator.bionet.stim import Stim
 from bmtk.simulator.bionet.morphology import Morphology
+from bmtk.simulator.bionet.morphology_cache import MorphologyCache
 from bmtk.simulator.bionet import nrn, io
+from bmtk.simulator.bionet import load_balance as lb
+from bmtk.simulator.bionet.profiler import Profiler
+from bmtk.simulator.utils.load_spikes import SpikeTrainsTable
 from bmtk.simulator.bionet.property_schemas import CellTypes
 import bmtk.simulator.bionet.config as cfg
 
@@ -80,6 +84,8 @@ class BioNetwork(object):
         self._cells = {}  # table of Cell-Type objects searchable by gid
 
         self.__morphologies_cache = {}  # Table of saved morphology files
+        self._morphology_cache = None  # on-disk cache of processed morphologies
+        self._morphology_keys = {}  # node_type_id --> key of morphologies not yet in the on-disk cache
         self._stims = {}  # dictionary of external/stim/virtual nodes by [network_name][gid]
         self._spike_trains_ds = {}  # save nwb spike-train datasets for when stims need to be built
         self._spike_trains_df = {}
@@ -88,6 +94,12 @@ class BioNetwork(object):
         self._save_connections = False
         self._total_synapses = 0
 
+        self._load_balance = 'lpt'  # how cells are split across ranks, 'lpt' or 'round_robin'
+        self._balance_file = None  # per-gid costs saved from a previous run
+        self._node_costs = None  # estimated cost of every cell on this rank, found when first needed
+
+        self._profiler = Profiler()  # wall-time and memory of each setup phase on this rank
+
     @property
     def spike_threshold(self):
         return self.__spike_threshold
@@ -121,6 +133,43 @@ class BioNetwork(object):
         # TODO: throw a warning if a user is trying to set save_connection = True after the network has been built
         self._save_connections = value
 
+    @property
+    def load_balance(self):
+        return self._load_balance
+
+    @load_balance.setter
+    def load_balance(self, value):
+        if value not in ['lpt', 'round_robin']:
+            raise Exception('Unknown load balancing method {}.'.format(value))
+        self._load_balance = value
+
+    @property
+    def balance_file(self):
+        return self._balance_file
+
+    @balance_file.setter
+    def balance_file(self, file_name):
+        self._balance_file = file_name
+
+    @property
+    def morphology_cache_dir(self):
+        return None if self._morphology_cache is None else self._morphology_cache.cache_dir
+
+    @morphology_cache_dir.setter
+    def morphology_cache_dir(self, cache_dir):
+        self._morphology_cache = None if cache_dir is None else MorphologyCache(cache_dir)
+
+    @property
+    def node_costs(self):
+        """Estimated cost of simulating each local cell, by gid."""
+        if self._node_costs is None:
+            self._node_costs = self._estimate_costs(self._local_nodes)
+        return self._node_costs
+
+    @property
+    def profiler(self):
+        return self._profiler
+
     @property
     def gids(self):
         return self._local_node_gids
@@ -139,7 +188,25 @@ class BioNetwork(object):
 
     def build_cells(self):
         """Instantiate cells based on parameters provided in the InternalCell table and Internal CellModel table"""
-        self._select_local_nodes()
+        with self._profiler.phase('select_local_nodes'):
+            self._select_local_nodes()
+
+        with self._profiler.phase('create_cells'):
+            self._create_cells()
+        pc.barrier()  # wait for all hosts to get to this point
+
+        with self._profiler.phase('make_morphologies'):
+            self.make_morphologies()
+        with self._profiler.phase('set_seg_props'):
+            self.set_seg_props()  # set segment properties by creating Morphologies
+        # self.set_tar_segs()  # set target segments needed for computing the synaptic innervations
+        with self._profiler.phase('calc_seg_coords'):
+            self.calc_seg_coords()  # use for computing the ECP
+        if self._morphology_cache is not None:
+            self.save_morphology_cache()
+        self._cells_built = True
+
+    def _create_cells(self):
         for node in self._local_nodes:
             gid = node.node_id
 
@@ -160,13 +227,6 @@ class BioNetwork(object):
                 nrn.quit_execution()
 
             # TODO: Add ability to easily extend the Cell-Types without hardcoding into this loop!!
-        pc.barrier()  # wait for all hosts to get to this point
-
-        self.make_morphologies()
-        self.set_seg_props()  # set segment properties by creating Morphologies
-        # self.set_tar_segs()  # set target segments needed for computing the synaptic innervations
-        self.calc_seg_coords()  # use for computing the ECP
-        self._cells_built = True
 
     def save_gids(self, gid_list):
         """List of cell GIDs whose variables (besides spikes) will be saved to h5.
@@ -180,10 +240,27 @@ class BioNetwork(object):
 
     def _select_local_nodes(self):
         """Divide all possible nodes among the various ranks (machines) for MPI usage. For single-processor simulation
-        all nodes will be local."""
+        all nodes will be local.
+
+        By default nodes are split so that the estimated cost of each rank is about the same (see load_balance.py),
+        using the costs from balance_file when available.
+        """
         all_nodes = self._graph.get_internal_nodes()
-        for node in all_nodes[rank::nhost]:
+        if nhost == 1:
+            # every node is local, the costs are only estimated if needed by save_balance_file()
+            local_nodes = all_nodes
+        elif self._load_balance == 'round_robin':
             # Simple round-robin spliting of nodes. i.e. Machine i of N will have nodes i, i+N, i+2N, etc.
+            local_nodes = all_nodes[rank::nhost]
+        else:
+            costs = self._estimate_costs(all_nodes)
+            if self._balance_file is not None and os.path.exists(self._balance_file):
+                costs = lb.merge_costs(costs, lb.load_costs(self._balance_file))
+            local_gids = set(lb.lpt_partition(costs, nhost)[rank])
+            local_nodes = [node for node in all_nodes if node.node_id in local_gids]
+            self._node_costs = {gid: costs[gid] for gid in local_gids}
+
+        for node in local_nodes:
             self._local_nodes.append(node)
             self._local_node_gids.append(node.node_id)
 
@@ -193,6 +270,63 @@ class BioNetwork(object):
             else:
                 self._local_node_types[node.node_type_id] = [node]
 
+    def _estimate_costs(self, nodes):
+        """Estimates the cost of simulating each node from its number of compartments and incoming edges."""
+        # number of incoming edges of each gid, across all the edges files
+        target_counts = np.zeros(0, dtype=np.int64)
+        for src_network in self._graph.networks:
+            for trg_network in self._graph.internal_networks():
+                edges = self._graph.edges_table(trg_network, src_network)
+                if edges is None:
+                    continue
+                try:
+                    counts = edges.target_counts()
+                except NotImplementedError:
+                    continue
+                if len(counts) > len(target_counts):
+                    target_counts = np.concatenate((target_counts, np.zeros(len(counts) - len(target_counts),
+                                                                            dtype=np.int64)))
+                target_counts[:len(counts)] += counts
+
+        ncompartments = {}  # by morphology file
+        costs = {}
+        for node in nodes:
+            gid = node.node_id
+            cost = lb.COST_WEIGHTS['synapse']*(target_counts[gid] if gid < len(target_counts) else 0)
+            if node.cell_type == CellTypes.Biophysical:
+                morphology_file = node.morphology_file
+                if morphology_file not in ncompartments:
+                    ncompartments[morphology_file] = lb.swc_ncompartments(morphology_file, self.dL)
+                cost += lb.COST_WEIGHTS['segment']*ncompartments[morphology_file]
+            elif node.cell_type == CellTypes.Point:
+                cost += lb.COST_WEIGHTS['point']
+            costs[gid] = cost
+
+        return costs
+
+    def save_balance_file(self, file_name, comptime):
+        """Saves the cost of each cell, calibrated with the measured compute time of each rank, so the nodes can be
+        better distributed in the next run. Must be called by every rank.
+
+        Cells are not timed individually. The saved cost of each cell is its estimated cost scaled so that the costs of
+        all the cells of a rank add up to the compute time of the rank, so only the relative cost of the ranks is
+        measured.
+
+        :param file_name: path of the balance file.
+        :param comptime: time spent integrating the cells on this rank, eg pc.step_time().
+        """
+        node_costs = self.node_costs
+        total_cost = sum(node_costs.values())
+        scale = comptime/total_cost if total_cost > 0 else 0.0
+        measured = {gid: cost*scale for gid, cost in node_costs.items()}
+        all_measured = pc.py_gather(measured, 0)
+        if rank == 0:
+            costs = {}
+            for rank_costs in all_measured:
+                costs.update(rank_costs)
+            lb.save_costs(file_name, costs)
+        pc.barrier()
+
     def make_morphologies(self):
         """Creating a Morphology object for each biophysical model"""
         for node in self._local_nodes:
@@ -209,6 +343,8 @@ class BioNetwork(object):
                 else:
                     hobj = self._cells[node.node_id].hobj  # get hoc object (hobj) from the first cell with a new morphologys
                     morph = Morphology(hobj)
+                    if self._morphology_cache is not None:
+                        self._load_cached_morphology(node, morph)
 
                     # associate morphology with a cell
                     self._cells[node.node_id].set_morphology(morph)
@@ -219,17 +355,43 @@ class BioNetwork(object):
         io.print2log0("    Created morphologies")
         self._morphologies_built = True
 
+    def _load_cached_morphology(self, node, morph):
+        """Sets the segment properties and coordinates of a morphology from the on-disk cache, if they have been saved
+        by a previous run, otherwise keep the key so they can be saved once calculated."""
+        model_type = self._graph.property_schema.model_type(node)
+        key = self._morphology_cache.key(node.morphology_file, self.dL, model_type)
+        cached = self._morphology_cache.load(key)
+        if cached is None:
+            self._morphology_keys[node.node_type_id] = key
+            return
+
+        try:
+            morph.set_props(*cached)
+        except Exception:
+            # eg. the cell model function was changed without being renamed
+            self._morphology_keys[node.node_type_id] = key
+
+    def save_morphology_cache(self):
+        """Saves the segment properties and coordinates of the morphologies that were not in the on-disk cache"""
+        for node_type_id, key in self._morphology_keys.items():
+            morph = self.__morphologies_cache[node_type_id]
+            self._morphology_cache.save(key, morph.seg_prop, morph.seg_coords, morph.psoma)
+        self._morphology_keys = {}
+
     def set_seg_props(self):
         """Set morphological properties for biophysically (morphologically) detailed cells"""
         for _, morphology in self.__morphologies_cache.items():
-            morphology.set_seg_props()
+            if morphology.seg_prop is None:
+                morphology.set_seg_props()
 
         io.print2log0("    Set segment properties")
 
     def calc_seg_coords(self):
         """Needed for the ECP calculations"""
         for node_type_id, morphology in self.__morphologies_cache.items():
-            morph_seg_coords = morphology.calc_seg_coords()   # needed for ECP calculations
+            if morphology.seg_coords is None:
+                morphology.calc_seg_coords()  # needed for ECP calculations
+            morph_seg_coords = morphology.seg_coords
 
             for node in self._local_node_types[node_type_id]:
                 self._cells[node.node_id].calc_seg_coords(morph_seg_coords)
@@ -272,26 +434,51 @@ class BioNetwork(object):
 
             self._stims[network] = {}
             # Get a list of the external gid's that connect to cells on this node.
-            src_gids_set = set()
-            for trg_gid, trg_cell in self._cells.items():
-                # TODO: Create a function that can return a list of all src_gids
-                for trg_prop, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, network):
-                    src_gids_set.add(src_prop.node_id)  # TODO: just store the src_prop
+            src_gids = self._get_source_gids(network)
+
+            # Get the spike trains of each external node and create a Stim object. Spike trains from an nwb file are
+            # read all at once and each Stim is given a slice of the times array.
+            spike_trains = None
+            if network in self._spike_trains_ds:
+                spike_trains = SpikeTrainsTable.from_nwb(self._spike_trains_ds[network], src_gids)
 
-            # Get the spike trains of each external node and create a Stim object
-            for src_gid in src_gids_set:
+            for src_gid in src_gids:
                 src_prop = self._graph.get_node(src_gid, network)
-                spike_train = self._get_spike_trains(src_gid, network)
+                if spike_trains is not None:
+                    spike_train = spike_trains.get(src_gid)
+                else:
+                    spike_train = self._get_spike_trains(src_gid, network)
                 self._stims[network][src_gid] = Stim(src_prop, spike_train)
 
+    def _get_source_gids(self, network):
+        """Returns a sorted list of the gids in the source network that connect to any cell on this rank."""
+        local_gids = {}  # local gids for each target network
+        for node in self._local_nodes:
+            local_gids.setdefault(node.network, []).append(node.node_id)
+
+        src_gids_set = set()
+        for trg_network, trg_gids in local_gids.items():
+            edges = self._graph.edges_table(trg_network, network)
+            if edges is None:
+                continue
+            try:
+                src_gids_set.update(edges.source_gids(trg_gids).tolist())
+            except NotImplementedError:
+                for trg_gid in trg_gids:
+                    for trg_prop, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, network):
+                        src_gids_set.add(src_prop.node_id)
+
+        return sorted(src_gids_set)
+
     def set_recurrent_connections(self):
         self._init_connections()
         syn_counter = 0
         for src_network in self._graph.internal_networks():
             io.print2log0('    Setting connections from {}'.format(src_network))
             for trg_gid, trg_cell in self._cells.items():
-                for trg_prop, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, src_network):
-                    syn_counter += trg_cell.set_syn_connection(edge_prop, src_prop)
+                edges = [(edge_prop, src_prop, None)
+                         for _, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, src_network)]
+                syn_counter += trg_cell.set_all_syn_connections(edges)
         self._total_synapses += syn_counter
 
     def set_external_connections(self, source_network):
@@ -301,10 +488,10 @@ class BioNetwork(object):
         source_stims = self._stims[source_network]
         syn_counter = 0
         for trg_gid, trg_cell in self._cells.items():
-            for trg_prop, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, source_network):
-                # TODO: reimplement weight function if needed
-                stim = source_stims[src_prop.node_id]
-                syn_counter += trg_cell.set_syn_connection(edge_prop, src_prop, stim)
+            # TODO: reimplement weight function if needed
+            edges = [(edge_prop, src_prop, source_stims[src_prop.node_id])
+                     for _, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, source_network)]
+            syn_counter += trg_cell.set_all_syn_connections(edges)
         self._total_synapses += syn_counter
 
     def _init_connections(self):
@@ -319,30 +506,139 @@ class BioNetwork(object):
         for gid, cell in self.cells.items():
             cell.scale_weights(factor)
 
+    def _connections_table(self):
+        """Returns a table of the synapses of every cell on this rank, ordered by target gid."""
+        columns = ['trg_gid', 'src_gid', 'trg_network', 'src_network', 'segment', 'section', 'weight', 'delay',
+                   'edge_type_id', 'connection_group']
+        rows = [conn for gid in sorted(self._cells.keys()) for conn in self._cells[gid].get_connection_info()]
+        return pd.DataFrame(rows, columns=columns)
+
     def write_connections(self, output_dir, file_type='h5'):
-        # TODO: this doesn't work on multi-node simulations
-        assert(nhost == 1)
-
-        # first write to a temp csv file
-        tmp_csv_fname = os.path.join(output_dir, '.tmp_edges.csv')
-        with open(tmp_csv_fname, 'w') as csvhandle:
-            csvwriter = csv.writer(csvhandle, delimiter=' ')
-            csvwriter.writerow(['trg_gid', 'src_gid', 'trg_network', 'src_network', 'segment', 'section', 'weight',
-                                'delay', 'edge_type_id', 'connection_group'])
-            for _, cell in self._cells.items():
-                for conn in cell.get_connection_info():
-                    csvwriter.writerow(conn)
-
-        if file_type == 'csv':
+        """Saves the synapses of every cell into <output_dir>/<trg_network>_<src_network>_edges.h5, ordered by target
+        gid. Must be called by every rank."""
+        if file_type != 'h5':
             raise NotImplementedError()
 
-        elif file_type == 'h5':
-            # convert from csv to h5 format
-            from bmtk.simulator.bionet.utils import edge_converter_csv
-            edge_converter_csv(output_dir=output_dir, csv_file=tmp_csv_fname)
+        conns_df = self._connections_table()
+        local_pairs = set(zip(conns_df['trg_network'], conns_df['src_network']))
+        network_pairs = sorted(set().union(*pc.py_allgather(local_pairs)))
+        for trg_net, src_net in network_pairs:
+            pair_df = conns_df[(conns_df['trg_network'] == trg_net) & (conns_df['src_network'] == src_net)]
+            file_name = os.path.join(output_dir, '{}_{}_edges.h5'.format(trg_net, src_net))
+            self._write_edges_h5(file_name, pair_df)
+
+    def _write_edges_h5(self, file_name, edges_df):
+        """Writes the synapses of one pair of networks, edges_df must be ordered by target gid.
+
+        The synapses are first redistributed so that each rank holds all the synapses for a contiguous range of target
+        gids (balanced by number of synapses), after which every rank writes a single contiguous slice of each dataset.
+        The offsets of the slices are found with a prefix sum over the number of synapses (in each edge-group) of every
+        gid, gathered from all the ranks. If h5py is built with MPI support all the ranks write directly into the file,
+        otherwise each rank saves its slices into a temporary shard which rank 0 copies into the file.
+        """
+        n_groups = 2  # 0 - biophysical, 1 - point cells
+        columns = [('trg_gid', np.uint64), ('src_gid', np.uint64), ('edge_type_id', np.uint32),
+                   ('connection_group', np.uint16), ('segment', np.int64), ('section', np.float64),
+                   ('weight', np.float64), ('delay', np.float64)]
+        edges = {column: edges_df[column].values.astype(dtype) for column, dtype in columns}
+
+        # number of synapses in each edge-group of the local gids
+        gids, gid_index = np.unique(edges['trg_gid'], return_inverse=True)
+        group_counts = np.zeros((len(gids), n_groups), dtype=np.int64)
+        np.add.at(group_counts, (gid_index, edges['connection_group']), 1)
+
+        # prefix sums over the counts of all the gids, every gid is on a single rank
+        all_counts = pc.py_allgather((gids, group_counts))
+        all_gids = np.concatenate([c[0] for c in all_counts])
+        all_group_counts = np.concatenate([c[1] for c in all_counts]).reshape(-1, n_groups)
+        order = np.argsort(all_gids)
+        all_gids = all_gids[order]
+        cumulative_group_counts = np.vstack((np.zeros((1, n_groups), dtype=np.int64),
+                                             np.cumsum(all_group_counts[order], axis=0)))
+        cumulative_counts = cumulative_group_counts.sum(axis=1)
+        group_totals = cumulative_group_counts[-1]
+        total_rows = int(cumulative_counts[-1])
+
+        # split the gids into contiguous ranges with roughly the same number of synapses on every rank
+        splits = np.searchsorted(cumulative_counts[1:], np.arange(1, nhost)*(total_rows/float(nhost)), side='right')
+        bounds = np.concatenate(([0], np.minimum(splits, len(all_gids)), [len(all_gids)])).astype(np.int64)
+
+        if nhost > 1:
+            # send each rank the synapses of the gids in its range
+            row_bounds = np.searchsorted(np.searchsorted(all_gids, edges['trg_gid']), bounds)
+            outgoing = [{column: vals[row_bounds[r]:row_bounds[r+1]] for column, vals in edges.items()}
+                        for r in range(nhost)]
+            incoming = pc.py_alltoall(outgoing)
+            del outgoing
+            edges = {column: np.concatenate([chunk[column] for chunk in incoming]) for column, _ in columns}
+
+            # the synapses of a gid all come from one rank, a stable sort keeps them in their original order
+            order = np.argsort(edges['trg_gid'], kind='mergesort')
+            edges = {column: vals[order] for column, vals in edges.items()}
+
+        # offsets of this rank's slices of the datasets
+        row_offset = int(cumulative_counts[bounds[rank]])
+        group_offsets = cumulative_group_counts[bounds[rank]]
+        edge_groups = edges['connection_group']
+        edge_group_index = np.zeros(len(edge_groups), dtype=np.uint64)
+        for group_id in range(n_groups):
+            group_mask = edge_groups == group_id
+            edge_group_index[group_mask] = group_offsets[group_id] + np.arange(np.count_nonzero(group_mask))
+
+        # (name, data, dtype, size of the dataset, offset of the local rows)
+        datasets = [('target_gid', edges['trg_gid'], np.uint64, total_rows, row_offset),
+                    ('source_gid', edges['src_gid'], np.uint64, total_rows, row_offset),
+                    ('edge_type_id', edges['edge_type_id'], np.uint32, total_rows, row_offset),
+                    ('edge_group', edge_groups, np.uint16, total_rows, row_offset),
+                    ('edge_group_indicies', edge_group_index, np.uint64, total_rows, row_offset)]
+        group_columns = [[('sec_id', 'segment', np.int64), ('sec_x', 'section', np.float64),
+                          ('syn_weight', 'weight', np.float64), ('delay', 'delay', np.float64)],
+                         [('syn_weight', 'weight', np.float64), ('delay', 'delay', np.float64)]]
+        for group_id in range(n_groups):
+            if group_totals[group_id] == 0:
+                continue
+            group_mask = edge_groups == group_id
+            for name, column, dtype in group_columns[group_id]:
+                datasets.append(('{}/{}'.format(group_id, name), edges[column][group_mask], dtype,
+                                 int(group_totals[group_id]), int(group_offsets[group_id])))
+
+        if nhost == 1:
+            with h5py.File(file_name, 'w') as h5:
+                for name, data, dtype, _, _ in datasets:
+                    h5.create_dataset('edges/' + name, data=data.astype(dtype))
+
+        elif h5py.get_config().mpi:
+            from mpi4py import MPI
+            with h5py.File(file_name, 'w', driver='mpio', comm=MPI.COMM_WORLD) as h5:
+                for name, data, dtype, total_size, offset in datasets:
+                    ds = h5.create_dataset('edges/' + name, shape=(total_size,), dtype=dtype)
+                    if len(data) > 0:
+                        ds[offset:offset+len(data)] = data.astype(dtype)
 
-        # remove temp file
-        os.remove(tmp_csv_fname)
+        else:
+            shard_file_name = '{}.{}'.format(file_name, rank)
+            with h5py.File(shard_file_name, 'w') as shard:
+                for name, data, dtype, _, offset in datasets:
+                    shard_ds = shard.create_dataset(name, data=data.astype(dtype))
+                    shard_ds.attrs['offset'] = offset
+            pc.barrier()
+
+            if rank == 0:
+                with h5py.File(file_name, 'w') as h5:
+                    for name, _, dtype, total_size, _ in datasets:
+                        h5.create_dataset('edges/' + name, shape=(total_size,), dtype=dtype)
+
+                    for r in range(nhost):
+                        rank_shard_name = '{}.{}'.format(file_name, r)
+                        with h5py.File(rank_shard_name, 'r') as shard:
+                            for name, _, _, _, _ in datasets:
+                                shard_ds = shard[name]
+                                if len(shard_ds) > 0:
+                                    shard_offset = shard_ds.attrs['offset']
+                                    h5['edges/' + name][shard_offset:shard_offset+len(shard_ds)] = shard_ds[()]
+                        os.remove(rank_shard_name)
+
+        pc.barrier()
 
     @classmethod
     def from_config(cls, config_file, graph):
@@ -375,11 +671,18 @@ class BioNetwork(object):
             network.dL = run_dict['dL']
         if 'calc_ecp' in run_dict:
             network.calc_ecp = run_dict['calc_ecp']
+        if 'load_balance' in run_dict:
+            network.load_balance = run_dict['load_balance']
+        if 'balance_file' in run_dict:
+            network.balance_file = run_dict['balance_file']
+        if 'morphology_cache_dir' in run_dict:
+            network.morphology_cache_dir = run_dict['morphology_cache_dir']
 
         # build the cells
         network.save_connections = config['output'].get('save_synapses', False)
         io.print2log('Building cells...')
-        network.build_cells()
+        with network.profiler.phase('build_cells'):
+            network.build_cells()
 
         # list of cells who parameters will be saved to h5
         if 'node_id_selections' in config and 'save_cell_vars' in config['node_id_selections']:
@@ -400,18 +703,22 @@ class BioNetwork(object):
                 # TODO: Add Iclamp code.
 
             io.print2log0('    Setting up external cells...')
-            network.make_stims()
+            with network.profiler.phase('make_stims'):
+                network.make_stims()
         io.print2log0('Cells are built!')
 
-        for netname in graph.external_networks():
-            network.set_external_connections(netname)
+        with network.profiler.phase('set_external_connections'):
+            for netname in graph.external_networks():
+                network.set_external_connections(netname)
 
-        network.set_recurrent_connections()
+        with network.profiler.phase('set_recurrent_connections'):
+            network.set_recurrent_connections()
         io.print2log0('Network is built!')
 
         if network.save_connections:
             io.print2log0('Saving synaptic connections:')
-            network.write_connections(config['output']['output_dir'])
+            with network.profiler.phase('write_connections'):
+                network.write_connections(config['output']['output_dir'])
             io.print2log0('    Synaptic connections saved to {}.'.format(config['output']['output_dir']))
 
         return network
@@ -94,3 +94,8 @@ class Cell(object):
 
     def set_syn_connections(self, edge_prop, src_node, stim=None):
         raise NotImplementedError
+
+    def set_all_syn_connections(self, edges):
+        """Sets the synapses of all the incoming edges of the cell, a list of (edge_prop, src_node, stim). Returns
+        the number of synapses created."""
+        return sum(self.set_syn_connection(edge_prop, src_node, stim) for edge_prop, src_node, stim in edges)
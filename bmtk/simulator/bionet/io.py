@@ -136,29 +136,10 @@ def create_output_files(simulator, gids):
     '''
 
     if simulator.cell_variables: # conf["run"]["save_cell_vars"]:
+        # the cell_vars_<rank>.h5 files are created by the CellVarsMod
         print2log0('    Will save time series of individual cells')
-        create_cell_vars_files(simulator, gids)
                 
     # create_spike_file(simulator, gids)  # a single file including all gids
-    
-
-def create_cell_vars_files(simulator, gids):
-    """create 1 hfd5 files per gid"""
-
-    dt = simulator.dt # conf["run"]["dt"]
-    tstop = simulator.tstop # conf["run"]["tstop"]
-
-    nsteps = int(round(tstop/dt))
-
-    for gid in gids["save_cell_vars"]:
-        ofname = os.path.join(simulator.cell_var_output, '{}.h5'.format(gid))
-        with h5py.File(ofname, 'w') as h5:
-            h5.attrs['dt'] = dt
-            h5.attrs['tstart'] = 0.0
-            h5.attrs['tstop'] = tstop
-
-            for var in simulator.cell_variables:
-                h5.create_dataset(var, (nsteps,), maxshape=(None,), chunks=True)
 
 
 def get_spike_trains_handle(file_name, trial_name):
@@ -168,10 +149,11 @@ def get_spike_trains_handle(file_name, trial_name):
 
 
 def setup_output_dir(conf):
-    start_from_state =False
+    start_from_state = conf["run"].get('start_from_state', False)
     if start_from_state:  # starting from a previously saved state
         try:
             assert os.path.exists(conf["output"]["output_dir"])
+            create_log(conf)
             print2log0('Will run simulation from a previously saved state...')
         except:
             print('ERROR: directory with the initial state does not exist')
@@ -47,9 +47,6 @@ class LIFCell(Cell):
         nc = h.NetCon(self.hobj, None)
         pc.cell(self.gid, nc)
 
-    def set_im_ptr(self):
-        pass
-
     def set_syn_connection(self, edge_prop, src_node, stim=None):
         src_gid = src_node.node_id
         syn_params = edge_prop['dynamics_params']
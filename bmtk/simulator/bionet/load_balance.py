@@ -0,0 +1,145 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Helper functions for distributing cells across MPI ranks.
+
+The cost of simulating each cell is estimated before any cells are instantiated (or taken from the per-gid costs saved
+by a previous run in a balance file) and the cells are split across the ranks using a greedy longest-processing-time
+(LPT) bin-packing, which assigns the most expensive cells first, each one to the currently least loaded rank.
+"""
+import heapq
+import numpy as np
+import pandas as pd
+
+
+# relative cost of the different parts of a cell, used when estimating the cost of each cell
+COST_WEIGHTS = {'segment': 1.0,  # each compartment of a biophysically detailed cell
+                'synapse': 0.2,  # each incoming edge
+                'point': 1.0}  # a point (LIF) cell
+
+
+def swc_ncompartments(swc_file, dL):
+    """Estimates the number of compartments NEURON will create for a morphology, without needing to load it.
+
+    The morphology is split into unbranched sections, and like BioCell.set_nseg() each section will have
+    1 + 2*int(L/(2*dL)) segments.
+
+    :param swc_file: path to swc morphology file.
+    :param dL: max length of a segment.
+    :return: estimated total number of segments.
+    """
+    swc = np.loadtxt(swc_file, comments='#', ndmin=2)
+    if len(swc) == 0:
+        return 0
+
+    ids = swc[:, 0].astype(np.int64)
+    types = swc[:, 1].astype(np.int64)
+    coords = swc[:, 2:5]
+    parent_ids = swc[:, 6].astype(np.int64)
+
+    # row of the parent of each point, -1 for the root(s)
+    id_order = np.argsort(ids)
+    parent_rows = id_order[np.clip(np.searchsorted(ids[id_order], parent_ids), 0, len(ids) - 1)]
+    has_parent = (parent_ids >= 0) & (ids[parent_rows] == parent_ids)
+    parent_rows[~has_parent] = -1
+
+    lengths = np.zeros(len(ids))
+    lengths[has_parent] = np.linalg.norm(coords[has_parent] - coords[parent_rows[has_parent]], axis=1)
+
+    # a point starts a new section if its parent is a branching point, the soma or of a different type
+    nchildren = np.bincount(parent_rows[has_parent], minlength=len(ids))
+    starts_section = ~has_parent
+    starts_section[has_parent] = (nchildren[parent_rows[has_parent]] != 1) | \
+                                 (types[parent_rows[has_parent]] != types[has_parent]) | \
+                                 (types[parent_rows[has_parent]] == 1)
+
+    # The soma is a single section with one segment
+    soma = types == 1
+    section_lengths = {}
+    section_ids = np.zeros(len(ids), dtype=np.int64)
+    for row in np.argsort(ids):
+        if soma[row]:
+            continue
+        section_ids[row] = row if starts_section[row] else section_ids[parent_rows[row]]
+        section_lengths[section_ids[row]] = section_lengths.get(section_ids[row], 0.0) + lengths[row]
+
+    nseg = 1 if np.any(soma) else 0
+    for sec_len in section_lengths.values():
+        nseg += 1 + 2*int(sec_len/(2*dL))
+    return nseg
+
+
+def lpt_partition(costs, nhost):
+    """Splits gids across ranks so the total cost on each rank is about equal.
+
+    :param costs: dictionary of gid --> cost.
+    :param nhost: number of ranks.
+    :return: list (one for each rank) of sorted lists of gids.
+    """
+    # ties are broken by gid, so every rank will come up with the same partition.
+    gids = sorted(costs.keys(), key=lambda gid: (-costs[gid], gid))
+    rank_loads = [(0.0, r) for r in range(nhost)]
+    rank_gids = [[] for _ in range(nhost)]
+    for gid in gids:
+        load, r = heapq.heappop(rank_loads)
+        rank_gids[r].append(gid)
+        heapq.heappush(rank_loads, (load + costs[gid], r))
+
+    return [sorted(gids) for gids in rank_gids]
+
+
+def merge_costs(estimated, measured):
+    """Combines the estimated costs of the gids with the costs measured in a previous run (eg. from a balance file).
+
+    Measured costs are in seconds while estimates are in the units of COST_WEIGHTS, so the estimates of gids that
+    weren't measured are rescaled by the ratio between the measured and estimated costs of the gids found in both.
+
+    :param estimated: dictionary of gid --> estimated cost, for every gid.
+    :param measured: dictionary of gid --> measured cost.
+    :return: dictionary of gid --> cost, for every gid in estimated.
+    """
+    common_gids = [gid for gid in estimated if gid in measured]
+    estimated_total = sum(estimated[gid] for gid in common_gids)
+    measured_total = sum(measured[gid] for gid in common_gids)
+    if estimated_total <= 0 or measured_total <= 0:
+        # nothing to calibrate the estimates with
+        return dict(estimated)
+
+    scale = measured_total/estimated_total
+    return {gid: measured[gid] if gid in measured else cost*scale for gid, cost in estimated.items()}
+
+
+def load_costs(balance_file):
+    """Reads the per-gid costs from a balance file."""
+    costs_df = pd.read_csv(balance_file, sep=' ')
+    return dict(zip(costs_df['gid'].values, costs_df['cost'].values))
+
+
+def save_costs(balance_file, costs):
+    """Writes a dictionary of gid --> cost into a balance file, which can be used to distribute cells in later runs."""
+    gids = sorted(costs.keys())
+    costs_df = pd.DataFrame({'gid': gids, 'cost': [costs[gid] for gid in gids]}, columns=['gid', 'cost'])
+    costs_df.to_csv(balance_file, sep=' ', index=False)
@@ -1,3 +1,5 @@
 from ecp import EcpMod
 from record_cellvars import CellVarsMod
-from record_spikes import SpikesMod
\ No newline at end of file
+from record_spikes import SpikesMod
+from checkpoint import CheckpointMod
+from profiling import ProfilerMod
@@ -0,0 +1,169 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import glob
+import json
+from neuron import h
+
+from bmtk.simulator.bionet.modules.sim_module import SimulatorMod
+from bmtk.simulator.bionet.io import print2log0
+
+
+pc = h.ParallelContext()
+MPI_RANK = int(pc.id())
+N_HOSTS = int(pc.nhost())
+
+
+class CheckpointMod(SimulatorMod):
+    """Module for periodically saving the state of a simulation so that it can be resumed later.
+
+    Every nblocks blocks each rank writes the NEURON state (h.SaveState) together with the sequence of every Random
+    object (used by the NetStims/VecStims) into <checkpoint_dir>/state_<tstep>_rank-<rank>.dat, and the state of the
+    other simulation modules (eg. the offsets of the recorders) into <checkpoint_dir>/mods_<tstep>_rank-<rank>.json.
+    Once all the ranks are done, rank 0 updates <checkpoint_dir>/checkpoint.json which points to the latest complete
+    checkpoint, and the files of the previous checkpoint are removed.
+
+    When the simulation is resumed (start_from_state) the latest checkpoint is restored during initialization. This
+    module must be the last one added to the simulation so that the other modules have already been initialized.
+    """
+
+    def __init__(self, checkpoint_dir, nblocks=1):
+        self._checkpoint_dir = checkpoint_dir
+        self._nblocks = nblocks
+        self._block_count = 0
+        self._tstep = None  # time step of the latest saved checkpoint
+
+    @property
+    def checkpoint_file(self):
+        return os.path.join(self._checkpoint_dir, 'checkpoint.json')
+
+    def _state_file(self, tstep, rank=MPI_RANK):
+        return os.path.join(self._checkpoint_dir, 'state_{}_rank-{}.dat'.format(tstep, rank))
+
+    def _mods_file(self, tstep, rank=MPI_RANK):
+        return os.path.join(self._checkpoint_dir, 'mods_{}_rank-{}.json'.format(tstep, rank))
+
+    def read_checkpoint(self):
+        """Returns the dictionary describing the latest complete checkpoint, or None if there isn't one."""
+        if not os.path.exists(self.checkpoint_file):
+            return None
+
+        with open(self.checkpoint_file, 'r') as f:
+            return json.load(f)
+
+    def _save_state(self, file_name):
+        state = h.SaveState()
+        state.save()
+
+        f = h.File()
+        f.wopen(file_name)
+        state.fwrite(f, 0)
+        for r_tmp in h.List('Random'):
+            f.printf('%.17g\n', r_tmp.seq())
+        f.close()
+
+    def _restore_state(self, file_name):
+        state = h.SaveState()
+
+        f = h.File()
+        f.ropen(file_name)
+        state.fread(f, 0)
+        state.restore()
+        for r_tmp in h.List('Random'):
+            r_tmp.seq(f.scanvar())
+        f.close()
+
+    def save(self, sim):
+        tstep = sim.tstep
+
+        # write the files of each rank under temporary names, so that a partially written checkpoint is never used
+        state_file = self._state_file(tstep)
+        self._save_state(state_file + '.tmp')
+        os.rename(state_file + '.tmp', state_file)
+
+        mods_file = self._mods_file(tstep)
+        with open(mods_file + '.tmp', 'w') as f:
+            json.dump([mod.save_checkpoint(sim) for mod in sim.mods], f)
+        os.rename(mods_file + '.tmp', mods_file)
+        pc.barrier()
+
+        if MPI_RANK == 0:
+            with open(self.checkpoint_file + '.tmp', 'w') as f:
+                json.dump({'tstep': tstep, 't': sim.h.t, 'nhost': N_HOSTS}, f)
+            os.rename(self.checkpoint_file + '.tmp', self.checkpoint_file)
+        pc.barrier()
+
+        if self._tstep is not None and self._tstep != tstep:
+            os.remove(self._state_file(self._tstep))
+            os.remove(self._mods_file(self._tstep))
+        self._tstep = tstep
+        print2log0('    Saved checkpoint at step:{} t_sim:{:.3f} ms'.format(tstep, sim.h.t))
+
+    def restore(self, sim):
+        checkpoint = self.read_checkpoint()
+        if checkpoint is None:
+            raise Exception('Unable to resume simulation, no checkpoint found in {}.'.format(self._checkpoint_dir))
+
+        if checkpoint['nhost'] != N_HOSTS:
+            raise Exception('Checkpoint was saved with {} ranks, simulation must be resumed with the same number of '
+                            'ranks (currently {}).'.format(checkpoint['nhost'], N_HOSTS))
+
+        tstep = checkpoint['tstep']
+        h.finitialize(sim.v_init)  # fires the FInitializeHandlers of the modules before overwriting the state
+        self._restore_state(self._state_file(tstep))
+
+        with open(self._mods_file(tstep), 'r') as f:
+            mods_state = json.load(f)
+        for mod, mod_state in zip(sim.mods, mods_state):
+            mod.load_checkpoint(sim, mod_state)
+
+        sim.set_tstep(tstep)
+        self._tstep = tstep
+        print2log0('Resuming simulation from checkpoint at step:{} t_sim:{:.3f} ms'.format(tstep, sim.h.t))
+
+    def initialize(self, sim):
+        if MPI_RANK == 0 and not os.path.exists(self._checkpoint_dir):
+            os.makedirs(self._checkpoint_dir)
+        pc.barrier()
+
+        if sim.start_from_state:
+            self.restore(sim)
+        else:
+            # clear out any checkpoints left by an earlier run
+            for file_name in glob.glob(os.path.join(self._checkpoint_dir, 'state_*_rank-{}.dat'.format(MPI_RANK))) + \
+                    glob.glob(os.path.join(self._checkpoint_dir, 'mods_*_rank-{}.json'.format(MPI_RANK))):
+                os.remove(file_name)
+            pc.barrier()
+            if MPI_RANK == 0 and os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+        pc.barrier()
+
+    def block(self, sim, block_interval):
+        self._block_count += 1
+        if self._block_count % self._nblocks == 0:
+            self.save(sim)
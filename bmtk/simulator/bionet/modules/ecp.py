@@ -32,6 +32,12 @@ import pandas as pd
 from neuron import h
 import numpy as np
 
+try:
+    # only needed for sparse transfer resistance matrices (max_distance)
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
 from bmtk.simulator.bionet.modules.sim_module import SimulatorMod
 
 
@@ -41,17 +47,34 @@ N_HOSTS = int(pc.nhost())
 
 
 class EcpMod(SimulatorMod):
-    def __init__(self, ecp_file, positions_file, tmp_outputdir):
+    def __init__(self, ecp_file, positions_file, tmp_outputdir, max_distance=None, debug=False):
+        """
+        :param ecp_file: output hdf5 file for the ecp.
+        :param positions_file: csv file with the positions of the electrode sites.
+        :param tmp_outputdir: directory for temporary files.
+        :param max_distance: when set segments further than max_distance (um) from an electrode site are ignored and
+            the transfer resistances are stored as a sparse matrix, useful when there are many sites.
+        :param debug: also save the ecp contribution of each rank into a tmp file in tmp_outputdir, which is kept after
+            the simulation.
+        """
         self._ecp_output = ecp_file
         self._positions_file = positions_file
         self._tmp_outputdir = tmp_outputdir
+        self._max_distance = max_distance
+        self._debug = debug
         self._cell_vars_dir = None
         self._rel = None
         self._fih1 = None
         self._rel_nsites = 0
+        self._transfer_resistances = None  # (nsites x nsegs) matrix for the segments of every local cell
+        self._seg_offsets = {}  # gid --> (first, last+1) column of the cell's segments in the transfer matrix
+        self._saved_transfer_resistances = {}  # gid --> transfer matrix columns of the cells saved separately
+        self._im_ptr = None  # pointers to i_membrane_ of every local segment
+        self._im_vec = None
         self._block_size = 0
         self._biophys_gids = []
-        self._saved_gids = {}
+        self._saved_gids = []  # gids whose individual ecp contribution is saved
+        self._saved_block = None  # (block_step x saved gids x sites) ecp contribution of each saved gid
         self._nsteps = 0
 
         self._tstep = 0  # accumlative time step
@@ -59,10 +82,11 @@ class EcpMod(SimulatorMod):
         self._block_step = 0  # time step within the given block of time
         self._tstep_start_block = 0
         self._data_block = None
-        self._cell_var_files = {}
+        self._cells_ecp_handle = None  # file with the ecp contribution of each saved cell on this rank
 
         self._tmp_ecp_file = self._get_tmp_fname(MPI_RANK)
         self._tmp_ecp_handle = None
+        self._ecp_handle = None  # final ecp file, only opened on rank 0
         # self._tmp_ecp_dataset = None
 
     def _get_tmp_fname(self, rank):
@@ -73,110 +97,156 @@ class EcpMod(SimulatorMod):
         tstop = sim.tstop
         self._nsteps = int(round(tstop/dt))
 
-        # create file to temporary store ecp data on each rank
-        self._tmp_ecp_handle = h5py.File(self._tmp_ecp_file, 'a')
-        self._tmp_ecp_handle.create_dataset('ecp', (self._nsteps, self._rel_nsites), maxshape=(None, self._rel_nsites),
-                                            chunks=True)
+        if self._debug:
+            # create file to temporary store ecp data on each rank
+            self._tmp_ecp_handle = h5py.File(self._tmp_ecp_file, 'w')
+            self._tmp_ecp_handle.create_dataset('ecp', (self._nsteps, self._rel_nsites),
+                                                maxshape=(None, self._rel_nsites), chunks=True)
 
         # only the primary node will need to save the final ecp
-        if MPI_RANK == 0:
-            with h5py.File(self._ecp_output, 'w') as f5:
-                f5.create_dataset('ecp', (self._nsteps, self._rel_nsites), maxshape=(None, self._rel_nsites),
-                                  chunks=True)
-                f5.attrs['dt'] = dt
-                f5.attrs['tstart'] = 0.0
-                f5.attrs['tstop'] = tstop
+        if MPI_RANK == 0 and sim.start_from_state and os.path.exists(self._ecp_output):
+            # resuming from a checkpoint, the steps after the checkpoint are overwritten
+            self._ecp_handle = h5py.File(self._ecp_output, 'a')
+        elif MPI_RANK == 0:
+            self._ecp_handle = h5py.File(self._ecp_output, 'w')
+            self._ecp_handle.create_dataset('ecp', (self._nsteps, self._rel_nsites), maxshape=(None, self._rel_nsites),
+                                            chunks=True)
+            self._ecp_handle.attrs['dt'] = dt
+            self._ecp_handle.attrs['tstart'] = 0.0
+            self._ecp_handle.attrs['tstop'] = tstop
         pc.barrier()
 
-    def _create_cell_file(self, gid):
-        file_name = os.path.join(self._cell_vars_dir, '{}.h5'.format(int(gid)))
-        file_h5 = h5py.File(file_name, 'a')
-        self._cell_var_files[gid] = file_h5
-        file_h5.create_dataset('ecp', (self._nsteps, self._rel_nsites), maxshape=(None, self._rel_nsites), chunks=True)
-        # self._cell_var_files[gid] = file_h5['ecp']
-
-    def _calculate_ecp(self, sim):
+    def _get_cells_fname(self):
+        return os.path.join(self._cell_vars_dir, 'ecp_{}.h5'.format(MPI_RANK))
+
+    def _create_cells_file(self, sim):
+        """Creates the file for the ecp contributions of the saved cells of this rank. Like the cell_vars files of
+        CellVarsMod there is one file for each rank, with a (n_steps x n_cells x n_sites) ecp dataset and a mapping group
+        with the gid of each cell.
+        """
+        if sim.start_from_state and os.path.exists(self._get_cells_fname()):
+            # file was created before the simulation was resumed
+            self._cells_ecp_handle = h5py.File(self._get_cells_fname(), 'a')
+            return
+
+        self._cells_ecp_handle = h5py.File(self._get_cells_fname(), 'w')
+        self._cells_ecp_handle.attrs['dt'] = sim.dt
+        self._cells_ecp_handle.attrs['tstart'] = 0.0
+        self._cells_ecp_handle.attrs['tstop'] = sim.tstop
+        self._cells_ecp_handle.create_dataset('mapping/gids', data=np.array(self._saved_gids, dtype=np.uint32))
+        self._cells_ecp_handle.create_dataset('ecp', (self._nsteps, len(self._saved_gids), self._rel_nsites),
+                                              chunks=True)
+
+    def _calculate_ecp(self, sim, saved_gids=()):
         self._rel = RecXElectrode(self._positions_file)
+
+        # build a single transfer resistance matrix for the segments of all the local cells.
+        seg_coords = []
+        nsegs = 0
         for gid in self._biophys_gids:
             cell = sim.net.cells[gid]
-            self._rel.calc_transfer_resistance(gid, cell.get_seg_coords())
+            seg_coords.append(cell.get_seg_coords())
+            cell_nsegs = seg_coords[-1]['p0'].shape[1]
+            self._seg_offsets[gid] = (nsegs, nsegs + cell_nsegs)
+            nsegs += cell_nsegs
+        self._transfer_resistances = self._rel.calc_transfer_resistance_matrix(seg_coords, self._max_distance)
+
+        # slice out the columns of the cells whose ecp contributions are saved, once rather than at every step
+        for gid in saved_gids:
+            seg_begin, seg_end = self._seg_offsets[gid]
+            self._saved_transfer_resistances[gid] = self._transfer_resistances[:, seg_begin:seg_end]
 
         self._rel_nsites = self._rel.nsites
         sim.h.cvode.use_fast_imem(1)  # make i_membrane_ a range variable
 
-        def set_pointers():
-            for gid, cell in sim.net.cells.items():
-                cell.set_im_ptr()
-        self._fih1 = sim.h.FInitializeHandler(0, set_pointers)
+        # use one pointer vector for all the local segments so the currents can be gathered with a single call
+        self._im_ptr = h.PtrVector(max(nsegs, 1))
+        self._im_ptr.ptr_update_callback(lambda: self._set_im_ptr(sim))
+        self._im_vec = h.Vector(max(nsegs, 1))
+
+        self._fih1 = sim.h.FInitializeHandler(0, lambda: self._set_im_ptr(sim))
+
+    def _set_im_ptr(self, sim):
+        """Set the pointer vector to the i_membrane_ of every local segment, ordered like the transfer matrix"""
+        jseg = 0
+        for gid in self._biophys_gids:
+            for sec in sim.net.cells[gid].hobj.all:
+                for seg in sec:
+                    self._im_ptr.pset(jseg, seg._ref_i_membrane_)
+                    jseg += 1
 
     def _save_block(self, interval):
-        """Add """
+        """Sum the ecp block across all ranks and write it into the ecp file"""
         itstart, itend = interval
-        self._tmp_ecp_handle['ecp'][itstart:itend, :] += self._data_block[0:(itend - itstart), :]
-        self._tmp_ecp_handle.flush()
-        self._data_block[:] = 0.0
+        data_block = self._data_block[0:(itend - itstart), :]
+        if self._debug:
+            self._tmp_ecp_handle['ecp'][itstart:itend, :] += data_block
+            self._tmp_ecp_handle.flush()
+
+        if N_HOSTS > 1:
+            # sum the blocks of every rank through NEURON, so mpi4py isn't needed
+            block_vec = h.Vector(data_block.ravel())
+            pc.allreduce(block_vec, 1)
+            total_block = block_vec.as_numpy().reshape(data_block.shape)
+        else:
+            total_block = data_block
 
-    def _save_ecp(self, sim):
-        """Save ECP from each rank to disk into a single file"""
-        block_size = sim.nsteps_block
-        nblocks, remain = divmod(self._nsteps, block_size)
-        ivals = [i*block_size for i in range(nblocks+1)]
-        if remain != 0:
-            ivals.append(self._nsteps)
+        if MPI_RANK == 0:
+            self._ecp_handle['ecp'][itstart:itend, :] = total_block
+            self._ecp_handle.flush()
 
-        for rank in xrange(N_HOSTS):  # iterate over the ranks
-            if rank == MPI_RANK:  # wait until finished with a particular rank
-                with h5py.File(self._ecp_output, 'a') as ecp_f5:
-                    for i in range(len(ivals) - 1):
-                        ecp_f5['ecp'][ivals[i]:ivals[i + 1], :] += self._tmp_ecp_handle['ecp'][ivals[i]:ivals[i + 1], :]
+        self._data_block[:] = 0.0
 
-            pc.barrier()
+    def _save_ecp(self, sim):
+        """Close the ecp file, the ecp of each block has already been saved"""
+        if MPI_RANK == 0:
+            self._ecp_handle.close()
+        if self._debug:
+            self._tmp_ecp_handle.close()
+        if self._cells_ecp_handle is not None:
+            self._cells_ecp_handle.close()
 
     def _save_cell_vars(self, interval):
-        itstart, itend = interval
-
-        for gid, data in self._saved_gids.items():
-            h5_file = self._cell_var_files[gid]
-            h5_file['ecp'][itstart:itend, :] = data[0:(itend-itstart), :]
-            h5_file.flush()
-            data[:] = 0.0
+        if not self._saved_gids:
+            return
 
-    def _delete_tmp_files(self):
-        if os.path.exists(self._tmp_ecp_file):
-            os.remove(self._tmp_ecp_file)
+        itstart, itend = interval
+        self._cells_ecp_handle['ecp'][itstart:itend, :, :] = self._saved_block[0:(itend-itstart), :, :]
+        self._cells_ecp_handle.flush()
+        self._saved_block[:] = 0.0
 
     def initialize(self, sim):
         self._block_size = sim.nsteps_block
         self._biophys_gids = sim.gids['biophysical']  # gids for biophysical cells on this rank
         self._cell_vars_dir = sim.cell_var_output
 
-        self._calculate_ecp(sim)
+        # list of all cells whose ecp values will be saved separetly
+        self._saved_gids = [gid for gid in self._biophys_gids if gid in sim.gids['save_cell_vars']]
+        self._calculate_ecp(sim, self._saved_gids)
         self._create_ecp_file(sim)
 
         # ecp data
         self._data_block = np.zeros((self._block_size, self._rel_nsites))
-
-        # create list of all cells whose ecp values will be saved separetly
-        self._saved_gids = {gid: np.empty((self._block_size, self._rel_nsites))
-                            for gid in self._biophys_gids if gid in sim.gids['save_cell_vars']}
-        for gid in self._saved_gids.keys():
-            self._create_cell_file(gid)
+        self._saved_block = np.zeros((self._block_size, len(self._saved_gids), self._rel_nsites))
+        if self._saved_gids:
+            self._create_cells_file(sim)
 
         pc.barrier()
 
     def step(self, sim, tstep, rel_time=0):
-        for gid in self._biophys_gids:  # compute ecp only from the biophysical cells
-            cell = sim.net.cells[gid]
-            im = cell.get_im()
-            tr = self._rel.get_transfer_resistance(gid)
-            ecp = np.dot(tr, im)
-
-            if gid in self._saved_gids.keys():
-                # save individual contribution
-                self._saved_gids[gid][self._block_step, :] = ecp
+        if self._seg_offsets:
+            # compute ecp only from the biophysical cells, gathering the currents of all segments into one buffer
+            self._im_ptr.gather(self._im_vec)
+            im = self._im_vec.as_numpy()
 
             # add to total ecp contribution
-            self._data_block[self._block_step, :] += ecp
+            self._data_block[self._block_step, :] += self._transfer_resistances.dot(im)
+
+            for i, gid in enumerate(self._saved_gids):
+                # save individual contribution
+                seg_begin, seg_end = self._seg_offsets[gid]
+                self._saved_block[self._block_step, i, :] = self._saved_transfer_resistances[gid].dot(
+                    im[seg_begin:seg_end])
 
         self._block_step += 1
 
@@ -194,7 +264,6 @@ class EcpMod(SimulatorMod):
             self.block(sim, (sim.n_steps - self._block_step, sim.n_steps))
 
         self._save_ecp(sim)
-        self._delete_tmp_files()
         pc.barrier()
 
 
@@ -224,32 +293,52 @@ class RecXElectrode(object):
 
     def calc_transfer_resistance(self, gid, seg_coords):
         """Precompute mapping from segment to electrode locations"""
+        self.transfer_resistances[gid] = self._transfer_resistance(seg_coords)
+
+    def calc_transfer_resistance_matrix(self, seg_coords_list, max_distance=None):
+        """Precompute the mapping from the segments of many cells to electrode locations as a single matrix.
+
+        :param seg_coords_list: list of segment coordinates of each cell.
+        :param max_distance: if set, segments with a center further than max_distance from a site are given a transfer
+            resistance of zero and a scipy sparse matrix is returned.
+        :return: (nsites x total segments) matrix, with the columns of each cell in the order of seg_coords_list.
+        """
+        if max_distance is None:
+            if not seg_coords_list:
+                return np.zeros((self.nsites, 0))
+            return np.hstack([self._transfer_resistance(seg_coords) for seg_coords in seg_coords_list])
+
+        if scipy is None:
+            raise ImportError('scipy is required to calculate the ecp with a max_distance.')
+        blocks = [scipy.sparse.csr_matrix((self.nsites, 0))]
+        for seg_coords in seg_coords_list:
+            tr, dist = self._transfer_resistance(seg_coords, return_distances=True)
+            tr[dist > max_distance] = 0.0
+            blocks.append(scipy.sparse.csr_matrix(tr))
+        return scipy.sparse.hstack(blocks, format='csr')
+
+    def _transfer_resistance(self, seg_coords, return_distances=False):
+        """Computes the (nsites x nseg) transfer resistances of a cell, vectorized over all sites and segments."""
         sigma = 0.3  # mS/mm
 
         r05 = (seg_coords['p0'] + seg_coords['p1']) / 2
         dl = seg_coords['p1'] - seg_coords['p0']
 
-        nseg = r05.shape[1]
-
-        tr = np.zeros((self.nsites, nseg))
-
-        for j in xrange(self.nsites):  # calculate mapping for each site on the electrode
-            rel = np.expand_dims(self.pos[:, j], axis=1)  # coordinates of a j-th site on the electrode
-            rel_05 = rel - r05  # distance between electrode and segment centers
-
-            # compute dot product column-wise, the resulting array has as many columns as original
-            r2 = np.einsum('ij,ij->j', rel_05, rel_05)
-
-            # compute dot product column-wise, the resulting array has as many columns as original
-            rlldl = np.einsum('ij,ij->j', rel_05, dl)
-            dlmag = np.linalg.norm(dl, axis=0)  # length of each segment
-            rll = abs(rlldl / dlmag)  # component of r parallel to the segment axis it must be always positive
-            rT2 = r2 - rll ** 2  # square of perpendicular component
-            up = rll + dlmag / 2
-            low = rll - dlmag / 2
-            num = up + np.sqrt(up ** 2 + rT2)
-            den = low + np.sqrt(low ** 2 + rT2)
-            tr[j, :] = np.log(num / den) / dlmag  # units of (um) use with im_ (total seg current)
-
+        # distance between each electrode site and each segment center, shape (3, nsites, nseg)
+        rel_05 = self.pos[:, :, np.newaxis] - r05[:, np.newaxis, :]
+        r2 = np.einsum('ijk,ijk->jk', rel_05, rel_05)
+
+        rlldl = np.einsum('ijk,ik->jk', rel_05, dl)
+        dlmag = np.linalg.norm(dl, axis=0)  # length of each segment
+        rll = abs(rlldl / dlmag)  # component of r parallel to the segment axis it must be always positive
+        rT2 = r2 - rll ** 2  # square of perpendicular component
+        up = rll + dlmag / 2
+        low = rll - dlmag / 2
+        num = up + np.sqrt(up ** 2 + rT2)
+        den = low + np.sqrt(low ** 2 + rT2)
+        tr = np.log(num / den) / dlmag  # units of (um) use with im_ (total seg current)
         tr *= 1 / (4 * math.pi * sigma)
-        self.transfer_resistances[gid] = tr
+
+        if return_distances:
+            return tr, np.sqrt(r2)
+        return tr
@@ -0,0 +1,106 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import time
+from neuron import h
+
+from bmtk.simulator.bionet.modules.sim_module import SimulatorMod
+from bmtk.simulator.bionet.profiler import Profiler, write_report
+from bmtk.simulator.bionet.io import print2log0
+
+
+pc = h.ParallelContext()
+MPI_RANK = int(pc.id())
+
+
+class ProfilerMod(SimulatorMod):
+    """Module for timing the simulation on each rank.
+
+    During initialization the initialize, step and block methods of every other module are wrapped so that the time
+    spent inside each of them is recorded. At the end of the simulation the total run time, the time NEURON spent
+    integrating the cells (pc.step_time()) and waiting for the spike exchange (pc.wait_time()) are added, the
+    profilers of all the ranks are gathered onto rank 0 and saved to the report file (json or csv).
+
+    Should be the first module added to the simulation so that the initialization of the other modules is timed.
+    """
+
+    def __init__(self, report_file, setup_profiler=None):
+        """
+        :param report_file: path of the report, a space separated csv file if ending in .csv, otherwise json.
+        :param setup_profiler: Profiler with the setup phases (eg. BioNetwork.profiler) to include in the report.
+        """
+        self._report_file = report_file
+        self._profiler = setup_profiler if setup_profiler is not None else Profiler()
+        self._mod_times = {}  # name of the module method --> [total time, number of calls]
+        self._start_time = None
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    def _timed(self, name, method):
+        mod_time = self._mod_times.setdefault(name, [0.0, 0])
+
+        def timed_method(*args, **kwargs):
+            start_time = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                mod_time[0] += time.time() - start_time
+                mod_time[1] += 1
+
+        return timed_method
+
+    def initialize(self, sim):
+        for mod in sim.mods:
+            if mod is self:
+                continue
+
+            mod_name = type(mod).__name__
+            for method_name in ['initialize', 'step', 'block']:
+                timed_method = self._timed('{}.{}'.format(mod_name, method_name), getattr(mod, method_name))
+                setattr(mod, method_name, timed_method)
+
+        self._start_time = time.time()
+
+    def finalize(self, sim):
+        run_time = time.time() - self._start_time
+        init_time = sum(t for name, (t, _) in self._mod_times.items() if name.endswith('.initialize'))
+
+        self._profiler.add('simulate', run_time - init_time)
+        self._profiler.add('neuron_solve', pc.step_time(), parent='simulate')
+        self._profiler.add('spike_exchange_wait', pc.wait_time(), parent='simulate')
+        for name in sorted(self._mod_times.keys()):
+            # the modules are initialized before the simulation starts running, step and block are part of simulate
+            parent = None if name.endswith('.initialize') else 'simulate'
+            self._profiler.add(name, *self._mod_times[name], parent=parent)
+
+        all_profilers = pc.py_gather(self._profiler, 0)
+        if MPI_RANK == 0:
+            write_report(self._report_file, all_profilers)
+            print2log0('Saved profiling report to {}'.format(self._report_file))
+        pc.barrier()
@@ -28,62 +28,126 @@
 import os
 import numpy as np
 import h5py
+from neuron import h
 
 from bmtk.simulator.bionet.modules.sim_module import SimulatorMod
 
 
+pc = h.ParallelContext()
+MPI_RANK = int(pc.id())
+
+
 class CellVarsMod(SimulatorMod):
-    def __init__(self, outputdir, variables):
+    def __init__(self, outputdir, variables, sections='soma', seg_x=None, distance_range=None):
         """Module used for saving NEURON cell properities at each given step of the simulation.
 
+        The segments to record from are selected once during initialization, and pointers to the variables of every
+        selected segment of every cell are gathered each step with a single call per variable. Each rank saves the
+        values into one file, <outputdir>/cell_vars_<rank>.h5, with a (n_steps x n_segments) dataset per variable and
+        a mapping group with the gid, section index (within hobj.all), seg x and distance from the soma of each column.
+
         :param outputdir: directory where variables will be saved to.
         :param variables: list of NEURON variables (strings) to collect and save each step
+        :param sections: name or list of names of the section lists/arrays of each cell to record from, eg. 'soma',
+            'all', 'basal', 'apical', 'axonal', 'dend'.
+        :param seg_x: list of segment positions (0 to 1) to record in each section. By default the middle of the soma,
+            or every segment when recording from other sections.
+        :param distance_range: (min, max) distance from the soma (um), only segments within the range are recorded.
         """
         self._cell_vars = variables
         self._outputdir = outputdir
+        self._sections = [sections] if isinstance(sections, basestring) else list(sections)
+        if seg_x is None and self._sections == ['soma']:
+            seg_x = [0.5]
+        self._seg_x = seg_x
+        self._distance_range = distance_range
 
         self._gid_list = []  # list of all gids that will have their variables saved
-        self._data_block = {}  # table of variable data indexed by [gid][variable]
+        self._segments = []  # list of (gid, sec_id, seg) for each recorded column
+        self._var_ptrs = {}  # pointer vector for each variable
+        self._var_vecs = {}  # vector to gather each variable into
+        self._data_block = {}  # table of (block_step x segments) data indexed by variable
         self._block_step = 0  # time step within a given block
+        self._h5_handle = None
+
+    def _get_filename(self):
+        return os.path.join(self._outputdir, 'cell_vars_{}.h5'.format(MPI_RANK))
 
-    def _get_filename(self, gid):
-        return os.path.join(self._outputdir, '{}.h5'.format(gid))
+    def _select_segments(self, cell):
+        """Returns a list of (sec_id, seg, distance from soma) for every segment of a cell that will be recorded."""
+        soma = cell.hobj.soma[0]
+        h.distance(0, 0.5, sec=soma)  # set the origin for measuring distances
+        sec_ids = {sec.name(): sec_id for sec_id, sec in enumerate(cell.hobj.all)}
+
+        segments = []
+        for sec_list_name in self._sections:
+            for sec in getattr(cell.hobj, sec_list_name):
+                seg_list = [sec(x) for x in self._seg_x] if self._seg_x is not None else list(sec)
+                for seg in seg_list:
+                    dist = h.distance(seg.x, sec=sec)
+                    if self._distance_range is not None and \
+                            not (self._distance_range[0] <= dist <= self._distance_range[1]):
+                        continue
+                    segments.append((sec_ids[sec.name()], seg, dist))
+        return segments
+
+    def _set_ptrs(self):
+        for variable, ptr_vec in self._var_ptrs.items():
+            for i, (_, _, seg, _) in enumerate(self._segments):
+                ptr_vec.pset(i, getattr(seg, '_ref_{}'.format(variable)))
 
     def initialize(self, sim):
         # get list of gids to save. Will only work for biophysical cells saved on the current MPI rank
-        self._gid_list = list(set(sim.gids['biophysical']) & set(sim.gids['save_cell_vars']))
+        self._gid_list = sorted(set(sim.gids['biophysical']) & set(sim.gids['save_cell_vars']))
+        self._segments = [(gid, sec_id, seg, dist) for gid in self._gid_list
+                          for sec_id, seg, dist in self._select_segments(sim.net.cells[gid])]
+        n_segments = len(self._segments)
+
+        # bind pointers to the variables of every segment
+        for variable in self._cell_vars:
+            self._var_ptrs[variable] = h.PtrVector(max(n_segments, 1))
+            self._var_ptrs[variable].ptr_update_callback(self._set_ptrs)
+            self._var_vecs[variable] = h.Vector(max(n_segments, 1))
+        self._set_ptrs()
 
         # preallocate block data for saving variables
-        self._data_block = {gid: {v: np.zeros(sim.nsteps_block) for v in self._cell_vars} for gid in self._gid_list}
+        self._data_block = {v: np.zeros((sim.nsteps_block, n_segments)) for v in self._cell_vars}
 
-        # Create files for saving variables
-        for gid in self._gid_list:
-            with h5py.File(self._get_filename(gid), 'w') as h5:
-                h5.attrs['dt'] = sim.dt
-                h5.attrs['tstart'] = 0.0
-                h5.attrs['tstop'] = sim.tstop
+        # Create the file for saving variables, which is kept open until the end of the simulation. When resuming a
+        # simulation the existing file is reopened and the steps after the checkpoint are overwritten.
+        if sim.start_from_state and os.path.exists(self._get_filename()):
+            self._h5_handle = h5py.File(self._get_filename(), 'a')
+            return
 
-                for v in self._cell_vars:
-                    h5.create_dataset(v, (sim.n_steps,), chunks=True)
+        self._h5_handle = h5py.File(self._get_filename(), 'w')
+        self._h5_handle.attrs['dt'] = sim.dt
+        self._h5_handle.attrs['tstart'] = 0.0
+        self._h5_handle.attrs['tstop'] = sim.tstop
+        mapping_grp = self._h5_handle.create_group('mapping')
+        mapping_grp.create_dataset('gids', data=np.array([s[0] for s in self._segments], dtype=np.uint32))
+        mapping_grp.create_dataset('sec_ids', data=np.array([s[1] for s in self._segments], dtype=np.uint32))
+        mapping_grp.create_dataset('seg_x', data=np.array([s[2].x for s in self._segments], dtype=np.float))
+        mapping_grp.create_dataset('distance', data=np.array([s[3] for s in self._segments], dtype=np.float))
+        for v in self._cell_vars:
+            self._h5_handle.create_dataset(v, (sim.n_steps, n_segments), chunks=True if n_segments > 0 else None)
 
     def step(self, sim, tstep, rel_time=0.0):
         # save all necessary cells/variables at the current time-step into memory
-        for gid in self._gid_list:
-            cell = sim.net.cells[gid]
-            for variable, data_block in self._data_block[gid].items():
-                data_block[self._block_step] = getattr(cell.hobj.soma[0](0.5), variable)
+        if self._segments:
+            for variable, ptr_vec in self._var_ptrs.items():
+                ptr_vec.gather(self._var_vecs[variable])
+                self._data_block[variable][self._block_step, :] = self._var_vecs[variable].as_numpy()
 
         self._block_step += 1
 
     def block(self, sim, block_interval):
         # write variables in memory to file
         itstart, itend = block_interval
-        # TODO: keep a reference to the hdf5 file instead of opening it on every block
-        for gid, var_table in self._data_block.items():
-            with h5py.File(self._get_filename(gid), 'a') as h5:
-                for var_name, var_data in var_table.items():
-                    h5[var_name][itstart:itend] = var_data[0:(itend-itstart)]
-                    self._data_block[gid][var_name][:] = 0.0  # np.zeros(sim.nsteps_block)
+        if self._segments:
+            for var_name, var_data in self._data_block.items():
+                self._h5_handle[var_name][itstart:itend, :] = var_data[0:(itend-itstart), :]
+                var_data[:] = 0.0
+            self._h5_handle.flush()
 
         self._block_step = 0
 
@@ -91,3 +155,4 @@ class CellVarsMod(SimulatorMod):
         if self._block_step > 0:
             # just in case the simulation doesn't end on a block step
             self.block(sim, (sim.n_steps - self._block_step, sim.n_steps))
+        self._h5_handle.close()
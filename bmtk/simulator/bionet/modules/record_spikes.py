@@ -26,19 +26,13 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 import os
-import csv
 import h5py
 import numpy as np
 from bmtk.simulator.bionet.modules.sim_module import SimulatorMod
 from bmtk.simulator.bionet.io import print2log0
+from bmtk.simulator.bionet import spike_files
 
 from neuron import h
-try:
-    from mpi4py import MPI
-    comm = MPI.COMM_WORLD
-except:
-    pass
-
 
 pc = h.ParallelContext()
 MPI_RANK = int(pc.id())
@@ -48,12 +42,13 @@ N_HOSTS = int(pc.nhost())
 class SpikesMod(SimulatorMod):
     """Module use for saving spikes
 
+    At the end of every block the spikes recorded on each rank are gathered onto rank 0 as arrays of times and gids,
+    sorted by time (then gid) and appended to the output files in bulk.
     """
 
-    def __init__(self, tmpdir, csv_filename=None, h5_filename=None):
+    def __init__(self, csv_filename=None, h5_filename=None):
         self._csv_fname = csv_filename
         self._csv_fhandle = None
-        self._csv_writer = None
         self._save_csv = csv_filename is not None
 
         self._h5_fname = h5_filename
@@ -62,146 +57,122 @@ class SpikesMod(SimulatorMod):
         self._times_dataset = None
         self._save_h5 = h5_filename is not None
 
-        self._tmpdir = tmpdir
-        self._tmp_file = self._get_tmp_filename(MPI_RANK)  # os.path.join(tmpdir, 'tmp_{}_spikes.csv'.format(MPI_RANK))
-        self._tmp_spikes_handles = {}
         self._n_spikes_rank = 0
         self._n_spikes_total = 0
-        self._row_itr = 0
 
-    def _get_tmp_filename(self, rank):
-        return os.path.join(self._tmpdir, 'tmp_{}_spikes.csv'.format(rank))
+    @property
+    def n_spikes(self):
+        """Total number of spikes across all ranks saved so far, only valid on rank 0."""
+        return self._n_spikes_total
 
-    def _save_unsorted(self):
-        if MPI_RANK == 0:
-            for rank in range(N_HOSTS):
-                for row in self._tmp_spikes_handles[str(rank)]:
-                    self._write_spike(float(row[0]), int(row[1]))
+    def _open_output(self, append=False):
+        """Creates and opens the files that will be used to display the spiking information. When appending (ie.
+        resuming a simulation) the existing files are reopened, see load_checkpoint() for trimming them."""
+        if MPI_RANK != 0:
+            return
 
-        pc.barrier()
+        if self._save_csv:
+            self._csv_fhandle = open(self._csv_fname, 'a' if append else 'w')
 
-    def _save_sorted(self):
-        if N_HOSTS < 2:
-            # If there's one rank then the tmp file should already be sorted
-            self._save_unsorted()
+        if self._save_h5:
+            if append and os.path.exists(self._h5_fname):
+                self._h5_fhandle = h5py.File(self._h5_fname, 'a')
+                self._gids_dataset = self._h5_fhandle['gid']
+                self._times_dataset = self._h5_fhandle['time']
+            else:
+                self._h5_fhandle = h5py.File(self._h5_fname, 'w')
+                self._gids_dataset = self._h5_fhandle.create_dataset("gid", shape=(0,), maxshape=(None,),
+                                                                     chunks=True, dtype=np.int32)
+                self._times_dataset = self._h5_fhandle.create_dataset("time", shape=(0,), maxshape=(None,),
+                                                                      chunks=True)
 
-        else:
-            if MPI_RANK == 0:
-                # TODO: remove the conditional of running only on rank 0.
-                try:
-                    # create a list of the first spike time for every rank
-                    spikes = []
-                    for rank in range(N_HOSTS):
-                        spike = self.next_spike(rank)
-                        if spike is not None:
-                            spikes.append(spike)
-
-                    # Iterate through all the ranks and find the first spike. Write that spike/gid to the output, then
-                    # replace that data point with the next spike on the selected rank
-                    while spikes:
-                        # find which rank has the first spike
-                        selected_index = 0
-                        selected_time = spikes[0][0]
-                        for i, spike in enumerate(spikes[1:]):
-                            if spike[0] < selected_time:
-                                selected_index = i+1
-                                selected_time = spike[0]
-
-                        # write the spike to the file
-                        t, gid, rank = spikes.pop(selected_index)
-                        # print2log0('{} {}'.format(t, gid))
-                        self._write_spike(t, gid)
-
-                        # get the next spike on that rank and replace in spikes table
-                        another_spike = self.next_spike(rank)
-                        if another_spike is not None:
-                            spikes.append(another_spike)
-
-                except Exception as e:
-                    print e
-
-            pc.barrier()
-
-    def _write_spike(self, spike_time, gid):
+    def _close_output(self):
         if MPI_RANK != 0:
             return
 
         if self._save_csv:
-            self._csv_writer.writerow([spike_time, gid])
+            self._csv_fhandle.close()
 
         if self._save_h5:
-            self._gids_dataset[self._row_itr] = gid
-            self._times_dataset[self._row_itr] = spike_time
+            self._h5_fhandle.close()
 
-        self._row_itr += 1
+    def _local_spikes(self, sim):
+        """Returns arrays of the spike times and gids recorded on this rank during the last block."""
+        times = []
+        gids = []
+        for gid, tVec in sim.spikes_table.items():
+            gid_times = tVec.as_numpy()
+            times.append(np.array(gid_times, dtype=np.float64))
+            gids.append(np.full(len(gid_times), gid, dtype=np.int32))
 
-    def _close_output(self):
-        if MPI_RANK == 0:
-            if self._save_csv:
-                self._csv_handle.close()
+        if not times:
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int32)
+        return np.concatenate(times), np.concatenate(gids)
 
-    def _gather_spike_count(self):
+    def _gather_spikes(self, times, gids):
+        """Gathers the spike times and gids from every rank onto rank 0 (other ranks return empty arrays)."""
         if N_HOSTS == 1:
-            return self._n_spikes_rank
+            return times, gids
+
+        rank_spikes = pc.py_gather((times, gids), 0)
+        if MPI_RANK == 0:
+            return np.concatenate([t for t, _ in rank_spikes]), np.concatenate([g for _, g in rank_spikes])
         else:
-            send_msg = np.array([self._n_spikes_rank], dtype=np.uint)
-            recv_buff = np.empty(N_HOSTS, dtype=np.uint)
-            comm.Allgather([send_msg, MPI.UNSIGNED_INT], [recv_buff, MPI.UNSIGNED_INT])
-            return np.sum(recv_buff)
-
-    def _open_output(self):
-        """Creates and opens the files that will be used to display the spiking information"""
-        if MPI_RANK == 0 and self._save_csv:
-            self._csv_handle = open(self._csv_fname, 'w')
-            self._csv_writer = csv.writer(self._csv_handle, delimiter=' ')
-
-        self._n_spikes_total = self._gather_spike_count()
-        if MPI_RANK == 0 and self._save_h5:
-            self._h5_fhandle = h5py.File(self._h5_fname, 'w')
-            self._gids_dataset = self._h5_fhandle.create_dataset("gid", shape=(self._n_spikes_total,), chunks=True,
-                                                                 dtype=np.int32)
-            self._times_dataset = self._h5_fhandle.create_dataset("time", shape=(self._n_spikes_total,), chunks=True)
-
-    def _delete_tmp_file(self):
-        """Removes tempory file used to save spikes during the block"""
-        if os.path.exists(self._tmp_file):
-            os.remove(self._tmp_file)
-
-    def next_spike(self, rank):
-        """Acts as an iterator of the spikes for a given mpi rank.
-
-        :param rank:
-        :return: tuple of
-        """
-        try:
-            val = self._tmp_spikes_handles[str(rank)].next()
-            return float(val[0]), int(val[1]), rank
-        except StopIteration:
-            return None
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int32)
+
+    def _write_spikes(self, times, gids):
+        """Appends sorted arrays of spike times and gids to the output files."""
+        if MPI_RANK != 0 or len(times) == 0:
+            return
+
+        if self._save_csv:
+            np.savetxt(self._csv_fhandle, np.column_stack((times, gids)), fmt=['%.3f', '%d'], delimiter=' ')
+
+        if self._save_h5:
+            n_begin = self._n_spikes_total
+            n_end = n_begin + len(times)
+            self._gids_dataset.resize((n_end,))
+            self._gids_dataset[n_begin:n_end] = gids
+            self._times_dataset.resize((n_end,))
+            self._times_dataset[n_begin:n_end] = times
+
+    def _save_spikes(self, sim):
+        times, gids = self._local_spikes(sim)
+        self._n_spikes_rank += len(times)
+
+        # Each block covers the same interval of time on every rank, so sorting the spikes of the block is enough for
+        # the output to be sorted.
+        times, gids = self._gather_spikes(np.round(times, 3), gids)
+        order = np.lexsort((gids, times))
+        self._write_spikes(times[order], gids[order])
+        self._n_spikes_total += len(times)
 
     def initialize(self, sim):
         # TODO: since it's possible that other modules may need to access spikes, set_spikes_recordings() should
         # probably be called in the simulator itself.
         sim.set_spikes_recording()
+        self._open_output(append=sim.start_from_state)
 
     def block(self, sim, block_interval):
-        # take spikes from Simulator spikes vector and save to the tmp file
-        tspikes_handle = open(self._tmp_file, 'a')
-        for gid, tVec in sim.spikes_table.items():
-            for t in tVec:
-                tspikes_handle.write('{:.3f} {}\n'.format(t, gid))
-                self._n_spikes_rank += 1
-
-        pc.barrier()  # wait until all ranks have been saved
+        # take spikes from Simulator spikes vector and save to the output files
+        self._save_spikes(sim)
         sim.set_spikes_recording()  # reset recording vector
 
+    def save_checkpoint(self, sim):
+        # the number of spikes and size of the csv file, anything written after the checkpoint is dropped on resume
+        state = spike_files.get_offsets(self._n_spikes_total, self._csv_fhandle, self._h5_fhandle)
+        state['n_spikes_rank'] = self._n_spikes_rank
+        return state
+
+    def load_checkpoint(self, sim, state):
+        self._n_spikes_rank = state['n_spikes_rank']
+        self._n_spikes_total = state['n_spikes']
+        if MPI_RANK != 0:
+            return
+
+        h5_datasets = [self._gids_dataset, self._times_dataset] if self._save_h5 else []
+        spike_files.truncate(state, self._csv_fhandle, h5_datasets)
+
     def finalize(self, sim):
-        pc.barrier()
-        self._tmp_spikes_handles = {str(r): csv.reader(open(self._get_tmp_filename(r), 'r'), delimiter=' ')
-                                    for r in range(N_HOSTS)}
-        self._open_output()  # create csv and/or h5 files to write to
-        self._save_sorted()  # save
         self._close_output()  # flush and close the output files
         pc.barrier()
-
-        self._delete_tmp_file()  # remove the temporary files used to save spike data on each block
@@ -76,3 +76,19 @@ class SimulatorMod(object):
         :param sim: Simulation object
         """
         pass
+
+    def save_checkpoint(self, sim):
+        """Called when a checkpoint of the simulation is saved (see CheckpointMod).
+
+        :param sim: Simulation object
+        :return: A json serializable object with the state the module will need when the simulation is resumed.
+        """
+        return None
+
+    def load_checkpoint(self, sim, state):
+        """Called after initialize when a simulation is resumed from a checkpoint.
+
+        :param sim: Simulation object
+        :param state: The object returned by save_checkpoint() when the checkpoint was saved.
+        """
+        pass
@@ -45,6 +45,20 @@ class Morphology(object):
         self.nseg = self.get_nseg()
         self._segments = {}
 
+        self.seg_prop = None  # set by set_seg_props()
+        self.seg_coords = None  # set by calc_seg_coords()
+        self.psoma = None
+
+    def set_props(self, seg_prop, seg_coords, psoma):
+        """Use previously calculated segment properties and coordinates (eg. from a MorphologyCache) instead of calling
+        set_seg_props() and calc_seg_coords()"""
+        if len(seg_prop['x']) != self.nseg or seg_coords['p0'].shape[1] != self.nseg:
+            raise Exception('Morphology has {} segments, cached properties have {}.'.format(self.nseg,
+                                                                                         len(seg_prop['x'])))
+        self.seg_prop = seg_prop
+        self.seg_coords = seg_coords
+        self.psoma = psoma
+
     def get_nseg(self):
         nseg = 0
         for sec in self.hobj.all:
@@ -175,13 +189,13 @@ class Morphology(object):
 
     def get_target_segments(self, edge_type):
         # Determine the target segments and their probabilities of connections for each new edge-type. Save the
-        # information for each additional time a given edge-type is used on this morphology
-        if edge_type in self._segments:
-            return self._segments[edge_type]
-
+        # information for each additional time the same target sections and distance range are used on this morphology
         tar_sec_labels = edge_type.target_sections
         drange = edge_type.target_distance
         dmin, dmax = drange[0], drange[1]
+        segments_key = (tuple(tar_sec_labels), dmin, dmax)
+        if segments_key in self._segments:
+            return self._segments[segments_key]
 
         seg_d0 = self.seg_prop['dist0']  # use a more compact variables
         seg_d1 = self.seg_prop['dist1']
@@ -208,7 +222,7 @@ class Morphology(object):
         tar_seg_length = seg_length[tar_seg_ix] * frac_overlap[tar_seg_ix]  # weighted length of targeted segments
         tar_seg_prob = tar_seg_length / np.sum(tar_seg_length)  # probability of targeting segments
 
-        self._segments[edge_type] = (tar_seg_ix, tar_seg_prob)
+        self._segments[segments_key] = (tar_seg_ix, tar_seg_prob)
         return tar_seg_ix, tar_seg_prob
 
     """
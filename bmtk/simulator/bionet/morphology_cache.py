@@ -0,0 +1,104 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""On-disk cache of the segment properties and coordinates of processed morphologies.
+
+Computing the segment properties (Morphology.set_seg_props) and coordinates (Morphology.calc_seg_coords) requires
+going through every section and 3D point in NEURON, which is repeated for every morphology each time a simulation
+starts. The cache saves the resulting arrays into <cache_dir>/<key>.h5, where the key is a hash of the contents of
+the swc file, the maximum segment length (dL) and the name of the cell model function used to build the cell (which
+decides how the axon is replaced). If any of them change the key changes, so stale entries are never used.
+"""
+import os
+import hashlib
+import h5py
+
+
+CACHE_VERSION = 1  # increment when the content of the cache files changes
+
+SEG_PROP_KEYS = ['type', 'area', 'x', 'dist', 'length', 'dist0', 'dist1']
+SEG_COORDS_KEYS = ['p0', 'p1', 'd0', 'd1']
+
+
+class MorphologyCache(object):
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._file_hashes = {}  # swc file --> hash of its contents
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def _file_hash(self, file_name):
+        if file_name not in self._file_hashes:
+            with open(file_name, 'rb') as f:
+                self._file_hashes[file_name] = hashlib.sha1(f.read()).hexdigest()
+        return self._file_hashes[file_name]
+
+    def key(self, morphology_file, dL, model_type):
+        """Returns the key of a processed morphology.
+
+        :param morphology_file: path to the swc file
+        :param dL: maximum length of a segment, used to set the nseg of each section
+        :param model_type: name of the function used to build the cell (and fix the axon)
+        """
+        key_str = '{} {} {!r} {}'.format(CACHE_VERSION, self._file_hash(morphology_file), float(dL), model_type)
+        return hashlib.sha1(key_str.encode('utf-8')).hexdigest()
+
+    def _cache_file(self, key):
+        return os.path.join(self._cache_dir, '{}.h5'.format(key))
+
+    def load(self, key):
+        """Returns (seg_prop, seg_coords, psoma) for a given key, or None if it isn't cached."""
+        cache_file = self._cache_file(key)
+        if not os.path.exists(cache_file):
+            return None
+
+        with h5py.File(cache_file, 'r') as h5:
+            seg_prop = {k: h5['seg_prop'][k][()] for k in SEG_PROP_KEYS}
+            seg_coords = {k: h5['seg_coords'][k][()] for k in SEG_COORDS_KEYS}
+            psoma = h5['psoma'][()]
+        return seg_prop, seg_coords, psoma
+
+    def save(self, key, seg_prop, seg_coords, psoma):
+        """Saves the processed morphology. The file is written under a temporary name first so that other ranks (or
+        runs) never see a partially written file."""
+        if not os.path.exists(self._cache_dir):
+            try:
+                os.makedirs(self._cache_dir)
+            except OSError:
+                # created by another rank
+                pass
+
+        cache_file = self._cache_file(key)
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with h5py.File(tmp_file, 'w') as h5:
+            for k in SEG_PROP_KEYS:
+                h5.create_dataset('seg_prop/{}'.format(k), data=seg_prop[k])
+            for k in SEG_COORDS_KEYS:
+                h5.create_dataset('seg_coords/{}'.format(k), data=seg_coords[k])
+            h5.create_dataset('psoma', data=psoma)
+        os.rename(tmp_file, cache_file)
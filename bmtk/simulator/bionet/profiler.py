@@ -0,0 +1,135 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Helper classes for timing the different phases of a simulation on each rank.
+
+The setup of the network (building cells, morphologies, stimuli and connections) is timed by the Profiler of the
+BioNetwork, while the ProfilerMod (see modules/profiling.py) times the simulation itself. The reports of every rank are
+gathered onto rank 0 and saved as a json or (space separated) csv file.
+"""
+import time
+import json
+import resource
+from contextlib import contextmanager
+import pandas as pd
+
+
+def peak_rss():
+    """Returns the peak resident memory of the process so far in MB."""
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+
+class Profiler(object):
+    """Keeps track of the wall-clock time of the phases of a simulation, eg.
+
+        profiler = Profiler()
+        with profiler.phase('build_cells'):
+            network.build_cells()
+
+    If a phase is entered more than once its times are summed up. A phase entered within another phase is recorded with
+    the enclosing phase as its parent, its time is also part of the time of the parent so only the phases without a
+    parent add up to the total. For each phase the peak resident memory of the process at the end of the phase is also
+    recorded (peak_rss_so_far), since it is the peak of the whole process it never decreases from one phase to the next.
+    """
+    def __init__(self):
+        self._phases = []  # names, in the order they were first entered
+        self._wall_times = {}
+        self._ncalls = {}
+        self._parents = {}
+        self._peak_rss = {}
+        self._open_phases = []  # stack of the phases currently entered
+
+    @property
+    def phases(self):
+        return self._phases
+
+    def add(self, name, wall_time, ncalls=1, parent=None):
+        """Adds time to a phase.
+
+        :param name: name of the phase
+        :param wall_time: time (seconds) spent in the phase
+        :param ncalls: number of times the phase was entered
+        :param parent: name of the phase that includes this one, by default the phase currently entered (if any)
+        """
+        if name not in self._wall_times:
+            self._phases.append(name)
+            self._wall_times[name] = 0.0
+            self._ncalls[name] = 0
+            self._parents[name] = parent if parent is not None or not self._open_phases else self._open_phases[-1]
+        self._wall_times[name] += wall_time
+        self._ncalls[name] += ncalls
+        self._peak_rss[name] = peak_rss()
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.time()
+        self._open_phases.append(name)
+        try:
+            yield
+        finally:
+            self._open_phases.pop()
+            self.add(name, time.time() - start_time)
+
+    def wall_time(self, name):
+        return self._wall_times[name]
+
+    def parent(self, name):
+        return self._parents[name]
+
+    def to_dict(self):
+        """Returns a json serializable dictionary of the phases, keyed by name."""
+        return {name: {'wall_time': self._wall_times[name], 'ncalls': self._ncalls[name],
+                       'parent': self._parents[name], 'peak_rss_so_far': self._peak_rss[name]}
+                for name in self._phases}
+
+    def to_dataframe(self, rank=0):
+        columns = ['rank', 'phase', 'parent', 'wall_time', 'ncalls', 'peak_rss_so_far']
+        return pd.DataFrame({'rank': rank,
+                             'phase': self._phases,
+                             'parent': [self._parents[n] for n in self._phases],
+                             'wall_time': [self._wall_times[n] for n in self._phases],
+                             'ncalls': [self._ncalls[n] for n in self._phases],
+                             'peak_rss_so_far': [self._peak_rss[n] for n in self._phases]},
+                            columns=columns)
+
+
+def write_report(file_name, profilers):
+    """Saves the phases of every rank. Files ending with .csv are saved as a space separated table with one row per
+    rank/phase, otherwise as json with a list of phases for each rank.
+
+    :param file_name: path of the report
+    :param profilers: list of Profiler objects, one for each rank
+    """
+    if file_name.endswith('.csv'):
+        report_df = pd.concat([p.to_dataframe(rank) for rank, p in enumerate(profilers)], ignore_index=True)
+        report_df.to_csv(file_name, sep=' ', index=False)
+    else:
+        report = {'nhost': len(profilers),
+                  'ranks': [{'rank': rank, 'order': p.phases, 'phases': p.to_dict()}
+                            for rank, p in enumerate(profilers)]}
+        with open(file_name, 'w') as f:
+            json.dump(report, f, indent=2)
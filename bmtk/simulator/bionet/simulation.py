@@ -136,6 +136,21 @@ class Simulation(object):
     def h(self):
         return self._h
 
+    @property
+    def start_from_state(self):
+        return self._start_from_state
+
+    @property
+    def mods(self):
+        return self._sim_mods
+
+    def set_tstep(self, tstep):
+        """Sets the current time step, used when resuming a simulation from a saved checkpoint"""
+        self.tstep = tstep
+        self.tstep_start_block = tstep
+        self.__tstep_start_block = tstep
+        self.__tstep_end_block = tstep
+
     def __elapsed_time(self, time_s):
         if time_s < 120:
             return '{:.4} seconds'.format(time_s)
@@ -230,6 +245,10 @@ class Simulation(object):
             mod.finalize(self)
         pc.barrier()
 
+        if self.net.balance_file is not None:
+            # save the measured cost of each cell for distributing the cells in the next run
+            self.net.save_balance_file(self.net.balance_file, pc.step_time())
+
         end_time = time.time()
 
         sim_time = self.__elapsed_time(end_time - s_time)
@@ -273,39 +292,70 @@ class Simulation(object):
 
     @classmethod
     def from_config(cls, config, network, set_recordings=True):
+        """Builds the simulation from the configuration.
+
+        When run/start_from_state is set the simulation is resumed from the latest checkpoint in run/checkpoint_dir,
+        appending to the existing output files (see io.setup_output_dir).
+
+        :param config: simulation configuration
+        :param network: BioNetwork object
+        :param set_recordings: set to False to not record spikes or ecp
+        """
+        resume = config['run'].get('start_from_state', False)
+        checkpoint_dir = config['run'].get('checkpoint_dir', None)
+        if resume and checkpoint_dir is None:
+            raise Exception('Unable to resume simulation, run/checkpoint_dir is not set.')
+
         sim = cls(network=network,
                   dt=config['run']['dt'],
                   tstop=config['run']['tstop'],
                   v_init=config['conditions']['v_init'],
                   celsius=config['conditions']['celsius'],
-                  nsteps_block=config['run']['nsteps_block'])
+                  nsteps_block=config['run']['nsteps_block'],
+                  start_from_state=resume)
+
+        if config['output'].get('profile_file', None) is not None:
+            # added first so the initialization of the other modules is also timed
+            profiler_mod = mods.ProfilerMod(report_file=config['output']['profile_file'],
+                                            setup_profiler=network.profiler)
+            sim.add_mod(profiler_mod)
 
         if config['run']['save_cell_vars']:
             # Initialize save biophysical cell variables
             cell_vars = config['run']['save_cell_vars']
             cell_vars_output = config['output']['cell_vars_dir']
-            cellvars_mod = mods.CellVarsMod(outputdir=cell_vars_output, variables=cell_vars)
+            cellvars_mod = mods.CellVarsMod(outputdir=cell_vars_output, variables=cell_vars,
+                                            sections=config['run'].get('cell_vars_sections', 'soma'),
+                                            seg_x=config['run'].get('cell_vars_seg_x', None),
+                                            distance_range=config['run'].get('cell_vars_distance_range', None))
             sim.add_mod(cellvars_mod)
 
         if set_recordings:
             config_output = config['output']
-            output_dir = config_output['output_dir']
 
             # Recording spikes
             spikes_csv_file = config_output.get('spikes_ascii_file', None)
             spikes_h5_file = config_output.get('spikes_hdf5_file', None)
             if spikes_csv_file is not None or spikes_h5_file is not None:
-                spikes_mod = mods.SpikesMod(tmpdir=output_dir,csv_filename=spikes_csv_file, h5_filename=spikes_h5_file)
+                spikes_mod = mods.SpikesMod(csv_filename=spikes_csv_file, h5_filename=spikes_h5_file)
                 sim.add_mod(spikes_mod)
 
             # recording extracell field potential
             if config['run']['calc_ecp']:
                 ecp_mod = mods.EcpMod(ecp_file=config['output']['ecp_file'],
                                       positions_file=config['recXelectrode']['positions'],
-                                      tmp_outputdir=config['output']['output_dir'])
+                                      tmp_outputdir=config['output']['output_dir'],
+                                      max_distance=config['recXelectrode'].get('max_distance', None),
+                                      debug=config['recXelectrode'].get('debug', False))
                 sim.add_mod(ecp_mod)
             sim.set_recordings()
 
+        if checkpoint_dir is not None:
+            # must be the last module so it's initialized after, and saved after, all the other modules
+            checkpoint_mod = mods.CheckpointMod(checkpoint_dir=checkpoint_dir,
+                                                nblocks=config['run'].get('checkpoint_nblocks', 1))
+            sim.add_mod(checkpoint_mod)
+
         if 'input' in config:
             for input_dict in config['input']:
                 in_type = input_dict['type'].lower()
@@ -0,0 +1,67 @@
+# Allen Institute Software License - This software license is the 2-clause BSD license plus clause a third
+# clause that prohibits redistribution for commercial purposes without further permission.
+#
+# Copyright 2017. Allen Institute. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Redistributions for commercial purposes are not permitted without the Allen Institute's written permission. For
+# purposes of this license, commercial purposes is the incorporation of the Allen Institute's software into anything for
+# which you will charge fees or other compensation. Contact terms@alleninstitute.org for commercial licensing
+# opportunities.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Checkpointing of the spike output files of the SpikesMod.
+
+Spikes are only ever appended to the csv file and the gid/time datasets of the h5 file, so the state of the files at a
+checkpoint is the size of the csv file and the number of spikes saved. When the simulation is resumed the files are cut
+back to that state, dropping any spikes saved after the checkpoint. Kept apart from the SpikesMod so it does not depend
+on NEURON.
+"""
+
+
+def get_offsets(n_spikes, csv_fhandle=None, h5_fhandle=None):
+    """Flushes the output files and returns the state of the files, ie. the number of spikes saved and the size of the
+    csv file.
+
+    :param n_spikes: total number of spikes saved to the files
+    :param csv_fhandle: csv file handle, or None if spikes aren't saved to csv
+    :param h5_fhandle: h5py File handle, or None if spikes aren't saved to h5
+    :return: dictionary with the n_spikes and csv_offset
+    """
+    csv_offset = 0
+    if csv_fhandle is not None:
+        csv_fhandle.flush()
+        csv_offset = csv_fhandle.tell()
+
+    if h5_fhandle is not None:
+        h5_fhandle.flush()
+
+    return {'n_spikes': n_spikes, 'csv_offset': csv_offset}
+
+
+def truncate(offsets, csv_fhandle=None, h5_datasets=()):
+    """Cuts the output files back to the state returned by get_offsets().
+
+    :param offsets: dictionary with the n_spikes and csv_offset at the checkpoint
+    :param csv_fhandle: csv file handle, or None if spikes aren't saved to csv
+    :param h5_datasets: resizable h5 datasets with one value for each spike (ie. the gids and times)
+    """
+    if csv_fhandle is not None:
+        csv_fhandle.truncate(offsets['csv_offset'])
+
+    for dataset in h5_datasets:
+        dataset.resize((offsets['n_spikes'],))
@@ -32,7 +32,6 @@ Representation of a Virtual/External/Stim node.
 
 TODO:
  * Rename to Virtual
- * This is the biggest bottleneck when loading a network, find a way to optimize.
 """
 class Stim(object):
     def __init__(self, stim_prop, spike_train_dataset):
@@ -25,12 +25,9 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
-import os
 import numpy as np
 import math
 import json
-import pandas as pd
-import h5py
 
 from neuron import h
 
@@ -51,45 +48,6 @@ def rotation_matrix(axis, theta):
                      [2*(bd+ac), 2*(cd-ab), aa+dd-bb-cc]])
 
 
-def edge_converter_csv(output_dir, csv_file):
-    """urrently being used by BioNetwork.write_connections(), need to refactor
-
-    :param output_dir:
-    :param csv_file:
-    :return:
-    """
-    syns_df = pd.read_csv(csv_file, sep=' ')
-    for name, group in syns_df.groupby(['trg_network', 'src_network']):
-        trg_net, src_net = name
-        group_len = len(group.index)
-        with h5py.File(os.path.join(output_dir, '{}_{}_edges.h5'.format(trg_net, src_net)), 'w') as conns_h5:
-            conns_h5.create_dataset('edges/target_gid', data=group['trg_gid'])
-            conns_h5.create_dataset('edges/source_gid', data=group['src_gid'])
-            conns_h5.create_dataset('edges/edge_type_id', data=group['edge_type_id'])
-            conns_h5.create_dataset('edges/edge_group', data=group['connection_group'])
-
-            group_counters = {group_id: 0 for group_id in group.connection_group.unique()}
-            edge_group_indicies = np.zeros(group_len, dtype=np.uint)
-            for i, group_id in enumerate(group['connection_group']):
-                edge_group_indicies[i] = group_counters[group_id]
-                group_counters[group_id] += 1
-            conns_h5.create_dataset('edges/edge_group_indicies', data=edge_group_indicies)
-
-            for group_class, sub_group in group.groupby('connection_group'):
-                grp = conns_h5.create_group('edges/{}'.format(group_class))
-                if group_class == 0:
-                    grp.create_dataset('sec_id', data=sub_group['segment'], dtype='int')
-                    grp.create_dataset('sec_x', data=sub_group['section'])
-                    grp.create_dataset('syn_weight', data=sub_group['weight'])
-                    grp.create_dataset('delay', data=sub_group['delay'])
-                elif group_class == 1:
-                    grp.create_dataset('syn_weight', data=sub_group['weight'])
-                    grp.create_dataset('delay', data=sub_group['delay'])
-                else:
-                    print('Unknown cell group {}'.format(group_class))
-
-
-
 ##################################################
 # TODO: Move these functions to default_setters
 ##################################################
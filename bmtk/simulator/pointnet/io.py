@@ -33,10 +33,13 @@ import os
 import sys
 import shutil
 import glob
-import csv
+import h5py
+import numpy as np
 import pandas as pd
 import logging
 
+from bmtk.simulator.utils.load_spikes import read_gdf_files, merge_sorted_spikes
+
 # For older versions of NEST we must call nest before calling mpi4py, otherwise nest.NumProcesses() gets set to 1.
 import nest
 
@@ -58,29 +61,50 @@ console_handler.setFormatter(log_format)
 pointnet_logger.addHandler(console_handler)
 
 
-def collect_gdf_files(gdf_dir, output_file, nest_id_map, overwrite=False):
+def collect_gdf_files(gdf_dir, output_file, nest_id_map, overwrite=False, h5_file=None):
+    """Collects the spikes in the gdf files written by NEST into a single space-separated "time node_id" file, and
+    optionally an hdf5 file with "time" and "gid" datasets, sorted by spike time.
+
+    Each rank reads and sorts its share of the gdf files, rank 0 merges the sorted spikes and writes the output.
 
-    if n_nodes > 0:
+    :param gdf_dir: directory containing the .gdf files.
+    :param output_file: path of the csv spikes file.
+    :param nest_id_map: array of the node-id of every NEST ID (or a dictionary {nest_id: node_id}).
+    :param overwrite: replace an existing output_file.
+    :param h5_file: path of the hdf5 spikes file, or None.
+    """
+    if n_nodes > 1:
         # Wait until all nodes are finished
         comm.Barrier()
 
-    if rank != 0:
-        return
-
     log("Saving spikes to file...")
-    spikes_out = output_file
-    if os.path.exists(spikes_out) and not overwrite:
+    if os.path.exists(output_file) and not overwrite:
         return
 
-    gdf_files_globs = '{}/*.gdf'.format(gdf_dir)
-    gdf_files = glob.glob(gdf_files_globs)
-    with open(spikes_out, 'w') as spikes_file:
-        csv_writer = csv.writer(spikes_file, delimiter=' ')
-        for gdffile in gdf_files:
-            spikes_df = pd.read_csv(gdffile, names=['gid', 'time', 'nan'], sep='\t')
-            for _, row in spikes_df.iterrows():
-                csv_writer.writerow([row['time'], nest_id_map[int(row['gid'])]])
-            os.remove(gdffile)
+    if isinstance(nest_id_map, dict):
+        nest_to_gid = np.full(max(nest_id_map.keys()) + 1 if nest_id_map else 0, -1, dtype=np.int64)
+        nest_to_gid[np.array(nest_id_map.keys(), dtype=np.int64)] = np.array(nest_id_map.values(), dtype=np.int64)
+    else:
+        nest_to_gid = np.asarray(nest_id_map, dtype=np.int64)
+
+    gdf_files = sorted(glob.glob('{}/*.gdf'.format(gdf_dir)))
+    rank_spikes = read_gdf_files(gdf_files[rank::n_nodes], nest_to_gid)
+    if n_nodes > 1:
+        all_spikes = comm.gather(rank_spikes, root=0)
+        if rank != 0:
+            return
+        times, gids = merge_sorted_spikes(all_spikes)
+    else:
+        times, gids = rank_spikes
+
+    spikes_df = pd.DataFrame({'time': times, 'gid': gids}, columns=['time', 'gid'])
+    spikes_df.to_csv(output_file, sep=' ', header=False, index=False)
+
+    if h5_file is not None:
+        with h5py.File(h5_file, 'w') as h5:
+            h5.create_dataset('gid', data=gids.astype(np.int32))
+            h5.create_dataset('time', data=times)
+
     log("done.")
 
 
@@ -28,11 +28,13 @@
 import os
 import glob
 import h5py
+import numpy as np
 
 import bmtk.simulator.pointnet.config as cfg
-from bmtk.simulator.pointnet.cell import NestCell, VirtualCell
 from bmtk.simulator.pointnet.property_schemas import CellTypes
 import bmtk.simulator.pointnet.io as io
+from bmtk.simulator.pointnet.utils import target_batches, build_id_map, map_ids
+from bmtk.simulator.utils.load_spikes import SpikeTrainsTable
 
 import nest
 
@@ -57,6 +59,8 @@ class PointNetwork(object):
         * Save parameters like membrane voltage using a multimeter on individual nodes.
         * Add ability to insert current and voltage clamps directly into internal nodes.
     """
+    edges_batch_size = 2**20  # maximum number of edges read and connected at a time
+
     def __init__(self, graph, dt=0.001, overwrite=True, print_time=False):
         self._duration = 0.0  # simulation time
         self._dt = dt  # time step
@@ -69,14 +73,18 @@ class PointNetwork(object):
         self._internal_connections_built = False
 
         self._graph = graph
-        self._external_cells = {}  # dict-of-dict of external pointnet cells with keys [network_name][cell_id]
-        self._internal_cells = {}  # dictionary of internal pointnet cells with cell_id as key
-        self._nest_id_map = {}  # a map between NEST IDs and Node-IDs
+        self._external_gids = {}  # node-ids of the virtual cells of each external network
+        self._external_gid_to_nest = {}  # NEST ID of every virtual node-id of each external network, -1 if not virtual
+        self._internal_gids = np.zeros(0, dtype=np.int64)  # node-ids of all internal cells
+        self._gid_to_nest = np.zeros(0, dtype=np.int64)  # NEST ID of every internal node-id, -1 if not internal
+        self._nest_to_gid = np.zeros(0, dtype=np.int64)  # Node-ID of every internal NEST ID, -1 if not internal
 
         self._spikedetector = None
         self._spikes_file = None  # File where all output spikes will be collected and saved
+        self._spikes_h5_file = None  # optional hdf5 file where the output spikes are also saved
         self._tmp_spikes_file = None  # temporary gdf files of spike-trains
         self._spike_trains_ds = {}  # used to temporary store NWB datasets containing spike trains
+        self._spike_trains_tables = {}  # spike trains read from csv files, SpikeTrainsTable for each network
 
         # Reset the NEST kernel for a new simualtion
         # TODO: move this into it's own function and make sure it is called before network is built
@@ -96,6 +104,14 @@ class PointNetwork(object):
     def spikes_file(self, value):
         self._spikes_file = value
 
+    @property
+    def spikes_h5_file(self):
+        return self._spikes_h5_file
+
+    @spikes_h5_file.setter
+    def spikes_h5_file(self, value):
+        self._spikes_h5_file = value
+
     @property
     def output_dir(self):
         return self._output_dir
@@ -126,6 +142,21 @@ class PointNetwork(object):
         # TODO: validate that it is a positive number
         self._duration = value
 
+    @property
+    def internal_gids(self):
+        return self._internal_gids
+
+    def nest_ids(self, gids):
+        """Returns the NEST IDs of an array of internal node-ids"""
+        return self._gid_to_nest[np.asarray(gids, dtype=np.int64)]
+
+    def _set_nest_ids(self, gids, nest_ids):
+        gids = np.asarray(gids, dtype=np.int64)
+        nest_ids = np.asarray(nest_ids, dtype=np.int64)
+        self._internal_gids = gids
+        self._gid_to_nest = build_id_map(gids, nest_ids)
+        self._nest_to_gid = build_id_map(nest_ids, gids)
+
     def build_cells(self):
         """Build NEST-based cells from graph"""
         # Create spike detector to attach to all internal nodes
@@ -135,44 +166,144 @@ class PointNetwork(object):
         nest.SetStatus(self._spikedetector, {'label': os.path.join(self.output_dir, 'tmp_spike_times'),
                                              'withtime': True, 'withgid': True, 'to_file': True})
 
-        # build internal nodes
+        # build internal nodes, with a single nest.Create() call for all the nodes of the same model and node-type.
         # TODO: since networks can be mixed we should loop around entire network checking if nodes are virtual or not.
+        node_groups = {}
         for node in self._graph.get_internal_nodes():
-            ncell = NestCell(node)
-            ncell.set_spike_detector(self._spikedetector)
-            self._internal_cells[node.node_id] = ncell
-            self._nest_id_map[ncell.nest_id] = node.node_id
-
-        # build external nodes
+            group_key = (node.model_type, node.node_type_id)
+            if group_key not in node_groups:
+                node_groups[group_key] = []
+            node_groups[group_key].append(node)
+
+        gids = []
+        nest_ids = []
+        for (model_type, _), nodes in sorted(node_groups.items()):
+            model_params = nodes[0].model_params
+            group_ids = nest.Create(model_type, len(nodes), model_params)
+
+            # nodes with their own dynamics_params are updated with one call
+            updated_nodes = [(nest_id, node.model_params) for nest_id, node in zip(group_ids, nodes)
+                             if node.model_params is not model_params and node.model_params != model_params]
+            if updated_nodes:
+                nest.SetStatus([nest_id for nest_id, _ in updated_nodes], [params for _, params in updated_nodes])
+
+            gids.extend(node.node_id for node in nodes)
+            nest_ids.extend(group_ids)
+
+        self._set_nest_ids(gids, nest_ids)
+        if nest_ids:
+            nest.Connect(list(nest_ids), self._spikedetector)
+
+        # build external nodes, all the spike_generators of a network are created with a single nest.Create() call
         for network in self._graph.external_networks():
-            self._external_cells[network] = {}
-            for node in self._graph.get_nodes(network):
-                if node.model_class == CellTypes.Virtual:
-                    # TODO: if dynamics_params are globally set then we can create all nodes at once.
-                    # TODO: Put nest_id param in PointGraph.Node and we can set vcell.nest_id =
-                    vcell = VirtualCell(node)
-                    self._external_cells[network][vcell.node_id] = vcell
+            nodes = [node for node in self._graph.get_nodes(network) if node.model_class == CellTypes.Virtual]
+            ext_gids = np.array([node.node_id for node in nodes], dtype=np.int64)
+            ext_nest_ids = nest.Create('spike_generator', len(nodes)) if nodes else []
+            model_params = [node.model_params for node in nodes]
+            if any(model_params):
+                nest.SetStatus(list(ext_nest_ids), [params or {} for params in model_params])
+
+            self._external_gids[network] = ext_gids
+            self._external_gid_to_nest[network] = build_id_map(ext_gids, ext_nest_ids)
 
         self._cells_built = True
 
     def set_recurrent_connections(self):
         """Creates recurrent (internal) connections"""
         for src_network in self._graph.internal_networks():
-            for trg_gid, trg_cell in self._internal_cells.items():
-                for _, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, src_network):
-                    src_cell = self._internal_cells[src_prop.node_id]
-                    trg_cell.set_synaptic_connection(src_cell, trg_cell, edge_prop)
+            self._set_connections(src_network)
 
     def set_external_connections(self, source_network):
         """Connect virtual nodes of an external network onto the internal network.
 
         :param source_network: Name of external network that targets internal nodes.
         """
-        # for every internal target get source nodes and edges that connect to it create a NEST connection.
-        for trg_gid, trg_cell in self._internal_cells.items():
-            for _, src_prop, edge_prop in self._graph.edges_iterator(trg_gid, source_network):
-                src_cell = self._external_cells[source_network][src_prop.node_id]  # NEST implementation of source
-                trg_cell.set_synaptic_connection(src_cell, trg_cell, edge_prop)
+        self._set_connections(source_network)
+
+    def _set_connections(self, src_network):
+        """Creates the connections from a source network onto every internal network. The edges are read in batches of
+        at most edges_batch_size edges, and every edge-type of a batch is connected with a single nest.Connect() call.
+        """
+        for trg_network in self._graph.internal_networks():
+            edges_table = self._graph.edges_table(trg_network, src_network)
+            if edges_table is None:
+                continue
+
+            try:
+                batches = target_batches(edges_table.target_counts(), self.edges_batch_size)
+            except NotImplementedError:
+                # edges format doesn't support reading in bulk
+                self._set_connections_per_edge(src_network, trg_network)
+                continue
+
+            for gid_start, gid_end in batches:
+                edges_df = edges_table.read_target_range(gid_start, gid_end, with_types=True)
+                if len(edges_df) > 0:
+                    self._connect_edges(edges_df, src_network, trg_network)
+
+    def _source_nest_ids(self, src_network, src_gids):
+        """Returns the NEST IDs of the source nodes of a network, which may be either internal or virtual."""
+        if src_network in self._external_gid_to_nest:
+            nest_ids = map_ids(self._external_gid_to_nest[src_network], src_gids)
+        else:
+            nest_ids = map_ids(self._gid_to_nest, src_gids)
+
+        if np.any(nest_ids < 0):
+            missing_gids = np.unique(np.asarray(src_gids)[nest_ids < 0])
+            raise Exception('Source nodes {} of network {} were not built, they are neither internal nor virtual '
+                            'nodes.'.format(missing_gids.tolist(), src_network))
+        return nest_ids
+
+    def _edge_weights(self, edges_df, src_network, trg_network):
+        """Finds the weight of every edge in a table using the weight function of each edge."""
+        weights = np.zeros(len(edges_df), dtype=np.float64)
+        for i, (_, row) in enumerate(edges_df.iterrows()):
+            edge_props = self._graph.create_edge(row.to_dict())
+            src_node = self._graph.get_node(int(row['source_gid']), src_network)
+            trg_node = self._graph.get_node(int(row['target_gid']), trg_network)
+            weights[i] = edge_props.weight(src_node, trg_node)
+        return weights
+
+    def _connect_edges(self, edges_df, src_network, trg_network):
+        """Connects a table of edges, with one_to_one nest.Connect() call and arrays of weights and delays for each
+        edge-type."""
+        trg_nest_ids = map_ids(self._gid_to_nest, edges_df['target_gid'].values)
+        internal_targets = trg_nest_ids >= 0
+        edges_df = edges_df[internal_targets]
+        trg_nest_ids = trg_nest_ids[internal_targets]
+
+        edge_type_ids = edges_df['edge_type_id'].values
+        for edge_type_id in np.unique(edge_type_ids):
+            type_df = edges_df[edge_type_ids == edge_type_id]
+            edge_props = self._graph.create_edge(type_df.iloc[0].to_dict())
+            weights = self._graph.property_schema.get_edge_weights(type_df)
+            if weights is None:
+                weights = self._edge_weights(type_df, src_network, trg_network)
+
+            syn_spec = dict(edge_props['dynamics_params'])
+            syn_spec['delay'] = type_df['delay'].values.astype(np.float64)
+            syn_spec['weight'] = np.asarray(weights, dtype=np.float64)
+            pre_ids = self._source_nest_ids(src_network, type_df['source_gid'].values.astype(np.int64))
+            post_ids = trg_nest_ids[edge_type_ids == edge_type_id]
+            nest.Connect(pre_ids.tolist(), post_ids.tolist(), {'rule': 'one_to_one'}, syn_spec)
+
+    def _set_synaptic_connection(self, src_nest_id, trg_nest_id, src_node, trg_node, edge_props):
+        syn_dict = dict(edge_props['dynamics_params'])
+        syn_dict['delay'] = edge_props.delay  # TODO: delay may be in the dynamic params
+        syn_dict['weight'] = edge_props.weight(src_node, trg_node)
+
+        # TODO: don't build the rule every time
+        nest.Connect([src_nest_id], [trg_nest_id], {'rule': 'all_to_all'}, syn_dict)
+
+    def _set_connections_per_edge(self, src_network, trg_network):
+        for trg_node in self._graph.get_internal_nodes():
+            if trg_node.network != trg_network:
+                continue
+
+            trg_nest_id = int(self._gid_to_nest[trg_node.node_id])
+            for trg_prop, src_prop, edge_prop in self._graph.edges_iterator(trg_node.node_id, src_network):
+                src_nest_id = int(self._source_nest_ids(src_network, np.array([src_prop.node_id]))[0])
+                self._set_synaptic_connection(src_nest_id, trg_nest_id, src_prop, trg_prop, edge_prop)
 
     def add_spikes_nwb(self, network, nwb_file, trial):
         """Adds spike trains from nwb file
@@ -184,26 +315,54 @@ class PointNetwork(object):
         h5_file = h5py.File(nwb_file, 'r')
         self._spike_trains_ds[network] = h5_file['processing'][trial]['spike_train']
 
-    def _get_spike_trains(self, src_gid, network):
+    def add_spikes_csv(self, network, csv_file, sep=' '):
+        """Adds spike trains from a csv file
+
+        :param network: name of external network to add spike trains.
+        :param csv_file: csv file with either 'gid' and 'spike-times' columns, or one spike per row with 'gid' and
+            'time' columns.
+        :param sep: column separator of the csv file.
+        """
+        self._spike_trains_tables[network] = SpikeTrainsTable.from_csv(csv_file, sep=sep)
+
+    def _get_spike_trains(self, network):
+        """Returns a SpikeTrainsTable with the spike trains of the virtual cells of a network, or None."""
+        gids = self._external_gids.get(network, [])
         if network in self._spike_trains_ds:
-            h5ds = self._spike_trains_ds[network]
-            src_gid_str = str(src_gid)
-            if src_gid_str in h5ds.keys():
-                return h5ds[src_gid_str]['data']
+            return SpikeTrainsTable.from_nwb(self._spike_trains_ds[network], gids)
+        elif network in self._spike_trains_tables:
+            return self._spike_trains_tables[network]
 
         return None
 
     def make_stims(self):
         """Initialize all stimulations (spikes, injections, etc)"""
         # TODO: this is a hold-over from bionet, it may be better to set stimulations in their respective functions.
-        # TODO: it is very slow, investigate
         for network in self._graph.external_networks():
-            # For each external node in the graph grab the spike-trains
             # TODO: skip if external network is not connected.
-            for node_id, node in self._external_cells[network].items():
-                spikes = self._get_spike_trains(node_id, network)
-                if spikes is not None:
-                    node.set_spike_train(spikes[:])
+            spike_trains = self._get_spike_trains(network)
+            if spike_trains is None:
+                continue
+
+            # Set the spike times of every spike_generator in the network with a single nest.SetStatus() call
+            # TODO: there is issues if the spike times are out-of-order, or if they are not lined up with the given
+            #       resolution (dt). Need some further preprocessing.
+            gid_to_nest = self._external_gid_to_nest[network]
+            generator_ids = []
+            generator_params = []
+            for gid in self._external_gids[network].tolist():
+                spike_times = spike_trains.get(gid)
+                if len(spike_times) > 0 and spike_times[0] == 0.0:
+                    # NEST doesn't allow spikes at time 0 which some of our data does have
+                    spike_times = spike_times[1:]
+                if len(spike_times) == 0:
+                    continue
+
+                generator_ids.append(int(gid_to_nest[gid]))
+                generator_params.append({'spike_times': spike_times})
+
+            if generator_ids:
+                nest.SetStatus(generator_ids, generator_params)
 
     def _get_block_trial(self, duration):
         """
@@ -237,7 +396,8 @@ class PointNetwork(object):
         if n_nodes > 1:
             comm.Barrier()
 
-        io.collect_gdf_files(self.output_dir, self._spikes_file, self._nest_id_map, self._overwrite)
+        io.collect_gdf_files(self.output_dir, self._spikes_file, self._nest_to_gid, self._overwrite,
+                             self._spikes_h5_file)
 
     @classmethod
     def from_config(cls, configure, graph):
@@ -264,6 +424,7 @@ class PointNetwork(object):
             network.output_dir = config['output']['output_dir']
 
         network.spikes_file = config['output']['spikes_ascii']
+        network.spikes_h5_file = config['output'].get('spikes_hdf5', None)
 
         if 'block_run' in run_dict and run_dict['block_run']:
             if 'block_size' not in run_dict:
@@ -307,6 +468,9 @@ class PointNetwork(object):
                 if netinput['type'] == 'external_spikes' and netinput['format'] == 'nwb' and netinput['active']:
                     network.add_spikes_nwb(netinput['source_nodes'], netinput['file'], netinput['trial'])
 
+                elif netinput['type'] == 'external_spikes' and netinput['format'] == 'csv' and netinput['active']:
+                    network.add_spikes_csv(netinput['source_nodes'], netinput['file'])
+
             io.log('Adding stimulations')
             network.make_stims()
 
@@ -66,3 +66,8 @@ class PropertySchema(object):
     def get_edge_weight(self, src_node, trg_node, edge_props):
         raise NotImplementedError()
 
+    def get_edge_weights(self, edges_df):
+        """Returns the weights of many edges at once from a table of edge properties (see
+        EdgesFile.read_target_range), or None if the weight of each edge must be found using get_edge_weight()."""
+        return None
+
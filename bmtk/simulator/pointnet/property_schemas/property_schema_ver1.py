@@ -40,3 +40,6 @@ class PropertySchema(BaseSchema):
 
     def get_edge_weight(self, src_node, trg_node, edge_props):
         return edge_props['syn_weight']
+
+    def get_edge_weights(self, edges_df):
+        return edges_df['syn_weight'].values if 'syn_weight' in edges_df.columns else None
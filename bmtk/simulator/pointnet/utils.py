@@ -190,3 +190,37 @@ def load_conns(cnn_fn):
         conns_mapping[keys] = [weights[xin], delays[xin]]
 
     return conns_mapping
+
+
+def target_batches(target_counts, batch_size):
+    """Splits the targets into ranges [gid_start, gid_end) with at most batch_size edges each. A single target with
+    more than batch_size edges gets a range of its own.
+
+    :param target_counts: array with the number of edges of every target gid.
+    :param batch_size: maximum number of edges in a batch.
+    :return: list of (gid_start, gid_end) tuples.
+    """
+    cumulative_counts = np.cumsum(target_counts)
+    bounds = [0]
+    while bounds[-1] < len(target_counts):
+        batch_start = cumulative_counts[bounds[-1] - 1] if bounds[-1] > 0 else 0
+        batch_end = np.searchsorted(cumulative_counts, batch_start + batch_size, side='right')
+        bounds.append(max(int(batch_end), bounds[-1] + 1))
+    return zip(bounds[:-1], bounds[1:])
+
+
+def build_id_map(ids, mapped_ids):
+    """Returns an array that maps every id to its mapped id, with -1 for ids that are not mapped."""
+    ids = np.asarray(ids, dtype=np.int64)
+    id_map = np.full(ids.max() + 1 if len(ids) > 0 else 0, -1, dtype=np.int64)
+    id_map[ids] = np.asarray(mapped_ids, dtype=np.int64)
+    return id_map
+
+
+def map_ids(id_map, ids):
+    """Looks up an array of ids in an id map built with build_id_map(), returns -1 for the ids that are not mapped."""
+    ids = np.asarray(ids, dtype=np.int64)
+    mapped_ids = np.full(len(ids), -1, dtype=np.int64)
+    in_map = (ids >= 0) & (ids < len(id_map))
+    mapped_ids[in_map] = id_map[ids[in_map]]
+    return mapped_ids
@@ -36,6 +36,7 @@ class PopEdge(SimEdge):
         self._weight = self.__get_prop('weight', 0.0)
         self._nsyns = self.__get_prop('nsyns', 0)
         self._delay = self.__get_prop('delay', 0.0)
+        self._n_edges = 0  # number of cell-to-cell edges between the two populations with this edge-type
 
     @property
     def source(self):
@@ -65,6 +66,14 @@ class PopEdge(SimEdge):
     def nsyns(self, value):
         self._nsyns = value
 
+    @property
+    def n_edges(self):
+        return self._n_edges
+
+    @n_edges.setter
+    def n_edges(self, value):
+        self._n_edges = value
+
     @property
     def delay(self):
         return self._delay
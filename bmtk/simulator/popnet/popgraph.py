@@ -27,6 +27,7 @@
 #
 import os
 import json
+import numpy as np
 
 from bmtk.simulator.utils.graph import SimGraph
 from property_schemas import PopTypes, DefaultPropertySchema
@@ -104,27 +105,88 @@ class PopGraph(SimGraph):
             self._source_edges[source_network] = []
 
         target_pops = self.get_populations(target_network)
-        source_pops = self.get_populations(source_network)
         source_gid_table = self._gid_table[source_network]
 
+        try:
+            self._add_edges_bulk(edges, target_network, source_network)
+            return
+        except NotImplementedError:
+            # edges format can't read the index columns as arrays, go through the edges of every target
+            pass
+
         for target_pop in target_pops:
             for target_gid in target_pop.get_gids():
                 for edge in edges.edges_itr(target_gid):
                     source_pop = source_gid_table[edge.source_gid]
                     self._add_edge(source_pop, target_pop, edge)
 
-    def _add_edge(self, source_pop, target_pop, edge):
+    def _pop_lookup(self, network, pops):
+        """Returns an array with the index (in pops) of the population of every gid in network, -1 for missing gids."""
+        gid_table = self._gid_table.get(network, {})
+        pop_index = {id(pop): i for i, pop in enumerate(pops)}
+        gids = np.array(gid_table.keys(), dtype=np.int64)
+        lookup = np.full(gids.max() + 1 if len(gids) > 0 else 0, -1, dtype=np.int64)
+        lookup[gids] = [pop_index[id(pop)] for pop in gid_table.values()]
+        return lookup
+
+    def _add_edges_bulk(self, edges, target_network, source_network):
+        """Finds all the unique (source population, target population, edge-type) connections of an edges file at once,
+        mapping the gid arrays of the edges to populations and reducing them with np.unique.
+        """
+        trg_gids, src_gids, edge_type_ids = edges.index_arrays()
+        trg_gids = np.asarray(trg_gids, dtype=np.int64)
+        src_gids = np.asarray(src_gids, dtype=np.int64)
+        edge_type_ids = np.asarray(edge_type_ids, dtype=np.int64)
+
+        target_pops = self.get_populations(target_network)
+        source_pops = self.get_populations(source_network)
+        trg_lookup = self._pop_lookup(target_network, target_pops)
+        src_lookup = self._pop_lookup(source_network, source_pops)
+
+        # only keep edges that target one of the populations in the target network
+        trg_pop_ids = np.full(len(trg_gids), -1, dtype=np.int64)
+        in_range = trg_gids < len(trg_lookup)
+        trg_pop_ids[in_range] = trg_lookup[trg_gids[in_range]]
+        rows = np.nonzero(trg_pop_ids >= 0)[0]
+        trg_pop_ids = trg_pop_ids[rows]
+        src_gids = src_gids[rows]
+
+        src_pop_ids = np.full(len(src_gids), -1, dtype=np.int64)
+        in_range = src_gids < len(src_lookup)
+        src_pop_ids[in_range] = src_lookup[src_gids[in_range]]
+        if np.any(src_pop_ids < 0):
+            raise Exception('Could not find population of source gid {} in network {}.'
+                            .format(src_gids[src_pop_ids < 0][0], source_network))
+
+        # reduce to one row for every (target pop, source pop, edge-type), keeping the first edge as the representative
+        # of the connection and the number of edges it aggregates.
+        connections = np.zeros(len(rows), dtype=[('trg_pop', np.int64), ('src_pop', np.int64), ('edge_type', np.int64)])
+        connections['trg_pop'] = trg_pop_ids
+        connections['src_pop'] = src_pop_ids
+        connections['edge_type'] = edge_type_ids[rows]
+        unique_conns, first_index, counts = np.unique(connections, return_index=True, return_counts=True)
+
+        # add connections in the order they would be found by iterating through the target populations
+        order = np.lexsort((first_index, unique_conns['trg_pop']))
+        for i in order:
+            source_pop = source_pops[unique_conns['src_pop'][i]]
+            target_pop = target_pops[unique_conns['trg_pop'][i]]
+            edge = edges[int(rows[first_index[i]])]
+            self._add_edge(source_pop, target_pop, edge, n_edges=int(counts[i]))
+
+    def _add_edge(self, source_pop, target_pop, edge, n_edges=1):
         src_id = source_pop.node_id
         trg_id = target_pop.node_id
         edge_type_id = edge['edge_type_id']
         edge_key = (src_id, source_pop.network, trg_id, target_pop.network, edge_type_id)
 
         if edge_key in self._edges:
-            return
+            self._edges[edge_key].n_edges += n_edges
         else:
             # TODO: implement dynamics params
             dynamics_params = self._get_edge_params(edge)
             pop_edge = PopEdge(source_pop, target_pop, edge, dynamics_params)
+            pop_edge.n_edges = n_edges
             self._edges[edge_key] = pop_edge
             self._source_edges[source_pop.network].append(pop_edge)
             self._target_edges[target_pop.network].append(pop_edge)
@@ -40,6 +40,14 @@ contains base factor methods for building a network from a config file (or other
 """
 
 
+class EdgeDict(dict):
+    """A dictionary of the properties of an edge (eg. a row from EdgesFile.read_target_range) that can be used in place
+    of an EdgeRow."""
+    @property
+    def with_dynamics_params(self):
+        return False
+
+
 class SimEdge(object):
     def __init__(self, original_params, dynamics_params):
         self._orig_params = original_params
@@ -254,6 +262,11 @@ class SimGraph(object):
     def _create_edge(self, edge, dynamics_params):
         return SimEdge(edge, dynamics_params)
 
+    def create_edge(self, edge_props):
+        """Creates the simulator edge object from a dictionary of edge (and edge-type) properties."""
+        edge = EdgeDict(edge_props)
+        return self._create_edge(edge, self._get_edge_params(edge))
+
     def _get_edge_params(self, edge):
         if edge.with_dynamics_params:
             return edge['dynamics_params']
@@ -27,6 +27,7 @@
 #
 import h5py
 import numpy as np
+import pandas as pd
 import os
 import datetime
 
@@ -94,3 +95,171 @@ def load_spikes_nwb(file_name,trial_name):
         
     return [np.array(spike_times)*1E-3,np.array(spike_gids)]
 
+
+def read_gdf_files(gdf_files, nest_to_gid):
+    """Reads a list of NEST gdf files (one "nest_id time" row per spike) and returns the times and node-ids of all the
+    spikes, sorted by time. The gdf files are removed once read.
+
+    :param gdf_files: list of paths to the gdf files.
+    :param nest_to_gid: array with the node-id of every NEST ID.
+    """
+    times = []
+    gids = []
+    for gdf_file in gdf_files:
+        if os.path.getsize(gdf_file) > 0:
+            spikes_df = pd.read_csv(gdf_file, names=['nest_id', 'time'], usecols=[0, 1], sep='\t', header=None)
+            times.append(spikes_df['time'].values.astype(np.float64))
+            gids.append(nest_to_gid[spikes_df['nest_id'].values.astype(np.int64)])
+        os.remove(gdf_file)
+
+    times = np.concatenate(times) if times else np.zeros(0, dtype=np.float64)
+    gids = np.concatenate(gids) if gids else np.zeros(0, dtype=np.int64)
+    order = np.argsort(times, kind='mergesort')
+    return times[order], gids[order]
+
+
+def merge_sorted_spikes(sorted_spikes):
+    """Merges a list of (times, gids) spike arrays, each sorted by time, into a single sorted (times, gids) pair by
+    merging the arrays two at a time.
+    """
+    sorted_spikes = [spikes for spikes in sorted_spikes if len(spikes[0]) > 0]
+    if not sorted_spikes:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+
+    while len(sorted_spikes) > 1:
+        merged = []
+        for (times_a, gids_a), (times_b, gids_b) in zip(sorted_spikes[0::2], sorted_spikes[1::2]):
+            # position of every spike of b in the merged arrays, ties keep the spikes of a first
+            pos_b = np.searchsorted(times_a, times_b, side='right') + np.arange(len(times_b))
+            is_b = np.zeros(len(times_a) + len(times_b), dtype=bool)
+            is_b[pos_b] = True
+            times = np.empty(len(is_b), dtype=np.float64)
+            gids = np.empty(len(is_b), dtype=np.int64)
+            times[is_b] = times_b
+            times[~is_b] = times_a
+            gids[is_b] = gids_b
+            gids[~is_b] = gids_a
+            merged.append((times, gids))
+        if len(sorted_spikes) % 2 == 1:
+            merged.append(sorted_spikes[-1])
+        sorted_spikes = merged
+
+    return sorted_spikes[0]
+
+
+class SpikeTrainsTable(object):
+    """Spike trains of many gids stored as one flat array of spike times, with the times of each gid in a contiguous
+    slice given by an offsets index.
+    """
+    def __init__(self, gids, times, offsets):
+        """
+        :param gids: list of N gids.
+        :param times: flat array of spike times.
+        :param offsets: array of N+1 offsets, times[offsets[i]:offsets[i+1]] are the spike times of gids[i].
+        """
+        self._gids = np.asarray(gids)
+        self._times = np.asarray(times)
+        self._offsets = np.asarray(offsets)
+        self._gid_index = {gid: i for i, gid in enumerate(self._gids.tolist())}
+
+    @property
+    def gids(self):
+        return self._gids
+
+    @property
+    def times(self):
+        return self._times
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def get(self, gid):
+        """Returns the spike times of a gid (as a view of the flat times array), empty if it has no spike train."""
+        if gid not in self._gid_index:
+            return self._times[0:0]
+        i = self._gid_index[gid]
+        return self._times[self._offsets[i]:self._offsets[i+1]]
+
+    def __contains__(self, gid):
+        return gid in self._gid_index
+
+    def __len__(self):
+        return len(self._gids)
+
+    @classmethod
+    def from_nwb(cls, spike_trains_group, gids=None):
+        """Reads the spike trains from the processing/<trial>/spike_train group of an NWB file in a single pass.
+
+        :param spike_trains_group: h5py group containing a <gid>/data dataset for each gid.
+        :param gids: gids to load, or None to load every spike train in the group. Gids without a spike train are
+            skipped.
+        """
+        if gids is None:
+            gids = sorted(int(gid) for gid in spike_trains_group.keys())
+        datasets = []
+        found_gids = []
+        for gid in gids:
+            gid_str = str(gid)
+            if gid_str in spike_trains_group:
+                found_gids.append(gid)
+                datasets.append(spike_trains_group[gid_str]['data'])
+
+        # Use the size of each dataset to preallocate the times array, then read every spike train straight into it.
+        offsets = np.zeros(len(datasets) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([ds.size for ds in datasets])
+        times = np.zeros(offsets[-1], dtype=np.float64)
+        for i, ds in enumerate(datasets):
+            if offsets[i+1] > offsets[i]:
+                ds.read_direct(times, dest_sel=np.s_[offsets[i]:offsets[i+1]])
+        return cls(found_gids, times, offsets)
+
+    @classmethod
+    def from_arrays(cls, spike_gids, spike_times, gids=None):
+        """Groups a flat list of (gid, time) spikes by gid, keeping the order of the spikes of each gid.
+
+        :param spike_gids: gid of every spike.
+        :param spike_times: time of every spike.
+        :param gids: gids to keep, or None to keep every gid with at least one spike.
+        """
+        spike_gids = np.asarray(spike_gids, dtype=np.int64)
+        spike_times = np.asarray(spike_times, dtype=np.float64)
+        if gids is not None:
+            keep = np.in1d(spike_gids, np.asarray(gids, dtype=np.int64))
+            spike_gids = spike_gids[keep]
+            spike_times = spike_times[keep]
+
+        order = np.argsort(spike_gids, kind='mergesort')
+        spike_gids = spike_gids[order]
+        unique_gids, starts = np.unique(spike_gids, return_index=True)
+        offsets = np.append(starts, len(spike_gids)).astype(np.int64)
+        return cls(unique_gids, spike_times[order], offsets)
+
+    @classmethod
+    def from_csv(cls, csv_file, sep=' ', gids=None):
+        """Reads the spike trains from a csv file, either with one row per gid and a comma-separated 'spike-times'
+        column (as written by bmtk.utils.spike_trains.SpikesGenerator), or with one row per spike and 'gid' and 'time'
+        columns.
+
+        :param csv_file: path to the csv file.
+        :param sep: column separator.
+        :param gids: gids to load, or None to load every spike train in the file.
+        """
+        spikes_df = pd.read_csv(csv_file, sep=sep, dtype={'spike-times': str})
+        if 'spike-times' in spikes_df.columns:
+            # Parse all the spike-times strings at once rather than one gid at a time
+            trains = spikes_df['spike-times'].fillna('').str.strip()
+            counts = np.where(trains.str.len() > 0, trains.str.count(',') + 1, 0)
+            nonempty = trains[counts > 0]
+            if len(nonempty) > 0:
+                spike_times = np.array(','.join(nonempty.values).split(','), dtype=np.float64)
+            else:
+                spike_times = np.zeros(0, dtype=np.float64)
+            spike_gids = np.repeat(spikes_df['gid'].values, counts)
+        elif 'gid' in spikes_df.columns and 'time' in spikes_df.columns:
+            spike_gids = spikes_df['gid'].values
+            spike_times = spikes_df['time'].values
+        else:
+            raise Exception('Could not find "gid" and "spike-times" (or "time") columns in {}.'.format(csv_file))
+
+        return cls.from_arrays(spike_gids, spike_times, gids)
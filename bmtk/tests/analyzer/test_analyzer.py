@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.analyzer import load_cell_var
+
+
+def write_cell_vars(file_name, gids, v):
+    with h5py.File(file_name, 'w') as h5:
+        h5.attrs['tstart'] = 0.0
+        h5.attrs['tstop'] = 1.0
+        h5.create_dataset('mapping/gids', data=np.array(gids, dtype=np.uint32))
+        h5.create_dataset('v', data=v)
+
+
+def test_load_cell_var():
+    tmp_dir = tempfile.mkdtemp()
+    v = np.arange(30, dtype=np.float).reshape(10, 3)
+    write_cell_vars(os.path.join(tmp_dir, 'cell_vars_0.h5'), [0, 0, 2], v)
+    write_cell_vars(os.path.join(tmp_dir, 'cell_vars_1.h5'), [1, 3, 3], v + 100.0)
+
+    trace, tstart, tstop = load_cell_var(tmp_dir, 0, 'v')
+    assert(np.allclose(trace, v[:, 0]))
+    assert(tstart == 0.0 and tstop == 1.0)
+    assert(np.allclose(load_cell_var(tmp_dir, 2, 'v')[0], v[:, 2]))
+    assert(np.allclose(load_cell_var(tmp_dir, 3, 'v')[0], v[:, 1] + 100.0))
+
+    with pytest.raises(Exception):
+        load_cell_var(tmp_dir, 4, 'v')
+    shutil.rmtree(tmp_dir)
@@ -6,6 +6,7 @@ import pandas as pd
 import h5py
 
 from bmtk.builder import NetworkBuilder
+from bmtk.builder import connector
 
 
 def test_create_network():
@@ -102,6 +103,28 @@ def test_nsyn_edges():
     #print list(net.edges())
 
 
+def test_vectorized_edges():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=100, x=np.arange(100), cell_type='Scnna1', ei='e')
+    net.add_nodes(N=50, x=np.arange(50), cell_type='PV1', ei='i')
+
+    def even_rule(sources, targets, nsyns):
+        return np.where((sources['x'][:, None] + targets['x'][None, :]) % 2 == 0, nsyns, 0)
+
+    cm = net.add_edges(source={'ei': 'e'}, target={'ei': 'i'},
+                       connection_rule=connector.vectorized(even_rule, block_size=128),
+                       connection_params={'nsyns': 2})
+    cm.add_properties(names='syn_weight', rule=lambda s, t: float(s['x'] + t['x']), dtypes=np.float)
+    net.build()
+    assert(net.nedges == 100*50)
+
+    edges = net.edges()
+    assert(len(edges) == 100*50)
+    for e in edges:
+        assert((e.source_gid + (e.target_gid - 100)) % 2 == 0)
+        assert(e['syn_weight'] == e.source_gid + e.target_gid - 100)
+
+
 def test_save_nsyn_table():
     net = NetworkBuilder('NET1')
     net.add_nodes(N=100, position=[(0.0, 1.0, -1.0)]*100, cell_type='Scnna1', ei='e')
@@ -208,6 +231,43 @@ def test_save_weights():
         pass
 
 
+def test_save_compressed():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=100, cell_type='Scnna1', ei='e')
+    net.add_nodes(N=100, cell_type='PV1', ei='i')
+    cm = net.add_edges(source={'ei': 'i'}, target={'ei': 'e'}, connection_rule=lambda s, t: 2, p1='e2i')
+    cm.add_properties(names='syn_weight', rule=lambda s, t: float(s.node_id), dtypes=np.float)
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=lambda s, t: 1, p1='i2e')
+    net.build()
+    net.save_edges('tmp_edges.h5', 'tmp_edge_types.csv', chunk_size=1000, compression='gzip', compression_opts=4)
+
+    edges_h5 = h5py.File('tmp_edges.h5', 'r')
+    assert(edges_h5['/edges/target_gid'].compression == 'gzip')
+    assert(edges_h5['/edges/target_gid'].chunks == (1000,))
+    assert(len(edges_h5['/edges/target_gid']) == 100*100*2 + 100*100)
+    index_ptr = edges_h5['/edges/index_pointer'][()]
+    assert(list(index_ptr[[0, 1, 100, 101, 200]]) == [0, 200, 20000, 20100, 30000])
+
+    trg_rows = slice(index_ptr[0], index_ptr[1])
+    assert(np.all(edges_h5['/edges/target_gid'][trg_rows] == 0))
+    assert(list(edges_h5['/edges/source_gid'][trg_rows][::2]) == range(100, 200))
+    grp_index = edges_h5['/edges/edge_group_index'][trg_rows]
+    assert(np.all(edges_h5['/edges/0/syn_weight'][()][grp_index] == edges_h5['/edges/source_gid'][trg_rows]))
+
+    trg_rows = slice(index_ptr[150], index_ptr[151])
+    assert(np.all(edges_h5['/edges/source_gid'][trg_rows] == np.arange(100)))
+    assert(np.all(edges_h5['/edges/edge_group'][trg_rows] == 1))
+    grp_index = edges_h5['/edges/edge_group_index'][trg_rows]
+    assert(np.all(edges_h5['/edges/1/nsyns'][()][grp_index] == 1))
+
+    edges_h5.close()
+    try:
+        os.remove('tmp_edges.h5')
+        os.remove('tmp_edge_types.csv')
+    except:
+        pass
+
+
 def test_save_multinetwork():
     net1 = NetworkBuilder('NET1')
     net1.add_nodes(N=100, position=[(0.0, 1.0, -1.0)] * 100, cell_type='Scnna1', ei='e')
@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+from bmtk.builder.networks import DenseNetwork, SparseNetwork
+from bmtk.builder.iterator import NodeColumns
+from bmtk.builder.aux.edge_connectors import distance_connector_kdtree, neighbor_pairs
+
+
+@pytest.mark.parametrize('net_cls', [DenseNetwork, SparseNetwork])
+def test_distance_connector_kdtree(net_cls):
+    np.random.seed(100)
+    positions = np.random.uniform(0.0, 100.0, size=(200, 3))
+    net = net_cls('NET1')
+    net.add_nodes(N=200, positions=positions)
+    net.add_edges(source=net.nodes(), target=net.nodes(), connection_rule=distance_connector_kdtree,
+                  connection_params={'d_weight_min': 1.0, 'd_weight_max': 1.0, 'd_max': 20.0, 'nsyn_min': 3,
+                                     'nsyn_max': 3})
+    net.build()
+
+    # with a weight of 1.0 every non-self pair within d_max is connected
+    dists = np.linalg.norm(positions[:, np.newaxis, :] - positions[np.newaxis, :, :], axis=2)
+    expected = set((s, t) for s, t in zip(*np.nonzero(dists <= 20.0)) if s != t)
+    edges = net.edges()
+    assert(set((e.source_gid, e.target_gid) for e in edges) == expected)
+    assert(all(e['nsyns'] == 3 for e in edges))
+
+
+def test_distance_connector_kdtree_prob():
+    np.random.seed(100)
+    net = DenseNetwork('NET1')
+    net.add_nodes(N=100, positions=np.random.uniform(0.0, 10.0, size=(100, 3)))
+    net.add_edges(source=net.nodes(), target=net.nodes(), connection_rule=distance_connector_kdtree,
+                  connection_params={'d_weight_min': 0.0, 'd_weight_max': 0.5, 'd_max': 100.0, 'nsyn_min': 1,
+                                     'nsyn_max': 4})
+    net.build()
+    edges = net.edges()
+    assert(0 < len(edges) < 100*99)
+    assert(all(1 <= e['nsyns'] <= 4 for e in edges))
+
+
+def test_distance_connector_kdtree_sparse():
+    net = DenseNetwork('NET1')
+    net.add_nodes(N=50, positions=np.random.uniform(0.0, 10.0, size=(50, 3)))
+    net.build()
+    nodes = NodeColumns(list(net.nodes()))
+    src_indx, trg_indx, nsyns = distance_connector_kdtree.bind(d_weight_min=1.0, d_weight_max=1.0, d_max=3.0,
+                                                               nsyn_min=1, nsyn_max=1)(nodes, nodes)
+    assert(len(src_indx) == len(trg_indx) == len(nsyns))
+    assert(np.all(src_indx != trg_indx))
+    assert(np.all(nsyns == 1))
+
+    # a weight of 0.0 never connects
+    src_indx, _, _ = distance_connector_kdtree.bind(d_weight_min=0.0, d_weight_max=0.0, d_max=3.0, nsyn_min=1,
+                                                    nsyn_max=1)(nodes, nodes)
+    assert(len(src_indx) == 0)
+
+
+def test_neighbor_pairs_tree_cache():
+    net = DenseNetwork('NET1')
+    net.add_nodes(N=50, positions=np.random.uniform(0.0, 10.0, size=(50, 3)))
+    net.build()
+    sources = NodeColumns(list(net.nodes()))
+    targets = NodeColumns(list(net.nodes()))
+    for trg_block in [slice(0, 25), slice(25, 50)]:
+        src_indx, trg_indx, r = neighbor_pairs(sources.block(slice(0, 50)), targets.block(trg_block), 3.0)
+        assert(np.all(r <= 3.0))
+
+    # one tree for the block of sources, shared by the tiles of both target blocks
+    assert(len(sources.cache) == 1)
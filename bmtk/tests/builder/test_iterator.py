@@ -1,5 +1,6 @@
 import pytest
 import itertools
+import numpy as np
 
 from bmtk.builder import connector, iterator
 from bmtk.builder import NetworkBuilder
@@ -124,6 +125,61 @@ def test_one2all_list():
         assert(trg_id == val)
 
 
+def test_vectorized_fnc():
+    @connector.vectorized(block_size=1000)
+    def connector_fnc(sources, targets):
+        assert(len(sources) * len(targets) <= 1000)
+        assert(all(sources['ei'] == 'i'))
+        assert(all(targets['ei'] == 'e'))
+        return sources['node_id'][:, None] * targets['node_id'][None, :]
+
+    net = network()
+    conr = connector.create(connector_fnc)
+    itr = iterator.create('one_to_one', conr)
+    count = 0
+    for v in itr(net.nodes(ei='i'), net.nodes(ei='e'), conr):
+        src_id, trg_id, val = v
+        assert(src_id < 100)
+        assert(trg_id >= 100)
+        assert(val == src_id*trg_id)
+        count += 1
+    assert(count == 5000)
+
+
+def test_vectorized_blocks():
+    net = network()
+    conr = connector.create(connector.vectorized(lambda s, t, n: np.full((len(s), len(t)), n), block_size=256), n=3)
+    covered = np.zeros((100, 50), dtype=np.int)
+    for src_block, trg_block, nsyns in iterator.vectorized_blocks(net.nodes(ei='i'), net.nodes(ei='e'), conr):
+        assert(nsyns.size <= 256)
+        covered[src_block, trg_block] += nsyns
+    assert(np.all(covered == 3))
+
+
+def test_vectorized_sparse():
+    @connector.vectorized(sparse=True)
+    def sparse_fnc(sources, targets):
+        # connect every source to the target at the same position of the block
+        n = min(len(sources), len(targets))
+        return np.arange(n), np.arange(n), sources['node_id'][:n]
+
+    net = network()
+    conr = connector.create(sparse_fnc)
+    blocks = list(iterator.vectorized_blocks(net.nodes(ei='i'), net.nodes(ei='e'), conr))
+    assert(len(blocks) == 1)  # sparse rules are evaluated on every pair at once
+    src_block, trg_block, (src_i, trg_i, nsyns) = blocks[0]
+    assert(len(src_i) == 50)
+
+    itr = iterator.create('one_to_one', conr)
+    pairs = list(itr(net.nodes(ei='i'), net.nodes(ei='e'), conr))
+    assert(len(pairs) == 50)
+    assert(all(trg_id == src_id + 100 and val == src_id for src_id, trg_id, val in pairs))
+
+    conr = connector.create(connector.vectorized(lambda s, t: (np.arange(2), np.arange(3), np.ones(3)), sparse=True))
+    with pytest.raises(Exception):
+        list(iterator.vectorized_blocks(net.nodes(ei='i'), net.nodes(ei='e'), conr))
+
+
 def test_all2one_list():
     net = network()
     vals = [v.node_id for v in net.nodes(ei='i')]
@@ -1,6 +1,7 @@
 import pytest
 
 from bmtk.builder import NetworkBuilder
+from bmtk.builder.node_pool import NodePool
 
 
 def test_single_node():
@@ -78,4 +79,64 @@ def test_failed_search():
     assert(len(node_pool) == 0)
 
 
+def test_query_types():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, prop_n='prop1', param1=range(10))
+    net.add_nodes(N=10, prop_n='prop2', param1=[float(v) for v in range(10, 20)])
+    net.add_nodes(N=10, prop_n='prop3')
+    assert(len(net.nodes(param1=[1, 11.0, 25])) == 2)
+    assert(len(net.nodes(param1=lambda p: p >= 5)) == 15)
+    assert(len(net.nodes(prop_n=['prop1', 'prop3'])) == 20)
+    assert(len(net.nodes(prop_n=lambda p: p != 'prop1', param1=lambda p: p < 15)) == 5)
+    assert(list(net.nodes(param1=12).node_ids) == [12])
+
+
+def test_set_algebra():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, ei='e', loc='L2')
+    net.add_nodes(N=20, ei='i', loc='L2')
+    net.add_nodes(N=40, ei='e', loc='L4')
+
+    union = net.nodes(ei='e') | net.nodes(loc='L2')
+    assert(len(union) == 70)
+    assert(list(union.node_ids) == range(70))
+
+    intersection = net.nodes(ei='e') & net.nodes(loc='L2')
+    assert(len(intersection) == 10)
+    for n in intersection:
+        assert(n['ei'] == 'e' and n['loc'] == 'L2')
+
+    diff = net.nodes(ei='e') - net.nodes(loc='L2')
+    assert(len(diff) == 40)
+    assert(list(diff.node_ids) == range(30, 70))
+    assert(len(net.nodes() - diff - intersection) == 20)
+
+    net2 = NetworkBuilder('NET2')
+    net2.add_nodes(N=10, ei='e')
+    with pytest.raises(Exception):
+        net.nodes() | net2.nodes()
+
+
+def test_from_filter():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, ei='e', loc='L2')
+    net.add_nodes(N=20, ei='i', loc='L2')
+    net.add_nodes(N=40, ei='e', loc='L4')
+
+    pools = [net.nodes(), net.nodes(ei='e'), net.nodes(ei='e', loc='L2'),
+             net.nodes(ei='e') | net.nodes(loc='L2'),
+             net.nodes(ei='e') & net.nodes(loc='L2'),
+             net.nodes(ei='e') - net.nodes(loc='L2'),
+             (net.nodes(ei='e') - net.nodes(loc='L2')) | net.nodes(ei='i'),
+             net.nodes(loc='L2') - (net.nodes(ei='e') & net.nodes())]
+    for pool in pools:
+        filtered_pool = NodePool.from_filter(net, pool.filter_str)
+        assert(list(filtered_pool.node_ids) == list(pool.node_ids))
+
+    with pytest.raises(Exception):
+        NodePool.from_filter(net, "(ei=='e')|(loc=='L2'")
+    with pytest.raises(Exception):
+        NodePool.from_filter(net, "(ei=='e')^(loc=='L2')")
+
+
 test_failed_search()
\ No newline at end of file
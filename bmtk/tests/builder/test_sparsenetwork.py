@@ -0,0 +1,86 @@
+import os
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.builder.networks import DenseNetwork, SparseNetwork, MPINetwork
+from bmtk.builder import connector
+
+
+def build_net(net_cls):
+    net = net_cls('NET1')
+    net.add_nodes(N=100, position=[(0.0, 1.0, -1.0)]*100, cell_type='Scnna1', ei='e')
+    net.add_nodes(N=100, position=[(0.0, 1.0, -1.0)]*100, cell_type='PV1', ei='i')
+    net.add_nodes(N=100, position=[(0.0, 1.0, -1.0)]*100, tags=np.linspace(0, 100, 100), cell_type='PV2', ei='i')
+    cm = net.add_edges(source={'ei': 'i'}, target={'ei': 'e'},
+                       connection_rule=lambda s, t: 3 if (s.node_id + t.node_id) % 3 == 0 else 0, p1='e2i')
+    cm.add_properties(names=['segment', 'distance'], rule=lambda s, t: [s.node_id, t.node_id*0.5],
+                      dtypes=[np.int, np.float])
+    net.add_edges(source=net.nodes(cell_type='Scnna1'), target=net.nodes(cell_type='PV1'),
+                  connection_rule=lambda s, t: 2 if s.node_id % 2 == 0 else None, p1='s2p')
+    net.add_edges(source=net.nodes(cell_type='PV2'), target=net.nodes(cell_type='PV1'),
+                  connection_rule=connector.vectorized(lambda s, t: np.ones((len(s), len(t))), block_size=300),
+                  p1='p2p')
+    net.build()
+    return net
+
+
+def test_build():
+    net = build_net(SparseNetwork)
+    n_i2e = sum(3 for s in range(100, 300) for t in range(100) if (s + t) % 3 == 0)
+    assert(net.nedges == n_i2e + 50*100*2 + 100*100)
+    edges = net.edges(target_nodes=[0])
+    assert(len(edges) == sum(3 for s in range(100, 300) if s % 3 == 0))
+    for e in edges:
+        assert(e['segment'] == e.source_gid)
+        assert(e['distance'] == 0.0)
+
+    edges = net.edges(p1='p2p')
+    assert(len(edges) == 100*100)
+    assert(edges[0]['nsyns'] == 1)
+
+
+@pytest.mark.parametrize('net_cls', [SparseNetwork, MPINetwork])
+def test_same_as_dense(net_cls):
+    sparse_net = build_net(net_cls)
+    dense_net = build_net(DenseNetwork)
+    sparse_edges = sparse_net.edges()
+    dense_edges = dense_net.edges()
+    assert(len(sparse_edges) == len(dense_edges))
+    for se, de in zip(sparse_edges, dense_edges):
+        assert(se.source_gid == de.source_gid)
+        assert(se.target_gid == de.target_gid)
+        assert(se.edge_type_id == de.edge_type_id)
+        assert(se.synaptic_properties == de.synaptic_properties)
+
+
+@pytest.mark.parametrize('net_cls', [SparseNetwork, MPINetwork])
+def test_save_edges(net_cls):
+    sparse_net = build_net(net_cls)
+    sparse_net.save_edges('tmp_sparse_edges.h5', 'tmp_sparse_edge_types.csv')
+    dense_net = build_net(DenseNetwork)
+    dense_net.save_edges('tmp_dense_edges.h5', 'tmp_dense_edge_types.csv')
+
+    with h5py.File('tmp_sparse_edges.h5', 'r') as sparse_h5, h5py.File('tmp_dense_edges.h5', 'r') as dense_h5:
+        for ds in ['target_gid', 'source_gid', 'edge_group', 'edge_group_index', 'edge_type_id', 'index_pointer',
+                   '0/segment', '0/distance', '1/nsyns']:
+            assert(np.all(sparse_h5['edges'][ds][()] == dense_h5['edges'][ds][()]))
+
+    for fname in ['tmp_sparse_edges.h5', 'tmp_sparse_edge_types.csv', 'tmp_dense_edges.h5',
+                  'tmp_dense_edge_types.csv']:
+        try:
+            os.remove(fname)
+        except:
+            pass
+
+
+def test_mpi_edges_iter():
+    mpi_net = build_net(MPINetwork)
+    dense_net = build_net(DenseNetwork)
+    trg_gids = range(300)
+    mpi_edges = list(mpi_net.edges_iter(trg_gids, block_size=64))
+    dense_edges = list(dense_net.edges_iter(trg_gids))
+    assert(len(mpi_edges) == len(dense_edges))
+    for me, de in zip(mpi_edges, dense_edges):
+        assert((me.source_gid, me.target_gid) == (de.source_gid, de.target_gid))
+        assert(me.synaptic_properties == de.synaptic_properties)
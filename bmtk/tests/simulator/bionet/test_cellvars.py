@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+neuron = pytest.importorskip('neuron')
+from neuron import h
+from bmtk.simulator.bionet.modules.record_cellvars import CellVarsMod
+
+
+class HObj(object):
+    """A ball-and-stick cell with a 1 segment soma and a 5 segment 100 um dendrite."""
+    def __init__(self):
+        self.soma = [h.Section(name='soma')]
+        self.soma[0].L = self.soma[0].diam = 10.0
+        self.dend = [h.Section(name='dend')]
+        self.dend[0].L = 100.0
+        self.dend[0].nseg = 5
+        self.dend[0].connect(self.soma[0](1.0))
+        self.all = h.SectionList()
+        self.all.wholetree(sec=self.soma[0])
+
+
+class Cell(object):
+    def __init__(self):
+        self.hobj = HObj()
+
+
+class Sim(object):
+    def __init__(self, cells):
+        self.net = type('Net', (object,), {'cells': cells})
+        self.gids = {'biophysical': sorted(cells.keys()), 'save_cell_vars': sorted(cells.keys())}
+        self.nsteps_block = 5
+        self.n_steps = 10
+        self.dt = 0.1
+        self.tstop = 1.0
+        self.start_from_state = False
+
+
+def test_select_segments():
+    cell = Cell()
+    soma_segs = CellVarsMod('.', ['v'])._select_segments(cell)
+    assert(len(soma_segs) == 1)
+    assert(soma_segs[0][0] == 0)
+    assert(soma_segs[0][1].x == 0.5)
+    assert(soma_segs[0][2] == 0.0)
+
+    dend_segs = CellVarsMod('.', ['v'], sections='dend')._select_segments(cell)
+    assert(len(dend_segs) == 5)
+    assert(all(sec_id == 1 for sec_id, _, _ in dend_segs))
+    assert(np.allclose([seg.x for _, seg, _ in dend_segs], [0.1, 0.3, 0.5, 0.7, 0.9]))
+    assert(np.allclose([dist for _, _, dist in dend_segs], [15.0, 35.0, 55.0, 75.0, 95.0]))
+
+    far_segs = CellVarsMod('.', ['v'], sections=['soma', 'dend'], distance_range=(50.0, 100.0))._select_segments(cell)
+    assert(np.allclose([dist for _, _, dist in far_segs], [55.0, 75.0, 95.0]))
+
+
+def test_mapping():
+    tmp_dir = tempfile.mkdtemp()
+    sim = Sim({0: Cell(), 3: Cell()})
+    mod = CellVarsMod(tmp_dir, ['v'], sections=['soma', 'dend'], seg_x=[0.5])
+    mod.initialize(sim)
+    for tstep in range(sim.n_steps):
+        mod.step(sim, tstep)
+        if (tstep + 1) % sim.nsteps_block == 0:
+            mod.block(sim, (tstep + 1 - sim.nsteps_block, tstep + 1))
+    mod.finalize(sim)
+
+    with h5py.File(os.path.join(tmp_dir, 'cell_vars_0.h5'), 'r') as h5:
+        assert(list(h5['mapping/gids']) == [0, 0, 3, 3])
+        assert(list(h5['mapping/sec_ids']) == [0, 1, 0, 1])
+        assert(np.allclose(h5['mapping/seg_x'], 0.5))
+        assert(np.allclose(h5['mapping/distance'], [0.0, 55.0, 0.0, 55.0]))
+        assert(h5['v'].shape == (sim.n_steps, 4))
+        assert(np.allclose(h5['v'], -65.0))
+    shutil.rmtree(tmp_dir)
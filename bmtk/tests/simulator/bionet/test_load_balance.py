@@ -0,0 +1,54 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+
+from bmtk.simulator.bionet import load_balance as lb
+
+
+def test_lpt_partition():
+    costs = {0: 10.0, 1: 1.0, 2: 1.0, 3: 5.0, 4: 5.0, 5: 1.0, 6: 1.0}
+    partition = lb.lpt_partition(costs, 2)
+    assert(sorted(gid for gids in partition for gid in gids) == range(7))
+    loads = [sum(costs[gid] for gid in gids) for gids in partition]
+    assert(sorted(loads) == [12.0, 12.0])
+
+    # an empty rank when there are more ranks than cells
+    partition = lb.lpt_partition({0: 1.0, 1: 2.0}, 3)
+    assert(partition == [[1], [0], []])
+
+
+def test_swc_ncompartments():
+    swc_file = tempfile.NamedTemporaryFile(suffix='.swc', delete=False)
+    swc_file.write('# id type x y z r parent\n'
+                   '1 1 0.0 0.0 0.0 5.0 -1\n'
+                   '2 3 0.0 50.0 0.0 1.0 1\n'
+                   '3 3 0.0 100.0 0.0 1.0 2\n'  # dendrite section of length 100 that branches
+                   '4 3 30.0 100.0 0.0 1.0 3\n'  # branch of length 30
+                   '5 3 -10.0 100.0 0.0 1.0 3\n'  # branch of length 10
+                   '6 2 0.0 -20.0 0.0 1.0 1\n')  # axon of length 20
+    swc_file.close()
+    # soma + 1+2*int(100/40) + 1+2*int(30/40) + 1+2*int(10/40) + 1+2*int(20/40)
+    assert(lb.swc_ncompartments(swc_file.name, 20.0) == 1 + 5 + 1 + 1 + 1)
+    os.remove(swc_file.name)
+
+
+def test_balance_file():
+    balance_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    costs = {0: 1.5, 10: 2.0, 5: 0.25}
+    lb.save_costs(balance_file, costs)
+    assert(lb.load_costs(balance_file) == costs)
+    os.remove(balance_file)
+
+
+def test_merge_costs():
+    estimated = {0: 10.0, 1: 20.0, 2: 30.0, 3: 40.0}
+    measured = {0: 1.0, 1: 3.0, 7: 5.0}
+
+    # gids 2 and 3 are missing from the measured costs, their estimates are scaled by 4.0/30.0 seconds per unit
+    costs = lb.merge_costs(estimated, measured)
+    assert(sorted(costs.keys()) == [0, 1, 2, 3])
+    assert(np.allclose([costs[gid] for gid in range(4)], [1.0, 3.0, 4.0, 40.0*4.0/30.0]))
+
+    # no gids in common
+    assert(lb.merge_costs(estimated, {7: 5.0}) == estimated)
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from bmtk.simulator.bionet.morphology_cache import MorphologyCache
+
+
+def write_swc(file_name, lines):
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def test_cache_key():
+    tmp_dir = tempfile.mkdtemp()
+    swc_file = os.path.join(tmp_dir, 'cell.swc')
+    write_swc(swc_file, ['1 1 0.0 0.0 0.0 5.0 -1', '2 3 0.0 50.0 0.0 1.0 1'])
+
+    cache = MorphologyCache(os.path.join(tmp_dir, 'cache'))
+    key = cache.key(swc_file, 20, 'Biophys1')
+    assert(key == cache.key(swc_file, 20.0, 'Biophys1'))
+    assert(key != cache.key(swc_file, 10.0, 'Biophys1'))
+    assert(key != cache.key(swc_file, 20.0, 'Biophys1_adjusted'))
+
+    # a changed swc file gets a new key
+    write_swc(swc_file, ['1 1 0.0 0.0 0.0 5.0 -1', '2 3 0.0 60.0 0.0 1.0 1'])
+    assert(key != MorphologyCache(cache.cache_dir).key(swc_file, 20, 'Biophys1'))
+    shutil.rmtree(tmp_dir)
+
+
+def test_save_load():
+    tmp_dir = tempfile.mkdtemp()
+    cache = MorphologyCache(os.path.join(tmp_dir, 'cache'))
+    assert(cache.load('abc') is None)
+
+    nseg = 5
+    seg_prop = {k: np.random.rand(nseg) for k in ['area', 'x', 'dist', 'length', 'dist0', 'dist1']}
+    seg_prop['type'] = np.array([1, 2, 2, 3, 4])
+    seg_coords = {'p0': np.random.rand(3, nseg), 'p1': np.random.rand(3, nseg), 'd0': np.random.rand(nseg),
+                  'd1': np.random.rand(nseg)}
+    psoma = np.array([1.0, 2.0, 3.0])
+    cache.save('abc', seg_prop, seg_coords, psoma)
+    assert(os.listdir(cache.cache_dir) == ['abc.h5'])
+
+    cached_prop, cached_coords, cached_psoma = cache.load('abc')
+    for k, v in seg_prop.items():
+        assert(np.array_equal(cached_prop[k], v))
+    for k, v in seg_coords.items():
+        assert(np.array_equal(cached_coords[k], v))
+    assert(np.array_equal(cached_psoma, psoma))
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,67 @@
+import os
+import json
+import tempfile
+import pandas as pd
+
+from bmtk.simulator.bionet.profiler import Profiler, write_report
+
+
+def test_profiler():
+    profiler = Profiler()
+    with profiler.phase('build_cells'):
+        pass
+    with profiler.phase('make_stims'):
+        pass
+    profiler.add('build_cells', 1.0)
+    profiler.add('SpikesMod.step', 2.5, ncalls=100)
+
+    assert(profiler.phases == ['build_cells', 'make_stims', 'SpikesMod.step'])
+    assert(1.0 <= profiler.wall_time('build_cells') < 2.0)
+    phases = profiler.to_dict()
+    assert(phases['build_cells']['ncalls'] == 2)
+    assert(phases['SpikesMod.step']['ncalls'] == 100)
+    assert(phases['SpikesMod.step']['wall_time'] == 2.5)
+    assert(phases['make_stims']['peak_rss_so_far'] > 0)
+
+
+def test_nested_phases():
+    profiler = Profiler()
+    with profiler.phase('build_cells'):
+        with profiler.phase('create_cells'):
+            pass
+        profiler.add('set_seg_props', 1.0)
+    profiler.add('simulate', 2.0)
+    profiler.add('neuron_solve', 1.5, parent='simulate')
+
+    assert(profiler.phases == ['create_cells', 'set_seg_props', 'build_cells', 'simulate', 'neuron_solve'])
+    assert(profiler.parent('create_cells') == 'build_cells')
+    assert(profiler.parent('set_seg_props') == 'build_cells')
+    assert(profiler.parent('build_cells') is None)
+    assert(profiler.parent('neuron_solve') == 'simulate')
+    phases = profiler.to_dict()
+    assert(phases['create_cells']['parent'] == 'build_cells')
+    assert(phases['build_cells']['peak_rss_so_far'] >= phases['create_cells']['peak_rss_so_far'])
+
+
+def test_write_report():
+    profilers = [Profiler(), Profiler()]
+    profilers[0].add('build_cells', 1.0)
+    profilers[1].add('build_cells', 2.0)
+    profilers[1].add('simulate', 3.0)
+
+    json_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+    write_report(json_file, profilers)
+    report = json.load(open(json_file, 'r'))
+    assert(report['nhost'] == 2)
+    assert(report['ranks'][1]['order'] == ['build_cells', 'simulate'])
+    assert(report['ranks'][1]['phases']['simulate']['wall_time'] == 3.0)
+    os.remove(json_file)
+
+    csv_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    write_report(csv_file, profilers)
+    report_df = pd.read_csv(csv_file, sep=' ')
+    assert(list(report_df['rank']) == [0, 1, 1])
+    assert(list(report_df['phase']) == ['build_cells', 'build_cells', 'simulate'])
+    assert(list(report_df['wall_time']) == [1.0, 2.0, 3.0])
+    assert(report_df['parent'].isnull().all())
+    os.remove(csv_file)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.simulator.bionet import spike_files
+
+
+def write_spikes(csv_fhandle, h5_fhandle, times, gids):
+    np.savetxt(csv_fhandle, np.column_stack((times, gids)), fmt=['%.3f', '%d'], delimiter=' ')
+    for name, data in [('time', times), ('gid', gids)]:
+        n_begin = len(h5_fhandle[name])
+        h5_fhandle[name].resize((n_begin + len(data),))
+        h5_fhandle[name][n_begin:] = data
+
+
+def test_truncate():
+    tmp_dir = tempfile.mkdtemp()
+    csv_fname = os.path.join(tmp_dir, 'spikes.csv')
+    h5_fname = os.path.join(tmp_dir, 'spikes.h5')
+
+    csv_fhandle = open(csv_fname, 'w')
+    h5_fhandle = h5py.File(h5_fname, 'w')
+    h5_fhandle.create_dataset('gid', shape=(0,), maxshape=(None,), chunks=True, dtype=np.int32)
+    h5_fhandle.create_dataset('time', shape=(0,), maxshape=(None,), chunks=True)
+
+    # spikes before and after the checkpoint
+    write_spikes(csv_fhandle, h5_fhandle, np.array([0.5, 1.25]), np.array([3, 1]))
+    offsets = spike_files.get_offsets(2, csv_fhandle, h5_fhandle)
+    assert(offsets == {'n_spikes': 2, 'csv_offset': len('0.500 3\n1.250 1\n')})
+    write_spikes(csv_fhandle, h5_fhandle, np.array([2.0, 2.5, 3.0]), np.array([0, 2, 4]))
+    csv_fhandle.close()
+    h5_fhandle.close()
+
+    # resume, the spikes saved after the checkpoint are dropped and new spikes are appended
+    csv_fhandle = open(csv_fname, 'a')
+    h5_fhandle = h5py.File(h5_fname, 'a')
+    spike_files.truncate(offsets, csv_fhandle, [h5_fhandle['gid'], h5_fhandle['time']])
+    write_spikes(csv_fhandle, h5_fhandle, np.array([2.75]), np.array([5]))
+    csv_fhandle.close()
+
+    with open(csv_fname, 'r') as f:
+        assert(f.read() == '0.500 3\n1.250 1\n2.750 5\n')
+    assert(np.all(h5_fhandle['gid'][()] == [3, 1, 5]))
+    assert(np.allclose(h5_fhandle['time'][()], [0.5, 1.25, 2.75]))
+    h5_fhandle.close()
+    shutil.rmtree(tmp_dir)
+
+
+def test_no_files():
+    assert(spike_files.get_offsets(10) == {'n_spikes': 10, 'csv_offset': 0})
+    spike_files.truncate({'n_spikes': 10, 'csv_offset': 0})
+
+
+class Sim(object):
+    def __init__(self, h, start_from_state=False):
+        self.h = h
+        self.start_from_state = start_from_state
+        self.spikes_table = {}
+
+    def set_spikes_recording(self):
+        self.spikes_table = {}
+
+    def spike(self, gid, times):
+        self.spikes_table[gid] = self.h.Vector(times)
+
+
+def test_spikes_mod_checkpoint():
+    neuron = pytest.importorskip('neuron')
+    from bmtk.simulator.bionet.modules.record_spikes import SpikesMod
+
+    tmp_dir = tempfile.mkdtemp()
+    csv_fname = os.path.join(tmp_dir, 'spikes.csv')
+    h5_fname = os.path.join(tmp_dir, 'spikes.h5')
+
+    sim = Sim(neuron.h)
+    mod = SpikesMod(csv_fname, h5_fname)
+    mod.initialize(sim)
+    sim.spike(1, [0.5, 1.0])
+    mod.block(sim, (0, 10))
+    state = mod.save_checkpoint(sim)
+    sim.spike(2, [1.5])
+    mod.block(sim, (10, 20))
+    mod.finalize(sim)
+
+    # resuming from the checkpoint replaces the spikes of the second block
+    sim = Sim(neuron.h, start_from_state=True)
+    mod = SpikesMod(csv_fname, h5_fname)
+    mod.initialize(sim)
+    mod.load_checkpoint(sim, state)
+    sim.spike(3, [1.75])
+    mod.block(sim, (10, 20))
+    mod.finalize(sim)
+
+    assert(mod.n_spikes == 3)
+    with open(csv_fname, 'r') as f:
+        assert(f.read() == '0.500 1\n1.000 1\n1.750 3\n')
+    with h5py.File(h5_fname, 'r') as h5:
+        assert(np.all(h5['gid'][()] == [1, 1, 3]))
+        assert(np.allclose(h5['time'][()], [0.5, 1.0, 1.75]))
+    shutil.rmtree(tmp_dir)
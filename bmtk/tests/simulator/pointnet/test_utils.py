@@ -0,0 +1,40 @@
+import pytest
+import numpy as np
+
+from bmtk.simulator.pointnet.utils import target_batches, build_id_map, map_ids
+
+
+def test_target_batches():
+    target_counts = np.array([2, 3, 0, 1, 4, 2])
+    assert(target_batches(target_counts, 5) == [(0, 3), (3, 5), (5, 6)])
+    assert(target_batches(target_counts, 100) == [(0, 6)])
+    assert(target_batches(target_counts, 1) == [(0, 1), (1, 2), (2, 4), (4, 5), (5, 6)])
+    assert(target_batches(np.array([]), 5) == [])
+
+    # every batch of targets covers all the edges exactly once
+    batches = target_batches(target_counts, 4)
+    assert(batches[0][0] == 0 and batches[-1][1] == len(target_counts))
+    assert(all(end == start for (_, end), (start, _) in zip(batches[:-1], batches[1:])))
+
+
+def test_target_batches_large_target():
+    # a target with more edges than the batch size gets its own batch
+    target_counts = np.array([1, 1, 10, 1, 12])
+    assert(target_batches(target_counts, 4) == [(0, 2), (2, 3), (3, 4), (4, 5)])
+    assert(target_batches(np.array([10]), 4) == [(0, 1)])
+
+
+def test_map_ids():
+    gids = np.array([4, 0, 7, 2])
+    nest_ids = np.array([1, 2, 3, 4])
+    gid_to_nest = build_id_map(gids, nest_ids)
+    assert(list(gid_to_nest) == [2, -1, 4, -1, 1, -1, -1, 3])
+    assert(list(map_ids(gid_to_nest, [7, 4, 0, 2])) == [3, 1, 2, 4])
+
+    # gids that were not built, including gids past the end of the map, are mapped to -1
+    assert(list(map_ids(gid_to_nest, [1, 2, 8, 100])) == [-1, 4, -1, -1])
+    assert(len(map_ids(gid_to_nest, [])) == 0)
+
+    empty_map = build_id_map([], [])
+    assert(len(empty_map) == 0)
+    assert(list(map_ids(empty_map, [0, 3])) == [-1, -1])
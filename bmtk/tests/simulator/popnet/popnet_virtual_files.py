@@ -102,6 +102,7 @@ class EdgesFile(tn.EdgesFile):
         self._edge_type_props = [
             {
                 'node_type_id': 1,
+                'edge_type_id': 1,
                 'target_query': 'model_type="iaf_psc_alpha"', 'source_query': 'ei="e"',
                 'syn_weight': .10,
                 'delay': 2.0,
@@ -109,6 +110,7 @@ class EdgesFile(tn.EdgesFile):
             },
             {
                 'node_type_id': 2,
+                'edge_type_id': 2,
                 'target_query': 'model_type="iaf_psc_alpha"', 'source_query': 'ei="i"',
                 'syn_weight': -.10,
                 'delay': 2.0,
@@ -116,6 +118,7 @@ class EdgesFile(tn.EdgesFile):
             },
             {
                 'node_type_id': 3,
+                'edge_type_id': 3,
                 'target_query': 'model_type="izhikevich"', 'source_query': 'ei="e"',
                 'syn_weight': .20,
                 'delay': 2.0,
@@ -123,6 +126,7 @@ class EdgesFile(tn.EdgesFile):
             },
             {
                 'node_type_id': 4,
+                'edge_type_id': 4,
                 'target_query': 'model_type="izhikevich"', 'source_query': 'ei="i"',
                 'syn_weight': -.20,
                 'delay': 2.0,
@@ -149,6 +153,14 @@ class EdgesFile(tn.EdgesFile):
             edge_props = {'syn_weight': trg_node['weight']}
             yield EdgeRow(trg_node.gid, src_node.gid, edge_props, self.__get_edge_type_prop(src_node, trg_node))
 
+    def index_arrays(self):
+        edges = [edge for trg_gid in range(len(self._target_nodes)) for edge in self.edges_itr(trg_gid)]
+        return (np.array([edge.target_gid for edge in edges]), np.array([edge.source_gid for edge in edges]),
+                np.array([edge['edge_type_id'] for edge in edges]))
+
+    def __getitem__(self, iloc):
+        trg_gid, src_index = divmod(iloc, len(self._source_nodes))
+        return list(self.edges_itr(trg_gid))[src_index]
 
     def __len__(self):
         return len(self._source_nodes)*len(self._target_nodes)
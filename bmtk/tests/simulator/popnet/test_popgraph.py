@@ -35,4 +35,38 @@ def test_add_nodes():
     assert (pop_i.tau_m == 0.2)
 
 
+class PerEdgeFile(pvf.EdgesFile):
+    def index_arrays(self):
+        raise NotImplementedError()
+
+
+def test_add_edges():
+    with open('exc_dynamics.json', 'w') as fp:
+        json.dump({'tau_m': 0.1}, fp)
+
+    with open('inh_dynamics.json', 'w') as fp:
+        json.dump({'tau_m': 0.2}, fp)
+
+    for syn_file in ['izh_exc.json', 'izh_inh.json']:
+        with open(syn_file, 'w') as fp:
+            json.dump({}, fp)
+
+    nodes = pvf.NodesFile(N=30)
+    pop_edges = []
+    for edges in [pvf.EdgesFile(nodes, nodes), PerEdgeFile(nodes, nodes)]:
+        net = PopGraph()
+        net.add_component('models_dir', '.')
+        net.add_component('synaptic_models_dir', '.')
+        net.add_nodes(nodes)
+        net.add_edges(edges)
+        pop_edges.append([(e.source.pop_id, e.target.pop_id, e['edge_type_id'], e.n_edges, e['syn_weight'])
+                          for e in net.get_edges(nodes.name)])
+
+    # the bulk aggregation must find the same population edges, in the same order, as iterating through every edge
+    assert(pop_edges[0] == pop_edges[1])
+    assert(len(pop_edges[0]) == 9)
+    assert(sum(e[3] for e in pop_edges[0]) == 30*30)
+    assert(set((e[0], e[1]) for e in pop_edges[0]) == set((s, t) for s in [101, 102, 103] for t in [101, 102, 103]))
+
+
 #test_add_nodes()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.simulator.utils.load_spikes import SpikeTrainsTable, read_gdf_files, merge_sorted_spikes
+
+
+def test_spike_trains_from_nwb():
+    nwb_file = tempfile.NamedTemporaryFile(suffix='.nwb', delete=False).name
+    spike_trains = {0: [1.0, 5.0, 10.0], 3: [], 7: [2.5], 10: [0.5, 100.0]}
+    with h5py.File(nwb_file, 'w') as h5:
+        grp = h5.create_group('processing/trial_0/spike_train')
+        for gid, times in spike_trains.items():
+            grp.create_dataset('{}/data'.format(gid), data=np.array(times, dtype=np.float32))
+
+    with h5py.File(nwb_file, 'r') as h5:
+        table = SpikeTrainsTable.from_nwb(h5['processing/trial_0/spike_train'])
+        assert(list(table.gids) == [0, 3, 7, 10])
+        for gid, times in spike_trains.items():
+            assert(np.allclose(table.get(gid), times))
+
+        table = SpikeTrainsTable.from_nwb(h5['processing/trial_0/spike_train'], gids=[10, 5, 0])
+        assert(len(table) == 2)
+        assert(5 not in table)
+        assert(len(table.get(5)) == 0)
+        assert(np.allclose(table.get(10), [0.5, 100.0]))
+        assert(np.allclose(table.times, [0.5, 100.0, 1.0, 5.0, 10.0]))
+
+    os.remove(nwb_file)
+
+
+def test_spike_trains_from_csv():
+    csv_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    with open(csv_file, 'w') as f:
+        f.write('gid spike-times\n')
+        f.write('7 2.5\n')
+        f.write('0 1.0,5.0,10.0\n')
+        f.write('3 \n')
+        f.write('10 0.5,100.0\n')
+
+    table = SpikeTrainsTable.from_csv(csv_file)
+    assert(list(table.gids) == [0, 7, 10])
+    assert(np.allclose(table.get(0), [1.0, 5.0, 10.0]))
+    assert(np.allclose(table.get(7), [2.5]))
+    assert(np.allclose(table.get(10), [0.5, 100.0]))
+    assert(len(table.get(3)) == 0)
+
+    table = SpikeTrainsTable.from_csv(csv_file, gids=[10, 3])
+    assert(list(table.gids) == [10])
+
+    with open(csv_file, 'w') as f:
+        f.write('time,gid\n')
+        f.write('5.0,0\n2.5,7\n1.0,0\n0.5,10\n')
+
+    table = SpikeTrainsTable.from_csv(csv_file, sep=',')
+    assert(list(table.gids) == [0, 7, 10])
+    assert(np.allclose(table.get(0), [5.0, 1.0]))
+    assert(np.allclose(table.offsets, [0, 2, 3, 4]))
+
+    os.remove(csv_file)
+
+
+def test_read_gdf_files():
+    tmp_dir = tempfile.mkdtemp()
+    gdf_files = [os.path.join(tmp_dir, 'spikes-{}.gdf'.format(i)) for i in range(3)]
+    with open(gdf_files[0], 'w') as f:
+        f.write('1\t5.0\t\n3\t1.0\t\n')
+    with open(gdf_files[1], 'w') as f:
+        pass  # NEST writes empty files for threads without any spikes
+    with open(gdf_files[2], 'w') as f:
+        f.write('2\t5.0\t\n1\t0.5\t\n')
+
+    nest_to_gid = np.array([-1, 100, 200, 300])
+    times, gids = read_gdf_files(gdf_files, nest_to_gid)
+    assert(np.allclose(times, [0.5, 1.0, 5.0, 5.0]))
+    assert(list(gids) == [100, 300, 100, 200])
+    assert(not any(os.path.exists(gdf_file) for gdf_file in gdf_files))
+
+    gdf_file = os.path.join(tmp_dir, 'empty.gdf')
+    open(gdf_file, 'w').close()
+    times, gids = read_gdf_files([gdf_file], nest_to_gid)
+    assert(len(times) == 0 and len(gids) == 0)
+    os.rmdir(tmp_dir)
+
+
+def test_merge_sorted_spikes():
+    spikes = [(np.array([1.0, 3.0, 5.0]), np.array([0, 0, 0])),
+              (np.array([0.5, 3.0, 6.0]), np.array([1, 1, 1])),
+              (np.array([3.0, 4.0]), np.array([2, 2]))]
+    times, gids = merge_sorted_spikes(spikes)
+    assert(np.allclose(times, [0.5, 1.0, 3.0, 3.0, 3.0, 4.0, 5.0, 6.0]))
+    # spikes with the same time keep the order of the lists they came from
+    assert(list(gids) == [1, 0, 0, 1, 2, 2, 0, 1])
+
+
+def test_merge_sorted_spikes_empty():
+    empty = (np.zeros(0), np.zeros(0, dtype=np.int64))
+    times, gids = merge_sorted_spikes([empty, empty])
+    assert(len(times) == 0 and len(gids) == 0)
+
+    times, gids = merge_sorted_spikes([])
+    assert(len(times) == 0 and len(gids) == 0)
+
+    times, gids = merge_sorted_spikes([empty, (np.array([2.0, 1.0e3]), np.array([4, 5])), empty])
+    assert(np.allclose(times, [2.0, 1.0e3]))
+    assert(list(gids) == [4, 5])
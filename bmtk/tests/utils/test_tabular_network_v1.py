@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+from bmtk.builder.networks import DenseNetwork
+from bmtk.utils.io.tabular_network_v1 import TabularNetwork
+
+
+@pytest.fixture
+def network_files():
+    output_dir = tempfile.mkdtemp()
+    net = DenseNetwork('NET1')
+    net.add_nodes(N=10, positions=np.random.uniform(0.0, 1.0, size=(10, 3)), ei='e', model_type='biophysical')
+    net.add_nodes(N=5, ei='i', model_type='intfire')
+    cm = net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, connection_rule=lambda s, t: 2, syn_type='e2e')
+    cm.add_properties('syn_weight', rule=lambda s, t: float(s.node_id*100 + t.node_id), dtypes=np.float)
+    net.add_edges(source={'ei': 'i'}, target=net.nodes(), connection_rule=lambda s, t: s.node_id % 2, syn_type='i2x')
+    net.build()
+    net.save_nodes('nodes.h5', 'node_types.csv', output_dir=output_dir)
+    net.save_edges('edges.h5', 'edge_types.csv', output_dir=output_dir)
+    yield {name: os.path.join(output_dir, name) for name in ['nodes.h5', 'node_types.csv', 'edges.h5',
+                                                              'edge_types.csv']}
+    shutil.rmtree(output_dir)
+
+
+def test_read_nodes(network_files):
+    nodes = TabularNetwork.load_nodes(network_files['nodes.h5'], network_files['node_types.csv'])
+    nodes_df = nodes.read_nodes()
+    assert(len(nodes_df) == 15)
+    for gid in nodes.gids:
+        node = nodes.get_node(gid)
+        assert(nodes_df.loc[gid, 'node_type_id'] == node['node_type_id'])
+        if 'positions' in node.node_props:
+            assert(np.allclose(nodes_df.loc[gid, 'positions'], node['positions']))
+
+    assert(len(nodes.read_nodes([1, 12])) == 2)
+
+
+def test_read_target_range(network_files):
+    edges = TabularNetwork.load_edges(network_files['edges.h5'], network_files['edge_types.csv'])
+    edges_df = edges.read_target_range(0, 15)
+    assert(len(edges_df) == len(edges))
+
+    row_edges = [e for trg_gid in range(15) for e in edges.edges_itr(trg_gid)]
+    assert(list(edges_df['target_gid']) == [e.target_gid for e in row_edges])
+    assert(list(edges_df['source_gid']) == [e.source_gid for e in row_edges])
+    for (_, row), e in zip(edges_df.iterrows(), row_edges):
+        if 'syn_weight' in e:
+            assert(row['syn_weight'] == e['syn_weight'] == e.source_gid*100 + e.target_gid)
+        else:
+            assert(row['nsyns'] == e['nsyns'])
+
+    subset_df = edges.read_target_range(3, 5)
+    assert(set(subset_df['target_gid']) == {3, 4})
+    assert(len(subset_df) == len([e for e in row_edges if 3 <= e.target_gid < 5]))
+    assert(len(edges.read_target_range(20, 30)) == 0)
+
+
+def test_node_iterator(network_files):
+    nodes = TabularNetwork.load_nodes(network_files['nodes.h5'], network_files['node_types.csv'])
+    node_rows = list(nodes)
+    assert([n.gid for n in node_rows] == nodes.gids)
+    for n in node_rows:
+        node = nodes.get_node(n.gid)
+        assert(n['model_type'] == node['model_type'])
+        assert(n.node_props.keys() == node.node_props.keys())
+
+
+def test_types_join(network_files):
+    nodes = TabularNetwork.load_nodes(network_files['nodes.h5'], network_files['node_types.csv'])
+    nodes_df = nodes.read_nodes(with_types=True)
+    for gid, row in nodes_df.iterrows():
+        assert(row['model_type'] == nodes.get_node(gid)['model_type'])
+        assert(row['ei'] == nodes.get_node(gid)['ei'])
+
+    edges = TabularNetwork.load_edges(network_files['edges.h5'], network_files['edge_types.csv'])
+    edges_df = edges.read_target_range(0, 15, with_types=True)
+    assert(set(edges_df[edges_df['source_gid'] >= 10]['syn_type']) == {'i2x'})
+    assert(set(edges_df[edges_df['source_gid'] < 10]['syn_type']) == {'e2e'})
+    with pytest.raises(Exception):
+        nodes.node_types_table.join([-1])
+
+
+def test_source_gids(network_files):
+    edges = TabularNetwork.load_edges(network_files['edges.h5'], network_files['edge_types.csv'])
+    for trg_gids in [[0], [3, 12], [14, 1, 2], range(15), [100]]:
+        expected = sorted(set(e.source_gid for trg_gid in trg_gids if trg_gid < 15 for e in edges.edges_itr(trg_gid)))
+        assert(list(edges.source_gids(trg_gids)) == expected)
+
+
+def test_index_arrays(network_files):
+    edges = TabularNetwork.load_edges(network_files['edges.h5'], network_files['edge_types.csv'])
+    trg_gids, src_gids, edge_type_ids = edges.index_arrays()
+    assert(len(trg_gids) == len(src_gids) == len(edge_type_ids) == len(edges))
+    for iloc in range(len(edges)):
+        edge = edges[iloc]
+        assert(edge.target_gid == trg_gids[iloc])
+        assert(edge.source_gid == src_gids[iloc])
+        assert(edge['edge_type_id'] == edge_type_ids[iloc])
+
+
+def test_node_iterator_chunks(network_files):
+    nodes = TabularNetwork.load_nodes(network_files['nodes.h5'], network_files['node_types.csv'])
+    nodes.iter_chunk_size = 4
+    node_rows = list(nodes)
+    assert([n.gid for n in node_rows] == nodes.gids)
+    for n in node_rows:
+        node = nodes.get_node(n.gid)
+        assert(dict(n.node_type_props) == dict(node.node_type_props))
+        assert(n['ei'] == node['ei'])
+        if 'positions' in n:
+            assert(np.allclose(n['positions'], node['positions']))
+
+
+def test_import_nodes(network_files):
+    net = DenseNetwork('NET1')
+    net.import_nodes(network_files['nodes.h5'], network_files['node_types.csv'])
+    nodes = sorted(net.nodes(), key=lambda n: n.node_id)
+    assert([n.node_id for n in nodes] == range(15))
+    assert(len(net.nodes(ei='e')) == 10)
+    assert(all(n['model_type'] == 'intfire' for n in net.nodes(ei='i')))
+    assert(all(len(n['positions']) == 3 for n in net.nodes(ei='e')))
+
+    # imported nodes can be targeted by the edges of another network
+    ext_net = DenseNetwork('EXT')
+    ext_net.add_nodes(N=4, model_type='virtual')
+    ext_net.add_edges(source=ext_net.nodes(), target=net.nodes(ei='e'), connection_rule=1)
+    ext_net.build()
+    output_dir = tempfile.mkdtemp()
+    ext_net.save_edges('edges.h5', 'edge_types.csv', output_dir=output_dir)
+    edges = TabularNetwork.load_edges(os.path.join(output_dir, 'edges.h5'), os.path.join(output_dir, 'edge_types.csv'))
+    assert(len(edges) == 40)
+    shutil.rmtree(output_dir)
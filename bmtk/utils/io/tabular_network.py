@@ -25,6 +25,8 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import collections
+import numpy as np
 import pandas as pd
 import h5py
 
@@ -211,6 +213,10 @@ class NodesFile(object):
     def get_node(self, gid, cache=False):
         raise NotImplementedError()
 
+    def read_nodes(self, gids=None):
+        """Returns the properties of all (or the given) nodes as a DataFrame indexed by gid."""
+        raise NotImplementedError()
+
     def __len__(self):
         raise NotImplementedError()
 
@@ -253,6 +259,23 @@ class EdgesFile(object):
     def edges_itr(self, target_gid):
         raise NotImplementedError()
 
+    def read_target_range(self, gid_start, gid_end):
+        """Returns the properties of all edges with a target gid in [gid_start, gid_end) as a DataFrame."""
+        raise NotImplementedError()
+
+    def source_gids(self, target_gids):
+        """Returns the unique source gids of all the edges that target any of the given gids."""
+        raise NotImplementedError()
+
+    def target_counts(self):
+        """Returns an array with the number of edges of every target gid, indexed by gid."""
+        raise NotImplementedError()
+
+    def index_arrays(self):
+        """Returns the target_gid, source_gid and edge_type_id of every edge as three arrays, in the row order used by
+        edges[iloc]."""
+        raise NotImplementedError()
+
     def __len__(self):
         raise NotImplementedError()
 
@@ -332,17 +355,66 @@ class TypesTable(dict):
         super(TypesTable, self).__init__()
 
         types_df = pd.read_csv(types_file, sep=seperator, comment=comment)
+        types_df = types_df.drop_duplicates(index_column, keep='last')
         self._columns = ColumnProperty.from_csv(types_df)
-        for _, row in types_df.iterrows():
-            # TODO: iterrows does not preserve dtype and should be replaced with itertuples
-            type_id = row[index_column]
-            row = {col.name: row[col.name] for col in self._columns}
-            self.update({type_id: row})
+        self._types_df = types_df.set_index(index_column, drop=False)
+
+        # unlike iterrows, to_dict preserves the dtype of each column
+        self.update(zip(types_df[index_column].values, types_df.to_dict('records')))
+
+        # the columns of the table as lists, shared by all the rows returned by join_rows()
+        self._type_columns = {name: self._types_df[name].tolist() for name in self._types_df.columns}
 
     @property
     def columns(self):
         return self._columns
 
+    @property
+    def types_df(self):
+        """DataFrame of the types table indexed by the type id."""
+        return self._types_df
+
+    def join(self, type_ids):
+        """Broadcasts the types properties onto an array of type ids.
+
+        :param type_ids: array of type ids, eg. the node_type_id column of a nodes file.
+        :return: DataFrame with the properties of each type id, one row for each element of type_ids.
+        """
+        return self._types_df.iloc[self.join_indices(type_ids)].reset_index(drop=True)
+
+    def join_indices(self, type_ids):
+        """Returns the row of the types table of every element of type_ids."""
+        type_ids = np.asarray(type_ids)
+        type_indices = self._types_df.index.get_indexer(type_ids)
+        if np.any(type_indices < 0):
+            raise Exception('Could not find type ids {} in types table.'.format(
+                list(np.unique(type_ids[type_indices < 0]))))
+        return type_indices
+
+    def join_rows(self, type_ids):
+        """Like join() but returns a read-only ColumnsRow for each element of type_ids, pointing into the columns of the
+        types table rather than copying the properties."""
+        return [ColumnsRow(self._type_columns, i) for i in self.join_indices(type_ids).tolist()]
+
+
+class ColumnsRow(collections.Mapping):
+    """Read-only dictionary view of a single row of a set of columns (a dictionary of equal length arrays)."""
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._columns[key][self._row]
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
 
 def build_row_repr(row):
     columns = row.columns
@@ -25,6 +25,7 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import numpy as np
 import pandas as pd
 import h5py
 
@@ -70,6 +71,8 @@ class NodeRow(tn.NodeRow):
 
 
 class NodesFile(tn.NodesFile):
+    iter_chunk_size = 2**14  # number of nodes read at a time when iterating over the file
+
     def __init__(self):
         super(NodesFile, self).__init__()
 
@@ -92,12 +95,12 @@ class NodesFile(tn.NodesFile):
         self._version = 'v0.1'  # TODO: get the version number from the attributes
 
         # Create Indices
-        self._nodes_index['node_gid'] = pd.Series(nodes_group['node_gid'], dtype=nodes_group['node_gid'].dtype)
-        self._nodes_index['node_type_id'] = pd.Series(nodes_group['node_type_id'],
+        self._nodes_index['node_gid'] = pd.Series(nodes_group['node_gid'][()], dtype=nodes_group['node_gid'].dtype)
+        self._nodes_index['node_type_id'] = pd.Series(nodes_group['node_type_id'][()],
                                                       dtype=nodes_group['node_type_id'].dtype)
-        self._nodes_index['node_group'] = pd.Series(nodes_group['node_group'],
+        self._nodes_index['node_group'] = pd.Series(nodes_group['node_group'][()],
                                                     dtype=nodes_group['node_group'].dtype)
-        self._nodes_index['node_group_index'] = pd.Series(nodes_group['node_group_index'],
+        self._nodes_index['node_group_index'] = pd.Series(nodes_group['node_group_index'][()],
                                                           dtype=nodes_group['node_group_index'].dtype)
         self._nodes_index.set_index(['node_gid'], inplace=True)
         self._nrows = len(self._nodes_index)
@@ -115,20 +118,64 @@ class NodesFile(tn.NodesFile):
         ng_idx = node_metadata['node_group_index']
 
         group_props = self._group_table[str(ng)][ng_idx]
-        types_props = self._node_types_table[node_metadata['node_type_id']]
+        types_props = self._node_types_table.join_rows([node_metadata['node_type_id']])[0]
 
         return NodeRow(gid, self._group_table[str(ng)], group_props, types_props)
 
+    def read_nodes(self, gids=None, with_types=False):
+        """Reads the properties of all (or the given) nodes in bulk.
+
+        :param gids: list of node gids, or None for all the nodes in the file.
+        :param with_types: include the node-type properties, joined onto each node by node_type_id.
+        :return: DataFrame indexed by node_gid with the node_type_id, node_group and node_group_index columns plus
+            the properties stored in the node groups.
+        """
+        nodes_df = self._nodes_index if gids is None else self._nodes_index.loc[gids]
+        node_groups = nodes_df['node_group'].values
+        group_indices = nodes_df['node_group_index'].values
+        group_dfs = []
+        for grp_id in np.unique(node_groups):
+            rows = np.nonzero(node_groups == grp_id)[0]
+            group_props = self._group_table[str(grp_id)].read(group_indices[rows])
+            group_dfs.append(columns_to_dataframe(group_props, index=nodes_df.index[rows]))
+
+        if group_dfs:
+            nodes_df = nodes_df.join(pd.concat(group_dfs) if len(group_dfs) > 1 else group_dfs[0])
+        if with_types:
+            nodes_df = join_types(nodes_df, self._node_types_table, 'node_type_id')
+        return nodes_df.copy() if nodes_df is self._nodes_index else nodes_df
+
     def __len__(self):
         return self._nrows
 
+    def __iter__(self):
+        self._iter_index = 0
+        self._iter_chunk = []
+        return self
+
     def next(self):
         if self._iter_index >= len(self):
             raise StopIteration
-        else:
-            gid = self._nodes_index.index.get_loc(self._iter_index)
-            self._iter_index += 1
-            return self.get_node(gid)
+
+        if not self._iter_chunk:
+            # Read the group properties and node-types of a chunk of nodes at once rather than one node at a time
+            chunk_end = min(self._iter_index + self.iter_chunk_size, len(self))
+            self._iter_chunk = self._read_rows(self._iter_index, chunk_end)
+            self._iter_chunk.reverse()
+
+        self._iter_index += 1
+        return self._iter_chunk.pop()
+
+    def _read_rows(self, begin, end):
+        """Returns a NodeRow for each of the nodes [begin, end) of the file, with properties read from the columns of
+        the node groups and node-types table."""
+        nodes_df = self._nodes_index.iloc[begin:end]
+        groups = nodes_df['node_group'].values
+        grp_columns, grp_positions = group_columns(self._group_table, groups, nodes_df['node_group_index'].values)
+        types_rows = self._node_types_table.join_rows(nodes_df['node_type_id'].values)
+        return [NodeRow(gid, self._group_table[str(ng)], tn.ColumnsRow(grp_columns[ng], pos), types_props)
+                for gid, ng, pos, types_props in zip(nodes_df.index, groups.tolist(), grp_positions.tolist(),
+                                                     types_rows)]
 
 
 class EdgeRow(tn.EdgeRow):
@@ -146,6 +193,8 @@ class EdgeRow(tn.EdgeRow):
 
 
 class EdgesFile(tn.EdgesFile):
+    index_columns = ['target_gid', 'source_gid', 'edge_type_id', 'edge_group', 'edge_group_index']
+
     def __init__(self):
         super(EdgesFile, self).__init__()
         self._nedges = 0
@@ -181,7 +230,7 @@ class EdgesFile(tn.EdgesFile):
         edges_group = edges_hf['edges']
 
         # Preload the target index pointers into memory
-        self._target_index = pd.Series(edges_group['index_pointer'], dtype=edges_group['index_pointer'].dtype)
+        self._target_index = edges_group['index_pointer'][()].astype(np.int64)
         self._target_index_len = len(self._target_index)
 
         # For the other index tables we only load in a file pointer
@@ -213,10 +262,85 @@ class EdgesFile(tn.EdgesFile):
         if target_gid+1 >= self._target_index_len:
             raise StopIteration()
 
-        index_begin = self._target_index.iloc[target_gid]
-        index_end = self._target_index.iloc[target_gid+1]
-        for iloc in xrange(index_begin, index_end):
-            yield self[iloc]
+        index_begin = self._target_index[target_gid]
+        index_end = self._target_index[target_gid+1]
+        trg_gids, src_gids, et_ids, syn_groups, syn_indices = self._read_index(index_begin, index_end)
+        grp_columns, grp_positions = group_columns(self._group_table, syn_groups, syn_indices)
+        types_rows = self._edge_types_table.join_rows(et_ids)
+        for i in xrange(index_end - index_begin):
+            yield EdgeRow(trg_gids[i], src_gids[i], syn_groups[i],
+                          tn.ColumnsRow(grp_columns[syn_groups[i]], grp_positions[i]), types_rows[i])
+
+    def read_target_range(self, gid_start, gid_end, with_types=False):
+        """Reads all the edges with a target gid in [gid_start, gid_end) in bulk.
+
+        Since edges are sorted by target the rows are read using one contiguous slice of every dataset.
+
+        :param with_types: include the edge-type properties, joined onto each edge by edge_type_id.
+        :return: DataFrame with target_gid, source_gid, edge_type_id, edge_group and edge_group_index columns plus
+            the properties stored in the edge groups.
+        """
+        gid_start = max(gid_start, 0)
+        gid_end = min(gid_end, self._target_index_len - 1)
+        if gid_end <= gid_start:
+            return self.read_range(0, 0, with_types)
+
+        return self.read_range(self._target_index[gid_start], self._target_index[gid_end], with_types)
+
+    def read_range(self, index_begin, index_end, with_types=False):
+        """Reads the rows [index_begin, index_end) of the edges file into a DataFrame, see read_target_range()."""
+        index_columns = self._read_index(index_begin, index_end)
+        edges_df = pd.DataFrame({name: vals for name, vals in zip(self.index_columns, index_columns)},
+                                columns=self.index_columns)
+        edge_groups = index_columns[3]
+        group_indices = index_columns[4]
+        group_dfs = []
+        for grp_id in np.unique(edge_groups):
+            rows = np.nonzero(edge_groups == grp_id)[0]
+            group_props = self._group_table[str(grp_id)].read(group_indices[rows])
+            group_dfs.append(columns_to_dataframe(group_props, index=rows))
+
+        if group_dfs:
+            edges_df = edges_df.join(pd.concat(group_dfs) if len(group_dfs) > 1 else group_dfs[0])
+        if with_types:
+            edges_df = join_types(edges_df, self._edge_types_table, 'edge_type_id')
+        return edges_df
+
+    def _read_index(self, index_begin, index_end):
+        """Returns the target_gid, source_gid, edge_type_id, edge_group and edge_group_index arrays for the rows
+        [index_begin, index_end) of the edges file.
+        """
+        return [ds[index_begin:index_end] for ds in [self._target_gid_ds, self._source_gid_ds, self._edge_type_ds,
+                                                     self._edge_group_ds, self._edge_group_index_ds]]
+
+    def source_gids(self, target_gids):
+        """Returns the unique source gids of all the edges that target any of the given gids, the source_gid dataset is
+        read once rather than iterating over every edge.
+        """
+        target_gids = np.asarray(target_gids, dtype=np.int64)
+        target_gids = target_gids[(target_gids >= 0) & (target_gids + 1 < self._target_index_len)]
+        if len(target_gids) == 0:
+            return np.zeros(0, dtype=self._source_gid_ds.dtype)
+
+        # rows of all the edges, using the index pointers of each target
+        row_begins = self._target_index[target_gids]
+        row_counts = self._target_index[target_gids + 1] - row_begins
+        n_rows = int(np.sum(row_counts))
+        if n_rows == 0:
+            return np.zeros(0, dtype=self._source_gid_ds.dtype)
+        row_offsets = np.cumsum(row_counts) - row_counts
+        rows = np.repeat(row_begins, row_counts) + np.arange(n_rows) - np.repeat(row_offsets, row_counts)
+
+        begin, end = rows.min(), rows.max() + 1
+        return np.unique(self._source_gid_ds[begin:end][rows - begin])
+
+    def target_counts(self):
+        """Returns an array with the number of edges of every target gid, indexed by gid."""
+        return np.diff(self._target_index)
+
+    def index_arrays(self):
+        """Returns the target_gid, source_gid and edge_type_id of every edge, each dataset read in a single call."""
+        return self._target_gid_ds[()], self._source_gid_ds[()], self._edge_type_ds[()]
 
     def __len__(self):
         return self._nedges
@@ -226,7 +350,7 @@ class EdgesFile(tn.EdgesFile):
         src_gid = self._source_gid_ds[iloc]
 
         et_id = self._edge_type_ds[iloc]
-        et_props = self._edge_types_table[et_id]
+        et_props = self._edge_types_table.join_rows([et_id])[0]
 
         syn_group = self._edge_group_ds[iloc]
         syn_index = self._edge_group_index_ds[iloc]
@@ -257,5 +381,44 @@ class Group(object):
             group_props[cprop.name] = h5_obj[indx]
         return group_props
 
+    def read(self, indices):
+        """Returns the properties for the given rows of the group as a dictionary of numpy arrays. Each dataset is
+        read using a single slice spanning the rows.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        begin = indices.min() if len(indices) else 0
+        end = indices.max() + 1 if len(indices) else 0
+        return {cprop.name: h5_obj[begin:end][indices - begin] for cprop, h5_obj in self._group_table}
+
     def __repr__(self):
         return "Group('group id': {}, 'properties':{})".format(self._group_id, self._all_columns)
+
+
+def columns_to_dataframe(columns, index=None):
+    """Converts a dictionary of numpy arrays into a DataFrame, rows of multi-dimensional arrays are stored as lists."""
+    return pd.DataFrame({name: vals if vals.ndim == 1 else list(vals) for name, vals in columns.items()}, index=index)
+
+
+def group_columns(group_table, groups, group_indices):
+    """Reads the group properties of many rows in bulk.
+
+    :return: a dictionary with the columns read from each group, and the position of every row in the columns of its
+        group.
+    """
+    columns = {}
+    positions = np.zeros(len(groups), dtype=np.int64)
+    for grp_id in np.unique(groups):
+        rows = np.nonzero(groups == grp_id)[0]
+        columns[grp_id] = group_table[str(grp_id)].read(group_indices[rows])
+        positions[rows] = np.arange(len(rows))
+    return columns, positions
+
+
+def join_types(df, types_table, type_column):
+    """Adds the types properties to each row of a DataFrame. Columns already in the DataFrame take precedence over the
+    types properties.
+    """
+    types_df = types_table.join(df[type_column].values)
+    types_df = types_df[[c for c in types_df.columns if c not in df.columns]]
+    types_df.index = df.index
+    return df.join(types_df)